@@ -0,0 +1,117 @@
+"""
+Time and peak memory of each converter for synthetic styles of growing
+size, so that the way they scale shows up as a curve.
+"""
+from bridgestyle import synthetic
+from bridgestyle import sld, mapboxgl, mapserver
+from bridgestyle.arcgis import togeostyler
+from bridgestyle.conversioncontext import conversionContext
+
+SIZES = [10, 100, 1000, 10000, 100000]
+
+
+class _ConverterSuite:
+    params = SIZES
+    param_names = ["rules"]
+    timeout = 1800
+
+    def setup(self, nrules):
+        self.style = synthetic.geostylerStyle(nrules, seed=1)
+
+    def time_convert(self, nrules):
+        self.convert(self.style)
+
+    def peakmem_convert(self, nrules):
+        self.convert(self.style)
+
+
+class SldFromGeostyler(_ConverterSuite):
+    convert = staticmethod(sld.fromgeostyler.convert)
+
+
+class MapboxFromGeostyler(_ConverterSuite):
+    convert = staticmethod(mapboxgl.fromgeostyler.convert)
+
+
+class MapserverFromGeostyler(_ConverterSuite):
+    convert = staticmethod(mapserver.fromgeostyler.convert)
+
+
+class ArcgisToGeostyler(_ConverterSuite):
+    convert = staticmethod(togeostyler.convert)
+
+    def setup(self, nrules):
+        self.style = synthetic.lyrxDocument(nrules, seed=1)
+
+
+class FilterComplexity:
+    """Styles with few rules and large filters"""
+    params = [["sld", "mapbox", "mapserver"], [1, 3, 6], [2, 16, 128]]
+    param_names = ["format", "depth", "orLength"]
+
+    _converters = {
+        "sld": sld.fromgeostyler.convert,
+        "mapbox": mapboxgl.fromgeostyler.convert,
+        "mapserver": mapserver.fromgeostyler.convert,
+    }
+
+    def setup(self, fmt, depth, orLength):
+        self.style = synthetic.geostylerStyle(10, seed=1, expressionDepth=depth,
+                                              orLength=orLength)
+
+    def time_convert(self, fmt, depth, orLength):
+        self._converters[fmt](self.style)
+
+    def peakmem_convert(self, fmt, depth, orLength):
+        self._converters[fmt](self.style)
+
+
+class CategorizedStyle:
+    """Styles whose rules share their expressions, like QGIS categorized renderers"""
+    params = [["sld", "mapbox", "mapserver"], [1000, 10000]]
+    param_names = ["format", "rules"]
+
+    def setup(self, fmt, nrules):
+        self.style = synthetic.categorizedStyle(nrules, seed=1)
+
+    def time_convert(self, fmt, nrules):
+        FilterComplexity._converters[fmt](self.style)
+
+    def peakmem_convert(self, fmt, nrules):
+        FilterComplexity._converters[fmt](self.style)
+
+
+def _deepExpression(nodes):
+    # a chain of And and Or nested to the left, alternating so that no
+    # two levels can be written as one
+    exp = ["PropertyIsEqualTo", ["PropertyName", "a"], 0]
+    for i in range(1, nodes // 6):
+        op = "And" if i % 2 else "Or"
+        exp = [op, exp, ["PropertyIsEqualTo", ["PropertyName", "a"], i]]
+    return exp
+
+
+def _wideExpression(nodes):
+    return ["Or"] + [["PropertyIsLessThan", ["Add", ["PropertyName", "a"], i], i * 2]
+                     for i in range(nodes // 6)]
+
+
+class DeepExpressions:
+    """Translation of single expressions with many nodes"""
+    params = [["sld", "mapbox", "mapserver"], ["deep", "wide"], [1000, 100000]]
+    param_names = ["format", "shape", "nodes"]
+    timeout = 600
+
+    _translators = {
+        "sld": sld.fromgeostyler.convertExpression,
+        "mapbox": mapboxgl.fromgeostyler.convertExpression,
+        "mapserver": mapserver.fromgeostyler.convertExpression,
+    }
+
+    def setup(self, fmt, shape, nodes):
+        build = _deepExpression if shape == "deep" else _wideExpression
+        self.exp = build(nodes)
+
+    def time_translate(self, fmt, shape, nodes):
+        with conversionContext():
+            self._translators[fmt](self.exp)
@@ -0,0 +1,104 @@
+"""
+Every style in the test data (test/data/arcgis, test/data/qgis/* and
+sample.geostyler) through each of its conversion paths: to geostyler, if
+it is not a geostyler file already, and from geostyler into each target
+format. Paths that fail for a file are skipped.
+
+QGIS styles (.qml) are only converted if QGIS can be imported, otherwise
+only the expected .geostyler files next to them are used.
+"""
+import os
+import json
+import importlib
+
+from bridgestyle import sld, mapboxgl, mapserver
+from bridgestyle.arcgis import togeostyler as arcgisToGeostyler
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                           "bridgestyle", "test", "data")
+
+PATHS = ["togeostyler", "sld", "mapbox", "mapserver"]
+
+_FROM_GEOSTYLER = {
+    "sld": sld.fromgeostyler.convert,
+    "mapbox": mapboxgl.fromgeostyler.convert,
+    "mapserver": mapserver.fromgeostyler.convert,
+}
+
+try:
+    importlib.import_module("qgis.core")
+    _HAS_QGIS = True
+except ImportError:
+    _HAS_QGIS = False
+
+
+def corpusFiles():
+    """Returns the paths of the corpus files, relative to the data folder"""
+    extensions = [".lyrx", ".geostyler"] + ([".qml"] if _HAS_QGIS else [])
+    files = []
+    for folder, subfolders, filenames in os.walk(DATA_FOLDER):
+        subfolders.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1] in extensions:
+                path = os.path.join(folder, filename)
+                files.append(os.path.relpath(path, DATA_FOLDER).replace(os.sep, "/"))
+    return files
+
+
+def _qgisToGeostyler(filename):
+    from qgis.core import QgsVectorLayer, QgsRasterLayer
+    from bridgestyle import qgis
+    folder = os.path.dirname(filename)
+    for layerFile in ["testlayer.gpkg", "testlayer.tiff"]:
+        if os.path.exists(os.path.join(folder, layerFile)):
+            break
+    layerFile = os.path.join(folder, layerFile)
+    layer = QgsRasterLayer(layerFile, "testlayer", "gdal")
+    if not layer.isValid():
+        layer = QgsVectorLayer(layerFile, "testlayer", "ogr")
+    layer.loadNamedStyle(filename)
+    return lambda: qgis.togeostyler.convert(layer)
+
+
+def _toGeostyler(filename):
+    # returns a function that converts the file to geostyler, or None if it
+    # is already a geostyler file
+    ext = os.path.splitext(filename)[1]
+    if ext == ".qml":
+        return _qgisToGeostyler(filename)
+    with open(filename) as f:
+        obj = json.load(f)
+    if ext == ".lyrx":
+        return lambda: arcgisToGeostyler.convert(obj)
+    return None
+
+
+class CorpusSuite:
+    params = [corpusFiles(), PATHS]
+    param_names = ["file", "path"]
+
+    def setup(self, name, path):
+        filename = os.path.join(DATA_FOLDER, name)
+        toGeostyler = _toGeostyler(filename)
+        if path == "togeostyler":
+            if toGeostyler is None:
+                raise NotImplementedError("Already a geostyler file")
+            self.function = toGeostyler
+        else:
+            if toGeostyler is None:
+                with open(filename) as f:
+                    geostyler = json.load(f)
+            else:
+                geostyler = toGeostyler()[0]
+            convert = _FROM_GEOSTYLER[path]
+            self.function = lambda: convert(geostyler)
+        try:
+            self.function()
+        except Exception as e:
+            raise NotImplementedError("Conversion fails: %r" % e)
+
+    def time_convert(self, name, path):
+        self.function()
+
+    def peakmem_convert(self, name, path):
+        self.function()
@@ -0,0 +1,30 @@
+"""
+Finding the rule of each feature of a million features with the NumPy
+evaluator, for categorized styles and styles with random filters.
+"""
+from bridgestyle import synthetic
+from bridgestyle.geostyler import evaluator
+
+NFEATURES = 1000000
+
+
+class RuleIndex:
+    params = [["categorized", "filters"], [10, 100]]
+    param_names = ["style", "rules"]
+    timeout = 600
+
+    def setup(self, kind, nrules):
+        if evaluator.numpy is None:
+            raise NotImplementedError("NumPy is not installed")
+        if kind == "categorized":
+            style = synthetic.categorizedStyle(nrules, seed=1)
+        else:
+            style = synthetic.geostylerStyle(nrules, seed=1)
+        self.rules = evaluator.RuleEvaluator(style)
+        self.columns = synthetic.attributeColumns(NFEATURES, seed=1, nvalues=nrules)
+
+    def time_rule_index(self, kind, nrules):
+        self.rules.ruleIndex(self.columns)
+
+    def time_matches(self, kind, nrules):
+        self.rules.matches(self.columns)
@@ -0,0 +1,38 @@
+"""
+Converting a style into SLD, Mapbox GL and MapServer, one format after the
+other or in a single pass.
+"""
+from bridgestyle import fanout
+from bridgestyle import sld, mapboxgl, mapserver
+
+
+def _style(nrules):
+    rules = []
+    for i in range(nrules):
+        rules.append({
+            "name": "rule%i" % i,
+            "filter": ["And",
+                       ["PropertyIsEqualTo", ["PropertyName", "class"], i],
+                       ["PropertyIsLessThan", ["PropertyName", "width"], i * 2]],
+            "scaleDenominator": {"min": 1000, "max": 100000 + i},
+            "symbolizers": [
+                {"kind": "Line", "color": "#ff0000", "width": 2, "opacity": 1.0, "Z": 1},
+                {"kind": "Fill", "color": "#00ff00", "opacity": 0.5, "Z": 0},
+            ],
+        })
+    return {"name": "fanout", "rules": rules}
+
+
+class FanoutSuite:
+    params = [10, 1000]
+    param_names = ["rules"]
+
+    def setup(self, nrules):
+        self.style = _style(nrules)
+
+    def time_separate(self, nrules):
+        for module in [sld.fromgeostyler, mapboxgl.fromgeostyler, mapserver.fromgeostyler]:
+            module.convert(self.style)
+
+    def time_fanout(self, nrules):
+        fanout.convert(self.style)
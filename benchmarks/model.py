@@ -0,0 +1,33 @@
+"""
+Reading a geostyler style into the compact model (geostyler.model), which
+interns values while the JSON is parsed, compared with parsing it with
+json.loads and building the model from the parsed dicts and lists in a
+second pass (styleFromDict), and with json.loads alone.
+"""
+import json
+
+from bridgestyle import synthetic
+from bridgestyle.geostyler import model
+
+
+class ModelSuite:
+    params = [100, 2000]
+    param_names = ["rules"]
+
+    def setup(self, nrules):
+        self.text = json.dumps(synthetic.geostylerStyle(nrules, seed=1))
+
+    def time_loads(self, nrules):
+        model.loads(self.text)
+
+    def time_json_loads_and_model(self, nrules):
+        model.styleFromDict(json.loads(self.text))
+
+    def time_json_loads(self, nrules):
+        json.loads(self.text)
+
+    def peakmem_loads(self, nrules):
+        model.loads(self.text)
+
+    def peakmem_json_loads(self, nrules):
+        json.loads(self.text)
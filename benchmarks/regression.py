@@ -0,0 +1,137 @@
+"""
+Compares benchmark results with a saved baseline, to catch a converter
+getting slower or using more memory before a release.
+
+Save a baseline (by default, for the corpus benchmarks) and compare with it
+later, on the same machine:
+
+    python -m benchmarks.regression --save baseline.json
+    python -m benchmarks.regression baseline.json --tolerance 0.2
+
+The benchmarks are run several times (rounds), so that a burst of load
+on the machine only affects one of the measurements of each benchmark, and
+the median of all rounds is used. A benchmark regresses if that value (its
+time or its peak memory) is larger than in the baseline by more than the
+tolerance, a fraction of the baseline value. Benchmarks that regress are
+measured again, and only reported if they regress again. The exit code is
+1 if any benchmark regresses.
+"""
+import sys
+import json
+import argparse
+import statistics
+
+from benchmarks import run
+
+DEFAULT_PATTERN = r"^corpus\."
+DEFAULT_TOLERANCE = 0.25
+# peak memory does not depend on the load of the machine
+DEFAULT_MEMORY_TOLERANCE = 0.1
+DEFAULT_ROUNDS = 3
+
+
+def _key(result):
+    return result["name"], tuple(result["params"])
+
+
+def runRounds(pattern=None, repeat=None, rounds=DEFAULT_ROUNDS, keys=None):
+    """
+    Runs the benchmarks the given number of times, and returns a list of
+    results with the median value of each benchmark. If keys is passed, only
+    the benchmarks with those (name, params) keys are run.
+    """
+    if keys is None:
+        values = {}
+        results = []
+        for i in range(rounds):
+            for result in run.run(pattern, repeat):
+                key = _key(result)
+                if key not in values:
+                    values[key] = []
+                    results.append(result)
+                values[key].append(result["value"])
+    else:
+        values = {key: [] for key in keys}
+        results = {}
+        for i in range(rounds):
+            for name, kind, function, params in run.discover(pattern):
+                key = (name, tuple(params))
+                if key in values:
+                    values[key].append(run.measure(kind, function, repeat))
+                    results[key] = {"name": name, "kind": kind, "params": list(params)}
+        results = list(results.values())
+    for result in results:
+        result["value"] = statistics.median(values[_key(result)])
+    return results
+
+
+def compare(baseline, results, tolerance=DEFAULT_TOLERANCE,
+            memoryTolerance=DEFAULT_MEMORY_TOLERANCE):
+    """
+    Compares two lists of results, as returned by benchmarks.run.run.
+    Returns a list of (result, baseline value, ratio) tuples for the
+    results that regressed.
+    """
+    baselineValues = {_key(r): r["value"] for r in baseline}
+    regressions = []
+    for result in results:
+        base = baselineValues.get(_key(result))
+        if not base:
+            continue
+        ratio = result["value"] / base
+        allowed = memoryTolerance if result["kind"] == "peakmem" else tolerance
+        if ratio > 1 + allowed:
+            regressions.append((result, base, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks the benchmarks against a baseline")
+    parser.add_argument("baseline", help="Baseline file (JSON)")
+    parser.add_argument("--save", action="store_true",
+                        help="Run the benchmarks and save the results as the baseline")
+    parser.add_argument("--bench", "-b", default=DEFAULT_PATTERN,
+                        help="Only run benchmarks matching this regex (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, help="Number of repetitions of each benchmark")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS,
+                        help="Number of times the benchmarks are run (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative increase of time (default: %(default)s)")
+    parser.add_argument("--memory-tolerance", type=float, default=DEFAULT_MEMORY_TOLERANCE,
+                        help="Allowed relative increase of peak memory (default: %(default)s)")
+    args = parser.parse_args()
+
+    results = runRounds(args.bench, args.repeat, args.rounds)
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    missing = set(map(_key, baseline)) - set(map(_key, results))
+    regressions = compare(baseline, results, args.tolerance, args.memory_tolerance)
+    if regressions:
+        keys = [_key(result) for result, base, ratio in regressions]
+        print("\nMeasuring %i possible regressions again" % len(keys))
+        again = runRounds(args.bench, args.repeat, args.rounds, keys)
+        confirmed = {_key(r) for r, base, ratio in
+                     compare(baseline, again, args.tolerance, args.memory_tolerance)}
+        regressions = [r for r in regressions if _key(r[0]) in confirmed]
+    print()
+    if missing:
+        print("%i benchmarks in the baseline were not run" % len(missing))
+    if not regressions:
+        print("No regressions in %i benchmarks" % len(results))
+        return 0
+    print("%i regressions:" % len(regressions))
+    for result, base, ratio in regressions:
+        kind = result["kind"]
+        print("%-70s %s -> %s (x%.2f)" % (run.label(result["name"], result["params"]),
+                                         run.formatValue(kind, base),
+                                         run.formatValue(kind, result["value"]), ratio))
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Runs the benchmarks in this package and prints their results.
+
+Benchmarks follow the conventions used by asv (airspeed velocity), so they
+can also be run with it:
+
+- Functions or methods starting with 'time_' are timed.
+- Functions or methods starting with 'timeraw_' return a piece of code that
+  is timed running it in a new interpreter.
+- Functions or methods starting with 'peakmem_' are measured by the peak of
+  memory allocated while running them (using tracemalloc).
+- Classes can define 'params' and 'param_names' to run their benchmarks for
+  each combination of parameters, and a 'setup' method that receives the
+  parameters. If setup raises NotImplementedError, the benchmark is skipped
+  for those parameters.
+
+Usage:
+
+    python -m benchmarks.run [--bench REGEX] [--json FILE] [--repeat N] [--quick]
+"""
+import re
+import sys
+import json
+import time
+import inspect
+import argparse
+import itertools
+import importlib
+import pkgutil
+import subprocess
+import statistics
+import tracemalloc
+
+import benchmarks
+
+_PREFIXES = ("time_", "timeraw_", "peakmem_")
+# time_ benchmarks are repeated until they have run for at least this time,
+# and at least 3 times unless they take longer than _MAX_TIME
+_MIN_TIME = 0.2
+_MAX_TIME = 10
+
+
+def _paramCombinations(obj):
+    params = getattr(obj, "params", None)
+    if params is None:
+        return [()]
+    if not params or not isinstance(params[0], (list, tuple)):
+        params = [params]
+    return list(itertools.product(*params))
+
+
+def discover(pattern=None):
+    """
+    Yields (name, kind, function, params) for each benchmark in the package.
+    function is a callable that takes no arguments, already set up for the
+    given parameters.
+    """
+    regex = re.compile(pattern) if pattern else None
+    for info in pkgutil.iter_modules(benchmarks.__path__):
+        if info.name == "run" or info.name.startswith("_"):
+            continue
+        module = importlib.import_module("benchmarks." + info.name)
+        for objName, obj in inspect.getmembers(module):
+            if inspect.isfunction(obj) and objName.startswith(_PREFIXES):
+                if obj.__module__ != module.__name__:
+                    continue
+                name = "%s.%s" % (info.name, objName)
+                if regex is None or regex.search(name):
+                    yield name, objName.split("_")[0], obj, ()
+            elif (inspect.isclass(obj) and obj.__module__ == module.__name__
+                    and not objName.startswith("_")):
+                methods = [m for m in dir(obj) if m.startswith(_PREFIXES)]
+                for methodName in methods:
+                    name = "%s.%s.%s" % (info.name, objName, methodName)
+                    if regex is not None and not regex.search(name):
+                        continue
+                    for params in _paramCombinations(obj):
+                        instance = obj()
+                        yield (name, methodName.split("_")[0],
+                               _bound(instance, methodName, params), params)
+
+
+def _bound(instance, methodName, params):
+    def _run():
+        return getattr(instance, methodName)(*params)
+
+    def _setup():
+        if hasattr(instance, "setup"):
+            instance.setup(*params)
+
+    _run.setup = _setup
+    return _run
+
+
+def _setup(function):
+    if hasattr(function, "setup"):
+        function.setup()
+
+
+def measureTime(function, repeat=None):
+    _setup(function)
+    times = []
+    start = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - t0)
+        if repeat is not None:
+            if len(times) >= repeat:
+                break
+        else:
+            elapsed = time.perf_counter() - start
+            if elapsed > _MIN_TIME and (len(times) >= 3 or elapsed > _MAX_TIME):
+                break
+    return statistics.median(times)
+
+
+def measureRaw(function, repeat=None):
+    _setup(function)
+    code = function()
+    times = []
+    for i in range(repeat or 5):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def measurePeakMemory(function, repeat=None):
+    _setup(function)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak - base
+
+
+_measures = {"time": measureTime, "timeraw": measureRaw, "peakmem": measurePeakMemory}
+
+
+def measure(kind, function, repeat=None):
+    """Measures a benchmark, as returned by discover"""
+    return _measures[kind](function, repeat)
+
+
+def formatValue(kind, value):
+    if kind == "peakmem":
+        for unit in ["B", "KB", "MB"]:
+            if value < 1024:
+                return "%.1f %s" % (value, unit)
+            value /= 1024.0
+        return "%.1f GB" % value
+    for unit, factor in [("s", 1), ("ms", 1e3), ("us", 1e6)]:
+        if value * factor >= 1:
+            return "%.2f %s" % (value * factor, unit)
+    return "%.0f ns" % (value * 1e9)
+
+
+def label(name, params):
+    return name + ("(%s)" % ", ".join(str(p) for p in params) if params else "")
+
+
+def run(pattern=None, repeat=None):
+    """Runs the benchmarks and returns a list of result dicts"""
+    results = []
+    for name, kind, function, params in discover(pattern):
+        try:
+            value = measure(kind, function, repeat)
+        except NotImplementedError:
+            print("%-70s skipped" % label(name, params))
+            continue
+        result = {"name": name, "kind": kind, "params": list(params), "value": value}
+        results.append(result)
+        print("%-70s %s" % (label(name, params), formatValue(kind, value)))
+        sys.stdout.flush()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the bridgestyle benchmarks")
+    parser.add_argument("--bench", "-b", help="Only run benchmarks matching this regex")
+    parser.add_argument("--repeat", type=int, help="Number of repetitions of each benchmark")
+    parser.add_argument("--quick", action="store_true",
+                        help="Run each benchmark only once")
+    parser.add_argument("--json", help="Save results to this file")
+    args = parser.parse_args()
+    results = run(args.bench, 1 if args.quick else args.repeat)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""
+Building a scale index of a style, and finding the rules active at a scale
+with it, for rules whose scale ranges all end at a different scale.
+"""
+from bridgestyle.geostyler.scaleindex import ScaleIndex
+
+
+def _style(nrules):
+    rules = [{"name": "rule%i" % i, "scaleDenominator": {"min": 1000 + i, "max": 100000 + i},
+              "symbolizers": []} for i in range(nrules)]
+    return {"name": "scales", "rules": rules}
+
+
+class ScaleIndexSuite:
+    params = [1000, 100000]
+    param_names = ["rules"]
+
+    def setup(self, nrules):
+        self.style = _style(nrules)
+        self.index = ScaleIndex(self.style)
+
+    def time_build(self, nrules):
+        ScaleIndex(self.style)
+
+    def time_rules_at(self, nrules):
+        # outside of most ranges, so that the time does not depend on the
+        # number of rules found
+        for scale in range(10):
+            self.index.rulesAt(500 + scale)
+            self.index.rulesAt(10 ** 6 + scale)
+
+    def peakmem_build(self, nrules):
+        ScaleIndex(self.style)
@@ -0,0 +1,30 @@
+"""
+Startup cost of the library and its command-line tool. Each benchmark runs
+in a new interpreter, so imports are not shared between them.
+"""
+
+_CONVERT = """
+from bridgestyle import style2style
+style = '{"name": "s", "rules": [{"name": "r", "symbolizers": [{"kind": "Line", "color": "#000000", "width": 1, "opacity": 1.0, "Z": 0}]}]}'
+style2style.convertStyle(style, "geostyler", "%s")
+"""
+
+
+def timeraw_interpreter():
+    return "pass"
+
+
+def timeraw_import_style2style():
+    return "import bridgestyle.style2style"
+
+
+def timeraw_geostyler_to_sld():
+    return _CONVERT % "sld"
+
+
+def timeraw_geostyler_to_mapbox():
+    return _CONVERT % "mapbox"
+
+
+def timeraw_geostyler_to_geostyler():
+    return _CONVERT % "geostyler"
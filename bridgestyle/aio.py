@@ -0,0 +1,229 @@
+"""
+asyncio counterparts of the file-level conversion functions, for
+applications that cannot block their event loop.
+
+Conversions run in an executor (the default executor of the event loop,
+unless another one is passed), and files are read and written in a small
+pool of threads reserved for I/O, so a slow disk does not delay
+conversions, and the other way around:
+
+    converter = AsyncConverter(ProcessPoolExecutor(4), maxConcurrency=8)
+    warnings = await converter.convertFile("roads.geostyler", "roads.sld")
+
+Or just, with a shared converter that uses the default executor:
+
+    warnings = await aio.convert("roads.geostyler", "roads.sld")
+
+maxConcurrency limits the number of conversions that run at once (not
+counting the ones waiting for their turn). Conversions can be cancelled
+like any other task: one that has not started yet, in the executor, will
+not start, and one that is running finishes, but its result is discarded.
+Files are written to a temporary file and then renamed, so a conversion
+that fails or is cancelled never leaves a half-written file.
+
+Converting QGIS layers always runs in a thread, since layers cannot be
+sent to another process.
+"""
+import os
+import uuid
+import asyncio
+import functools
+import contextlib
+from shutil import copyfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from bridgestyle import style2style
+
+_IO_THREADS = 4
+
+
+def _readFile(filename):
+    with open(filename) as f:
+        return f.read()
+
+
+def _replaceFile(filename, write):
+    # write(tmpfile) creates the file, which is then renamed to its final name
+    tmp = "%s.%s.tmp" % (filename, uuid.uuid4().hex)
+    try:
+        write(tmp)
+        os.replace(tmp, filename)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
+
+
+def _writeFile(filename, content, encoding=None):
+    def write(tmp):
+        with open(tmp, "x", encoding=encoding) as f:
+            f.write(content)
+
+    _replaceFile(filename, write)
+
+
+def _writeFiles(files, encoding=None):
+    for filename, content in files:
+        _writeFile(filename, content, encoding)
+
+
+def _copyFiles(files, folder):
+    for filename in files:
+        dst = os.path.join(folder, os.path.basename(filename))
+        _replaceFile(dst, functools.partial(copyfile, filename))
+
+
+class AsyncConverter:
+    """
+    Runs conversions in executor (the default executor of the event loop if
+    None), with at most maxConcurrency of them running at once (no limit if
+    None). If a ConversionCache is passed, results are taken from it when
+    available. File I/O runs in ioExecutor, or in a pool of threads created
+    by the converter, which is shut down by close().
+    """
+
+    def __init__(self, executor=None, maxConcurrency=None, cache=None, ioExecutor=None):
+        self.executor = executor
+        self.maxConcurrency = maxConcurrency
+        self.cache = cache
+        self._semaphore = None if maxConcurrency is None else asyncio.Semaphore(maxConcurrency)
+        self._ioExecutor = ioExecutor
+        self._ownIoExecutor = ioExecutor is None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._ownIoExecutor and self._ioExecutor is not None:
+            self._ioExecutor.shutdown(wait=False)
+            self._ioExecutor = None
+
+    def _slot(self):
+        return self._semaphore if self._semaphore is not None else contextlib.nullcontext()
+
+    async def _run(self, executor, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(function, *args))
+
+    async def _cpu(self, function, *args):
+        return await self._run(self.executor, function, *args)
+
+    async def _thread(self, function, *args):
+        # for QGIS layers, which cannot be pickled
+        executor = None if isinstance(self.executor, ProcessPoolExecutor) else self.executor
+        return await self._run(executor, function, *args)
+
+    async def _io(self, function, *args):
+        if self._ioExecutor is None:
+            self._ioExecutor = ThreadPoolExecutor(_IO_THREADS,
+                                                  thread_name_prefix="bridgestyle-io")
+        return await self._run(self._ioExecutor, function, *args)
+
+    async def convertStyle(self, styleA, extA, extB):
+        """Async version of style2style.convertStyle"""
+        async with self._slot():
+            return await self._cpu(style2style.convertStyle, styleA, extA, extB, self.cache)
+
+    async def convertGeostyler(self, geostyler, ext):
+        """Async version of style2style.convertGeostyler"""
+        async with self._slot():
+            return await self._cpu(style2style.convertGeostyler, geostyler, ext, self.cache)
+
+    async def convertFile(self, fileA, fileB):
+        """Async version of style2style.convertFile"""
+        async with self._slot():
+            styleA = await self._io(_readFile, fileA)
+            styleB, warnings = await self._cpu(style2style.convertStyle, styleA,
+                                               style2style._extension(fileA),
+                                               style2style._extension(fileB), self.cache)
+            await self._io(_writeFile, fileB, styleB)
+        return warnings
+
+    async def convert(self, fileA, fileB):
+        """Async version of style2style.convert"""
+        try:
+            return await self.convertFile(fileA, fileB)
+        except style2style.UnsupportedFormatException as e:
+            print(e)
+
+    async def convertFileToFormats(self, fileA, base, exts):
+        """Async version of style2style.convertFileToFormats"""
+        async with self._slot():
+            styleA = await self._io(_readFile, fileA)
+            files, warnings = await self._cpu(style2style.convertStyleToFormats, styleA,
+                                              style2style._extension(fileA), base, exts,
+                                              self.cache)
+            await self._io(_writeFiles, files)
+        return warnings
+
+    async def saveLayerStyleAsSld(self, layer, filename):
+        """Async version of qgis.saveLayerStyleAsSld"""
+        from bridgestyle import qgis
+        async with self._slot():
+            sldstring, icons, warnings = await self._thread(qgis.layerStyleAsSld, layer)
+            await self._io(_writeFile, filename, sldstring, "utf-8")
+        return warnings
+
+    async def saveLayerStyleAsZippedSld(self, layer, filename):
+        """Async version of qgis.saveLayerStyleAsZippedSld"""
+        from bridgestyle import qgis
+        async with self._slot():
+            sldstring, icons, warnings = await self._thread(qgis.layerStyleAsSld, layer)
+            write = functools.partial(qgis.writeZippedSld, name=layer.name(),
+                                      sldstring=sldstring, icons=icons)
+            await self._io(_replaceFile, filename, write)
+        return warnings
+
+    async def layerStyleAsMapboxFolder(self, layer, folder):
+        """Async version of qgis.layerStyleAsMapboxFolder"""
+        from bridgestyle import qgis
+        async with self._slot():
+            mbox, icons, warnings = await self._thread(qgis.layerStyleAsMapbox, layer)
+            await self._io(_writeFile, os.path.join(folder, "style.mapbox"), mbox, "utf-8")
+        return warnings
+
+    async def layerStyleAsMapfileFolder(self, layer, folder, additional=None):
+        """Async version of qgis.layerStyleAsMapfileFolder"""
+        from bridgestyle import qgis
+        async with self._slot():
+            mapfile, symbols, icons, warnings = await self._thread(
+                qgis.layerStyleAsMapfileFiles, layer, additional)
+            files = [(os.path.join(folder, layer.name() + ".txt"), mapfile),
+                     (os.path.join(folder, layer.name() + "_symbols.txt"), symbols)]
+            await self._io(_writeFiles, files, "utf-8")
+            await self._io(_copyFiles, list(icons), folder)
+        return warnings
+
+
+_default = None
+
+
+def defaultConverter():
+    """Returns the converter used by the functions of this module"""
+    global _default
+    if _default is None:
+        _default = AsyncConverter()
+    return _default
+
+
+async def convertStyle(styleA, extA, extB):
+    return await defaultConverter().convertStyle(styleA, extA, extB)
+
+
+async def convertGeostyler(geostyler, ext):
+    return await defaultConverter().convertGeostyler(geostyler, ext)
+
+
+async def convertFile(fileA, fileB):
+    return await defaultConverter().convertFile(fileA, fileB)
+
+
+async def convert(fileA, fileB):
+    return await defaultConverter().convert(fileA, fileB)
+
+
+async def convertFileToFormats(fileA, base, exts):
+    return await defaultConverter().convertFileToFormats(fileA, base, exts)
@@ -4,16 +4,21 @@ import base64
 import uuid
 import tempfile
 
-_usedIcons = []
-_warnings = []
+from ..conversioncontext import ConversionContext, conversionContext, current
+from ..geostyler.legacy import lower
 
-def convert(arcgis):
-    global _usedIcons
-    _usedIcons = []
-    global _warnings
-    _warnings = []
-    geostyler = processLayer(arcgis["layerDefinitions"][0])
-    return geostyler, _usedIcons, _warnings
+def convert(arcgis, legacy=False):
+    """
+    Converts an ArcGIS Pro layer (a parsed lyrx document) into a geostyler
+    style. Returns the style, the list of icons it uses and the warnings.
+    If legacy is True, And, Or and In expressions are written as chains of
+    binary expressions (see geostyler.legacy).
+    """
+    with conversionContext(ConversionContext(usedIcons=[])) as context:
+        geostyler = processLayer(arcgis["layerDefinitions"][0])
+    if legacy and geostyler is not None:
+        geostyler = lower(geostyler)
+    return geostyler, context.usedIcons, context.warnings
 
 def processLayer(layer):
     #layer is a dictionary with the ArcGIS Pro Json style 
@@ -28,7 +33,7 @@ def processLayer(layer):
             for group in renderer["groups"]:
                 rules.extend(processUniqueValueGroup(renderer["fields"], group))
         else:
-            _warnings.append(
+            current().warnings.append(
                 "Unsupported renderer type: %s" % str(renderer))
             return            
         
@@ -78,10 +83,6 @@ def processSimpleRenderer(renderer):
     return rule
 
 def processUniqueValueGroup(fields, group):
-    def _and(a, b):
-        return ["And", a, b]
-    def _or(a, b):
-        return ["Or", a, b]
     def _equal(name, val):
         return ["PropertyIsEqualTo",
                     [
@@ -94,17 +95,18 @@ def processUniqueValueGroup(fields, group):
     for clazz in group["classes"]:
         rule = {"name": clazz["label"]}
         values = clazz["values"]
-        conditions = []
-        for v in values:
-            fieldValues = v["fieldValues"]
-            condition = _equal(fields[0], fieldValues[0])
-            for fieldValue, fieldName in zip(fieldValues[1:], fields[1:]):
-                condition = _and(condition, _equal(fieldName, fieldValue))
-            conditions.append(condition)
-
-        ruleFilter = conditions[0]
-        for condition in conditions[1:]:
-            ruleFilter = _or(ruleFilter, condition)
+        if len(fields) == 1 and len(values) > 1:
+            ruleFilter = (["In", ["PropertyName", fields[0]]]
+                          + [v["fieldValues"][0] for v in values])
+        else:
+            conditions = []
+            for v in values:
+                fieldValues = v["fieldValues"]
+                condition = [_equal(fieldName, fieldValue)
+                             for fieldValue, fieldName in zip(fieldValues, fields)]
+                conditions.append(condition[0] if len(condition) == 1
+                                  else ["And"] + condition)
+            ruleFilter = conditions[0] if len(conditions) == 1 else ["Or"] + conditions
 
         rule["filter"] = ruleFilter
         rule["symbolizers"] = processSymbolReference(clazz["symbol"])
@@ -241,12 +243,13 @@ def processSymbolLayer(layer):
                 data = tokens[1][len("base64,"):]
                 path = os.path.join(tempfile.gettempdir(), "bridgestyle", 
                                     str(uuid.uuid4()).replace("-", ""))
-                iconName = f"{len(_usedIcons)}.{ext}"
+                usedIcons = current().usedIcons
+                iconName = f"{len(usedIcons)}.{ext}"
                 iconFile = os.path.join(path, iconName)
                 os.makedirs(path, exist_ok=True)                
                 with open(iconFile, "wb") as f:
                     f.write(base64.decodebytes(data.encode()))
-                    _usedIcons.append(iconFile)
+                    usedIcons.append(iconFile)
                 url = iconFile
 
         rotate = layer.get("rotation", 0)
@@ -0,0 +1,109 @@
+"""
+Conversion of many style files at once, spread over a pool of worker
+processes, so the cost of starting the interpreter and importing the
+converters is paid once per worker instead of once per file.
+"""
+import os
+import glob
+import time
+from collections import namedtuple
+from multiprocessing import Pool
+
+from bridgestyle import style2style
+from bridgestyle import registry
+
+BatchResult = namedtuple("BatchResult", ["input", "output", "warnings", "error", "time"])
+
+# Number of chunks we try to give each worker. More chunks balance the load
+# better when some files are much slower than others, fewer chunks mean
+# less IPC overhead for small files.
+_CHUNKS_PER_WORKER = 4
+_MAX_CHUNKSIZE = 64
+
+
+def collectFiles(inputs):
+    """
+    Expands a list of files, folders and glob patterns into a list of
+    (file, base folder) tuples. The base folder is used to keep the
+    relative layout of the input files in the destination folder.
+    Folders are walked recursively, and only files in a format that can be
+    read are taken from them.
+    """
+    files = []
+    for source in inputs:
+        if os.path.isdir(source):
+            for root, dirs, filenames in os.walk(source):
+                dirs.sort()
+                for filename in sorted(filenames):
+                    if registry.isReadable(style2style._extension(filename)):
+                        files.append((os.path.join(root, filename), source))
+        else:
+            matches = sorted(f for f in glob.glob(source, recursive=True) if os.path.isfile(f))
+            if not matches and os.path.isfile(source):
+                matches = [source]
+            if matches:
+                base = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in matches])
+                files.extend((f, base) for f in matches)
+    return files
+
+
+def outputFile(inputFile, base, folder, ext=None):
+    """
+    Returns the destination file for an input file. If ext is None, it is
+    returned without extension.
+    """
+    relpath = os.path.relpath(os.path.abspath(inputFile), os.path.abspath(base))
+    output = os.path.join(folder, os.path.splitext(relpath)[0])
+    return output if ext is None else output + "." + ext
+
+
+def _convertJob(job):
+    fileA, fileB, cache, exts = job
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(fileB) or ".", exist_ok=True)
+        if exts is None:
+            warnings = style2style.convertFile(fileA, fileB, cache)
+        else:
+            warnings = style2style.convertFileToFormats(fileA, fileB, exts, cache)
+        error = None
+    except Exception as e:
+        warnings = []
+        error = "%s: %s" % (e.__class__.__name__, e)
+    return BatchResult(fileA, fileB, warnings, error, time.perf_counter() - start)
+
+
+def defaultChunksize(ntasks, jobs):
+    return max(1, min(_MAX_CHUNKSIZE, ntasks // (jobs * _CHUNKS_PER_WORKER)))
+
+
+def convertBatch(inputs, folder, ext, jobs=None, chunksize=None, cache=None):
+    """
+    Converts all the style files in the passed inputs (files, folders or
+    glob patterns) into the format with the given extension, writing them
+    to the destination folder. ext can also be a list of extensions, to
+    convert each file into all of them in a single pass.
+
+    This is a generator that yields a BatchResult for each file as soon as
+    it is converted, so results do not come in the same order as inputs.
+
+    If a ConversionCache is passed, workers take results from it when
+    available.
+    """
+    if isinstance(ext, str):
+        tasks = [(f, outputFile(f, base, folder, ext), cache, None)
+                 for f, base in collectFiles(inputs)]
+    else:
+        tasks = [(f, outputFile(f, base, folder), cache, list(ext))
+                 for f, base in collectFiles(inputs)]
+    if not tasks:
+        return
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(tasks)))
+    if jobs == 1:
+        for task in tasks:
+            yield _convertJob(task)
+        return
+    chunksize = chunksize or defaultChunksize(len(tasks), jobs)
+    with Pool(jobs) as pool:
+        for result in pool.imap_unordered(_convertJob, tasks, chunksize):
+            yield result
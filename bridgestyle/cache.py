@@ -0,0 +1,222 @@
+"""
+Opt-in on-disk cache for conversions from geostyler.
+
+Results are stored under a key computed from a canonical representation of
+the input geostyler, the destination format and a digest of the source of
+the library (see codeDigest), so converting the same style again is just a
+matter of reading a file, and results written by other versions of the
+converters are not used. Both the converted style and the warnings are
+stored.
+
+The size of the cache is bounded: when it grows beyond its maximum size,
+the least recently used entries are deleted. Entries are written atomically
+and eviction is done under a file lock, so the same cache folder can be
+shared by several processes.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import importlib
+
+import bridgestyle
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+# eviction scans the whole cache folder, so it is only done from time to time
+_EVICTION_INTERVAL = 64
+# after evicting, the cache is left at this fraction of its maximum size,
+# so eviction is not needed again right after the next write
+_LOW_WATERMARK = 0.9
+
+_converters = {
+    "sld": "bridgestyle.sld.fromgeostyler",
+    "mapbox": "bridgestyle.mapboxgl.fromgeostyler",
+    "mapserver": "bridgestyle.mapserver.fromgeostyler",
+}
+
+
+_codeDigest = None
+
+
+def codeDigest():
+    """
+    Returns a digest of the source files of the bridgestyle package (other
+    than the tests), which changes whenever the converters change
+    """
+    global _codeDigest
+    if _codeDigest is None:
+        root = os.path.dirname(os.path.abspath(bridgestyle.__file__))
+        h = hashlib.sha256(bridgestyle.__version__.encode("utf-8"))
+        for folder, dirs, filenames in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if d not in ("test", "__pycache__"))
+            for filename in sorted(filenames):
+                if not filename.endswith(".py"):
+                    continue
+                path = os.path.join(folder, filename)
+                h.update(os.path.relpath(path, root).replace(os.sep, "/").encode("utf-8"))
+                with open(path, "rb") as f:
+                    h.update(b"\0" + f.read() + b"\0")
+        _codeDigest = h.hexdigest()
+    return _codeDigest
+
+
+def defaultFolder():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "bridgestyle")
+
+
+def canonicalJson(obj):
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+class ConversionCache:
+    def __init__(self, folder=None, maxSize=DEFAULT_MAX_SIZE):
+        self.folder = folder or defaultFolder()
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._written = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+    def key(self, target, geostyler):
+        h = hashlib.sha256()
+        h.update(("%s\0%s\0" % (codeDigest(), target)).encode("utf-8"))
+        h.update(canonicalJson(geostyler).encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key + ".json")
+
+    def get(self, key):
+        """
+        Returns the cached result for the given key, as a tuple, or None if it
+        is not in the cache.
+        """
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                result = tuple(json.load(f))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except ValueError:
+            # should not happen, since writes are atomic, but an invalid
+            # entry is just a miss
+            self._remove(path)
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        path = self._path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        content = json.dumps(list(result)).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        except BaseException:
+            self._remove(tmp)
+            raise
+        self._writes += 1
+        self._written += len(content)
+        if (self._writes % _EVICTION_INTERVAL == 0
+                or self._written > self.maxSize * (1 - _LOW_WATERMARK)):
+            self.evict()
+
+    def convert(self, target, geostyler, convertFunction=None):
+        """
+        Converts a geostyler object to the given target format, returning the
+        same as the convert function of the corresponding fromgeostyler module,
+        and taking the result from the cache if available.
+
+        A different convert function can be passed, in which case target is
+        just used as a name for it in the cache key.
+        """
+        if convertFunction is None:
+            if target not in _converters:
+                raise ValueError("No cached converter for format '%s'" % target)
+            convertFunction = importlib.import_module(_converters[target]).convert
+        key = self.key(target, geostyler)
+        result = self.get(key)
+        if result is None:
+            result = convertFunction(geostyler)
+            self.put(key, result)
+        return result
+
+    def _entries(self):
+        entries = []
+        for sub in os.scandir(self.folder):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".json"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for mtime, size, path in self._entries())
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the size of the cache is
+        below its maximum size.
+        """
+        with _FolderLock(self.folder):
+            entries = self._entries()
+            total = sum(size for mtime, size, path in entries)
+            if total > self.maxSize:
+                entries.sort()
+                for mtime, size, path in entries:
+                    if total <= self.maxSize * _LOW_WATERMARK:
+                        break
+                    self._remove(path)
+                    total -= size
+        self._written = 0
+
+    def clear(self):
+        with _FolderLock(self.folder):
+            for mtime, size, path in self._entries():
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class _FolderLock:
+    def __init__(self, folder):
+        self.path = os.path.join(folder, ".lock")
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
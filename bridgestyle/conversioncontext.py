@@ -0,0 +1,59 @@
+"""
+State of a single conversion.
+
+While they walk a style, converters collect warnings, the symbols and icons
+used by it, and other data that is returned along with the converted style.
+That state is kept in a ConversionContext created by each call to a
+'convert' function, and made current through a context variable, so
+conversions running at the same time in different threads (or asyncio
+tasks) do not see each other's state.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from bridgestyle.geostyler.expressions import ExpressionMemo
+
+
+class ConversionContext:
+    def __init__(self, layer=None, usedIcons=None):
+        self.warnings = []
+        # translations of the expressions of the style
+        self.expressions = ExpressionMemo(self.warnings)
+        # mapserver symbols
+        self.symbols = []
+        # icons and sprites used by the style. What is stored depends on the
+        # converter, so each one can pass its own container
+        self.usedIcons = {} if usedIcons is None else usedIcons
+        self.usedSprites = {}  # sprite name -> {"image":Image, "image2x":Image}
+        # source layer, for converters that take one
+        self.layer = layer
+
+
+_current = contextvars.ContextVar("bridgestyle_conversion_context", default=None)
+
+
+@contextmanager
+def conversionContext(context=None):
+    """
+    Makes the passed context (or a new one) the current one while the
+    with block is executed, and returns it.
+    """
+    if context is None:
+        context = ConversionContext()
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+
+def current():
+    """
+    Returns the current conversion context. If a converter function is called
+    outside of a conversion, a new context is returned, so its state is just
+    discarded.
+    """
+    context = _current.get()
+    if context is None:
+        return ConversionContext()
+    return context
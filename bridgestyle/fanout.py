@@ -0,0 +1,81 @@
+"""
+Conversion of a geostyler style into several formats in a single pass.
+
+Converting a style into SLD, Mapbox GL and a MapServer mapfile one after
+the other walks its rules three times. Here the rules are walked once: each
+rule is analyzed (filter, scale range, zoom levels, Z values) and then
+passed to every target converter, each one collecting its own warnings in
+its own conversion context. The documents are assembled at the end.
+"""
+import importlib
+
+from bridgestyle.conversioncontext import ConversionContext, conversionContext
+from bridgestyle.geostyler.rules import analyzeRules
+
+TARGETS = {
+    "sld": "bridgestyle.sld.fromgeostyler",
+    "mapbox": "bridgestyle.mapboxgl.fromgeostyler",
+    "mapserver": "bridgestyle.mapserver.fromgeostyler",
+}
+
+
+def _convert(geostyler, targets, prune=False):
+    converters = [(target, importlib.import_module(TARGETS[target]), ConversionContext())
+                  for target in targets]
+    processed = {target: [] for target in targets}
+    warnings = []
+    infos = analyzeRules(geostyler, prune=prune, warnings=warnings)
+    for target, module, context in converters:
+        context.warnings.extend(warnings)
+    for info in infos:
+        for target, module, context in converters:
+            with conversionContext(context):
+                processed[target].append(module.processRuleInfo(info, geostyler))
+    results = {}
+    for target, module, context in converters:
+        with conversionContext(context):
+            results[target] = module.finish(geostyler, processed[target])
+    return results
+
+
+def convert(geostyler, targets=None, cache=None, prune=False):
+    """
+    Converts a geostyler object into all the given target formats (all the
+    supported ones, if not passed). Returns a dict keyed by target, with the
+    same that the convert function of its fromgeostyler module returns: the
+    converted style first and the list of warnings last. If prune is True,
+    the rules and symbolizers that draw nothing are left out.
+
+    If a ConversionCache is passed, targets found in it are taken from it,
+    and the rest are converted in a single pass and added to it.
+    """
+    targets = list(targets or TARGETS)
+    for target in targets:
+        if target not in TARGETS:
+            raise ValueError("Unsupported target format: '%s'" % target)
+    results = {}
+    keys = {}
+    if cache is not None:
+        for target in targets:
+            keys[target] = cache.key(target + ":pruned" if prune else target, geostyler)
+            result = cache.get(keys[target])
+            if result is not None:
+                results[target] = result
+    pending = [target for target in targets if target not in results]
+    if pending:
+        for target, result in _convert(geostyler, pending, prune).items():
+            if cache is not None:
+                cache.put(keys[target], result)
+            results[target] = result
+    return {target: results[target] for target in targets}
+
+
+def outputFiles(base, target, result):
+    """
+    Returns a list of (filename, content) tuples with the files to write for
+    the result of a target. base is the filename without extension.
+    """
+    if target == "mapserver":
+        mapfile, symbols, warnings = result
+        return [(base + ".map", mapfile), (base + "_symbols.map", symbols)]
+    return [(base + "." + target, result[0])]
@@ -1,7 +1,14 @@
 import json
 
 
-def toGeostyler(style):
+def toGeostyler(style, compact=False):
+    """
+    Reads a geostyler style. If compact is True, it is returned as a
+    geostyler.model.Style, which uses less memory for large styles.
+    """
+    if compact:
+        from bridgestyle.geostyler import model
+        return model.loads(style)
     return json.loads(style)
 
 
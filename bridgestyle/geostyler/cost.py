@@ -0,0 +1,345 @@
+"""
+Estimation of the cost of rendering each feature with a geostyler style.
+
+A style can make a map server slow because of what it asks for each
+feature, and analyze() estimates it from the style itself, as the SLD
+writer would give it to GeoServer (see sld.fromgeostyler):
+
+- A FeatureTypeStyle, which is a pass over the features, for each Z value
+  of the symbolizers (see processRulesByZ).
+- A Rule element for each symbolizer of a rule, so the filter of a rule
+  with three symbolizers is evaluated three times for each feature. Rules
+  without filter and ELSE rules are only a scale check.
+- The nodes of the filters (operators, functions, attributes and values),
+  and of the properties computed for each feature (data-driven sizes,
+  colors, labels, Geometry expressions...).
+- The labels (Text symbolizers), which are placed and checked for
+  collisions, and the graphic fills and strokes, drawn as many times as
+  they fit in each feature.
+
+Every feature evaluates all the filters of the rules active at the scale
+of the map, but draws only the rules that apply to it. The cost of drawing
+is taken as the one of the most expensive rule of each pass, as if rules
+were exclusive, like the ones of categorized styles. Costs are computed
+for each range of scales with the same active rules, and the one of the
+most expensive range is the cost of the style.
+
+The cost is a weighted sum of those counts (see WEIGHTS), in arbitrary
+units, to compare styles and to fail when a style is above a threshold:
+
+    report = analyze(geostyler)
+    report["cost"], report["scale"], report["rules"]
+
+From the command line, it ranks the styles passed, or those in the passed
+folders, and fails if any of them costs more than the threshold:
+
+    python -m bridgestyle.geostyler.cost --threshold 500 styles/
+"""
+import argparse
+import heapq
+import json
+import os
+import sys
+from bisect import bisect_left
+
+from .rules import analyzeRules
+
+# cost of each pass, rule evaluation, expression node, label and graphic
+WEIGHTS = {"pass": 10, "rule": 1, "node": 1, "label": 25, "graphic": 5}
+
+# keys of symbolizers that are not computed for each feature
+_STATIC = ("kind", "Z")
+_GRAPHICS = ("graphicFill", "graphicStroke")
+
+
+def _bound(value):
+    return value if type(value) in (int, float) else None
+
+
+def expressionNodes(exp, cache=None):
+    """
+    Returns the number of nodes of a geostyler expression: its operators,
+    functions, attributes and values
+    """
+    if not isinstance(exp, list):
+        return 1
+    cache = {} if cache is None else cache
+    key = id(exp)
+    if key in cache:
+        return cache[key][0]
+    count = 0
+    stack = [exp]
+    while stack:
+        item = stack.pop()
+        count += 1
+        if isinstance(item, list):
+            if item[:1] == ["PropertyName"]:
+                continue
+            if id(item) in cache:
+                count += cache[id(item)][0] - 1
+                continue
+            stack.extend(item[1:])
+    # the expression is kept, so its id is not reused
+    cache[key] = (count, exp)
+    return count
+
+
+def _isExpression(value):
+    # data-driven values, unlike lists of values (offsets, colour maps...)
+    return isinstance(value, list) and bool(value) and isinstance(value[0], str)
+
+
+class _SymbolizerCost:
+    # what drawing a symbolizer costs for each feature
+    __slots__ = ["properties", "nodes", "labels", "graphics"]
+
+    def __init__(self, sl, cache):
+        self.properties = self.nodes = self.labels = self.graphics = 0
+        stack = [sl]
+        while stack:
+            sl = stack.pop()
+            if not isinstance(sl, dict):
+                continue
+            if sl.get("kind") == "Text":
+                self.labels += 1
+            for key, value in sl.items():
+                if key in _STATIC:
+                    continue
+                if key in _GRAPHICS and isinstance(value, list):
+                    self.graphics += len(value)
+                    stack.extend(value)
+                elif _isExpression(value):
+                    self.properties += 1
+                    self.nodes += expressionNodes(value, cache)
+
+    def cost(self, weights):
+        return (self.nodes * weights["node"] + self.labels * weights["label"]
+                + self.graphics * weights["graphic"])
+
+
+class _RuleCost:
+    # the Rule elements of a rule, and their cost for each feature
+    def __init__(self, info, cache):
+        self.index = info.index
+        self.name = info.name
+        self.minScale = _bound(info.minScale)
+        self.maxScale = _bound(info.maxScale)
+        ruleFilter = info.filter
+        self.filterNodes = (expressionNodes(ruleFilter, cache)
+                            if isinstance(ruleFilter, list) else 0)
+        # (Z, _SymbolizerCost) for each Rule element
+        self.symbolizers = [(z, _SymbolizerCost(sl, cache)) for z, sl in info.symbolizers]
+
+    def cost(self, weights):
+        return sum(weights["rule"] + self.filterNodes * weights["node"] + sl.cost(weights)
+                   for z, sl in self.symbolizers)
+
+
+class _Band:
+    # running counts of the rules active in a range of scales
+    def __init__(self):
+        self.ruleEvaluations = 0
+        self.filterNodes = 0
+        # Z -> number of Rule elements active, and heap of (-cost, id,
+        # _SymbolizerCost) of them, with the inactive ones removed lazily
+        self.zCounts = {}
+        self.heaps = {}
+        self.inactive = set()
+
+    def add(self, rule, weights):
+        for z, sl in rule.symbolizers:
+            self.ruleEvaluations += 1
+            self.filterNodes += rule.filterNodes
+            self.zCounts[z] = self.zCounts.get(z, 0) + 1
+            heapq.heappush(self.heaps.setdefault(z, []), (-sl.cost(weights), id(sl), sl))
+            self.inactive.discard(id(sl))
+
+    def remove(self, rule):
+        for z, sl in rule.symbolizers:
+            self.ruleEvaluations -= 1
+            self.filterNodes -= rule.filterNodes
+            self.zCounts[z] -= 1
+            self.inactive.add(id(sl))
+
+    def report(self, weights):
+        passes = [z for z, count in self.zCounts.items() if count]
+        drawn = []
+        for z in passes:
+            heap = self.heaps[z]
+            while heap[0][1] in self.inactive:
+                heapq.heappop(heap)
+            drawn.append(heap[0][2])
+        counts = {
+            "passes": len(passes),
+            "ruleEvaluations": self.ruleEvaluations,
+            "filterNodes": self.filterNodes,
+            "properties": sum(sl.properties for sl in drawn),
+            "propertyNodes": sum(sl.nodes for sl in drawn),
+            "labels": sum(sl.labels for sl in drawn),
+            "graphics": sum(sl.graphics for sl in drawn),
+        }
+        cost = (counts["passes"] * weights["pass"]
+                + counts["ruleEvaluations"] * weights["rule"]
+                + counts["filterNodes"] * weights["node"]
+                + sum(sl.cost(weights) for sl in drawn))
+        return cost, counts
+
+
+def analyze(geostyler, weights=None, top=10):
+    """
+    Estimates the cost of rendering each feature with a geostyler style.
+    Returns a dict with the cost, the range of scales where it is highest
+    ("scale", with "min" and "max", None if open), the counts at that
+    range (see the module documentation), the number of rules, and the
+    most expensive rules ("expensiveRules", at most top of them, with
+    their index, name and cost).
+    """
+    weights = dict(WEIGHTS, **(weights or {}))
+    cache = {}
+    rules = [_RuleCost(info, cache) for info in analyzeRules(geostyler, warnings=[])]
+    breakpoints = sorted({b for rule in rules for b in (rule.minScale, rule.maxScale)
+                          if b is not None})
+    # band i has the scales between breakpoints i - 1 and i. Rules start and
+    # end at the band of a breakpoint
+    starts = {}
+    ends = {}
+    for rule in rules:
+        start = 0 if rule.minScale is None else bisect_left(breakpoints, rule.minScale) + 1
+        end = (len(breakpoints) + 1 if rule.maxScale is None
+               else bisect_left(breakpoints, rule.maxScale) + 1)
+        if start < end:
+            starts.setdefault(start, []).append(rule)
+            ends.setdefault(end, []).append(rule)
+    band = _Band()
+    worst = None
+    for i in range(len(breakpoints) + 1):
+        for rule in ends.get(i, []):
+            band.remove(rule)
+        for rule in starts.get(i, []):
+            band.add(rule, weights)
+        cost, counts = band.report(weights)
+        if worst is None or cost > worst[0]:
+            worst = (cost, i, counts)
+    cost, i, counts = worst
+    bounds = [None] + breakpoints + [None]
+    ranked = sorted(rules, key=lambda rule: -rule.cost(weights))[:top]
+    report = {
+        "name": geostyler.get("name"),
+        "cost": cost,
+        "scale": {"min": bounds[i], "max": bounds[i + 1]},
+        "rules": len(rules),
+    }
+    report.update(counts)
+    report["expensiveRules"] = [{"index": rule.index, "name": rule.name,
+                                 "cost": rule.cost(weights)} for rule in ranked]
+    return report
+
+
+def _styleFiles(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def analyzeFiles(paths, weights=None, top=10):
+    """
+    Analyzes the style files passed, and the ones in the passed folders, in
+    any format that can be read (by extension, see registry). Returns the
+    reports, from the most expensive style, with the file of each one in
+    "file", and a list of (file, error) tuples for the files that could not
+    be analyzed. Files in folders with unknown extensions are ignored.
+    """
+    from .. import registry
+
+    reports = []
+    errors = []
+    for path in _styleFiles(paths):
+        ext = os.path.splitext(path)[1][1:]
+        styleFormat = registry.get(ext)
+        if styleFormat is None:
+            if path in paths:
+                errors.append((path, "Unsupported style type: '%s'" % ext))
+            continue
+        try:
+            with open(path) as f:
+                geostyler = styleFormat.toGeostyler(f.read())
+            report = analyze(geostyler, weights, top)
+        except Exception as e:
+            errors.append((path, str(e)))
+            continue
+        report["file"] = path
+        reports.append(report)
+    reports.sort(key=lambda report: -report["cost"])
+    return reports, errors
+
+
+def _scaleText(scale):
+    if scale["min"] is None and scale["max"] is None:
+        return "all scales"
+    return "1:%s-1:%s" % ("0" if scale["min"] is None else "%g" % scale["min"],
+                          "inf" if scale["max"] is None else "%g" % scale["max"])
+
+
+def formatReports(reports, threshold=None):
+    """Returns the reports as a text table"""
+    columns = [("cost", "%.0f"), ("passes", "%i"), ("ruleEvaluations", "%i"),
+               ("filterNodes", "%i"), ("propertyNodes", "%i"), ("labels", "%i"),
+               ("graphics", "%i")]
+    headers = ["cost", "passes", "rules", "filter nodes", "property nodes", "labels",
+               "graphics", "style"]
+    rows = [headers]
+    for report in reports:
+        row = [fmt % report[key] for key, fmt in columns]
+        name = report.get("file") or report.get("name") or ""
+        row.append("%s (%s)%s" % (name, _scaleText(report["scale"]),
+                                  " *" if threshold is not None and report["cost"] > threshold
+                                  else ""))
+        rows.append(row)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(headers) - 1)]
+    lines = ["  ".join([cell.rjust(width) for cell, width in zip(row, widths)] + [row[-1]])
+             for row in rows]
+    for report in reports[:1]:
+        lines.append("\nMost expensive rules of %s:" % (report.get("file") or report["name"]))
+        for rule in report["expensiveRules"]:
+            lines.append("  %.0f  %s" % (rule["cost"], rule["name"] or "rule %i" % rule["index"]))
+    if threshold is not None:
+        over = sum(report["cost"] > threshold for report in reports)
+        lines.append("\n%i of %i styles cost more than %g" % (over, len(reports), threshold))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m bridgestyle.geostyler.cost",
+        description="Estimates the cost of rendering each feature with map styles, and "
+        "ranks them, from the most expensive one")
+    parser.add_argument("paths", nargs="+", metavar="path",
+                        help="Style files, or folders with style files")
+    parser.add_argument("--json", action="store_true", help="Write the reports as JSON")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="Fail if any style costs more than this")
+    parser.add_argument("--top", type=int, default=10,
+                        help="Number of expensive rules listed for each style")
+    args = parser.parse_args()
+    reports, errors = analyzeFiles(args.paths, top=args.top)
+    if args.json:
+        print(json.dumps({"styles": reports,
+                          "errors": [{"file": f, "error": e} for f, e in errors]}, indent=2))
+    else:
+        print(formatReports(reports, args.threshold))
+        for path, error in errors:
+            print("FAILED %s: %s" % (path, error))
+    if errors:
+        return 2
+    if args.threshold is not None and any(r["cost"] > args.threshold for r in reports):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
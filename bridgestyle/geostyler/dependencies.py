@@ -0,0 +1,158 @@
+"""
+Attributes used by the rules of geostyler styles.
+
+Servers send every attribute of a layer in its vector tiles and WFS
+responses, unless they are told which ones the style uses. Dependencies
+finds the names of the PropertyName expressions of the filters and the
+symbolizers of each rule (in any property, like labels, sizes and
+Geometry expressions), and combines them by rule, by scale range and for
+the whole style:
+
+    dependencies = Dependencies(geostyler)
+    dependencies.all                  # {"name", "type", "width"}
+    dependencies.rules[0]             # the attributes of the first rule
+    dependencies.between(0, 50000)    # the attributes of the rules active there
+    dependencies.processing()         # 'PROCESSING "ITEMS=name,type,width"'
+
+ELSE rules apply to the features no other rule applies to, so they use the
+attributes of the filters of the other rules active at the same scales.
+
+processing() returns the directive that makes MapServer read only those
+attributes, to add to the LAYER of a mapfile, and includeList() the list
+of attributes to keep when generating vector tiles, for all zoom levels
+or for a range of them (see byZoom).
+"""
+from .rules import zoomToScale
+from .scaleindex import ScaleIndex
+
+
+def _properties(value, cache):
+    # names of the PropertyName expressions in a value (an expression, a
+    # symbolizer, or a list of them), without recursion. Expressions shared
+    # between rules, as in geostyler.model styles, are walked once
+    key = id(value)
+    if key in cache:
+        return cache[key][0]
+    if not isinstance(value, (list, dict)):
+        return frozenset()
+    found = set()
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            item = item.values()
+        elif len(item) == 2 and item[0] == "PropertyName":
+            found.add(item[1])
+            continue
+        elif id(item) in cache:
+            found.update(cache[id(item)][0])
+            continue
+        # only lists and dicts are walked
+        stack.extend([v for v in item if isinstance(v, (list, dict))])
+    found = frozenset(found)
+    # the value is kept, so its id is not reused
+    cache[key] = (found, value)
+    return found
+
+
+def expressionProperties(exp):
+    """Returns the set of attribute names used by a geostyler expression"""
+    return set(_properties(exp, {}))
+
+
+class Dependencies:
+    """Attributes used by each rule of a geostyler style"""
+
+    def __init__(self, geostyler):
+        self.geostyler = geostyler
+        self.index = ScaleIndex(geostyler)
+        cache = {}
+        # attributes of the filter of each rule, and of the whole rule
+        self.filters = []
+        self.rules = []
+        elseRules = []
+        for i, rule in enumerate(self.index.rules):
+            ruleFilter = rule.get("filter")
+            if ruleFilter == "ELSE":
+                elseRules.append(i)
+            filterProperties = (_properties(ruleFilter, cache)
+                                if isinstance(ruleFilter, list) else frozenset())
+            properties = set(filterProperties)
+            for sl in rule.get("symbolizers") or []:
+                properties.update(_properties(sl, cache))
+            self.filters.append(filterProperties)
+            self.rules.append(properties)
+        for i in elseRules:
+            scale = self.index.rules[i].get("scaleDenominator") or {}
+            for j in self._indicesBetween(scale.get("min"), scale.get("max")):
+                self.rules[i].update(self.filters[j])
+        self.all = set().union(*self.rules)
+
+    def _indicesBetween(self, minScale, maxScale):
+        if type(minScale) not in (int, float):
+            minScale = None
+        if type(maxScale) not in (int, float):
+            maxScale = None
+        return self.index.indicesBetween(minScale, maxScale)
+
+    def at(self, scale):
+        """Returns the set of attributes used by the rules active at a scale"""
+        return set().union(*(self.rules[i] for i in self.index.indicesAt(scale)))
+
+    def between(self, minScale=None, maxScale=None):
+        """
+        Returns the set of attributes used by the rules active at some scale
+        s with minScale <= s < maxScale. A bound of None leaves the range
+        open on that side.
+        """
+        return set().union(*(self.rules[i]
+                             for i in self._indicesBetween(minScale, maxScale)))
+
+    def bands(self):
+        """
+        Returns a list of (minScale, maxScale, attributes) tuples, for each
+        range of scales with the same active rules (see ScaleIndex.split)
+        """
+        bounds = [None] + self.index.breakpoints + [None]
+        return [(bounds[i], bounds[i + 1], self.between(bounds[i], bounds[i + 1]))
+                for i in range(len(bounds) - 1)]
+
+    def byZoom(self, zooms=range(25)):
+        """
+        Returns a list of (minZoom, maxZoom, attributes) tuples, one for each
+        pair of consecutive zoom levels, with the attributes used in that
+        range (see ScaleIndex.splitByZoom)
+        """
+        zooms = sorted(set(zooms))
+        result = []
+        for minZoom, maxZoom in zip(zooms, zooms[1:]):
+            minScale = None if maxZoom >= 24 else zoomToScale(maxZoom)
+            maxScale = None if minZoom <= 0 else zoomToScale(minZoom)
+            result.append((minZoom, maxZoom, self.between(minScale, maxScale)))
+        return result
+
+    def includeList(self, minZoom=None, maxZoom=None):
+        """
+        Returns the sorted list of attributes to include in vector tiles,
+        for all zoom levels or for those between minZoom and maxZoom
+        """
+        if minZoom is None and maxZoom is None:
+            properties = self.all
+        else:
+            minScale = None if maxZoom is None or maxZoom >= 24 else zoomToScale(maxZoom)
+            maxScale = None if minZoom is None or minZoom <= 0 else zoomToScale(minZoom)
+            properties = self.between(minScale, maxScale)
+        return sorted(properties, key=str)
+
+    def processing(self, properties=None):
+        """
+        Returns the MapServer PROCESSING directive that limits the
+        attributes read to the ones used by the style (or the passed ones).
+        The names cannot have commas or double quotes.
+        """
+        properties = sorted(self.all if properties is None else properties, key=str)
+        for name in properties:
+            if "," in str(name) or '"' in str(name):
+                raise ValueError("Attribute names in MapServer ITEMS cannot have commas "
+                                 "or double quotes: '%s'" % name)
+        return 'PROCESSING "ITEMS=%s"' % ",".join(str(name) for name in properties)
@@ -0,0 +1,569 @@
+"""
+Evaluation of geostyler filters over the attributes of many features.
+
+Filters are compiled once into a list of NumPy operations, which run over
+columns of attribute values (a dict of arrays, one for each attribute, or
+a structured array), so the time to evaluate a filter depends on the
+number of its nodes, not on the number of features:
+
+    evaluator = RuleEvaluator(geostyler)
+    for batch in batches:
+        ruleIndices = evaluator.ruleIndex(batch)
+
+Expressions are simplified first (see geostyler.optimizer), and compiled
+without recursion, so deep filters can be evaluated too. Text attributes
+compared by many rules are evaluated once for each distinct value instead
+of once for each feature, and once most features have a rule, the next
+rules are only evaluated for the rest. As in GeoServer, comparing a number
+and a text compares them as numbers if the text is one, and as texts if
+not.
+
+The operators supported are the ones converted to SLD, plus In, and the
+functions converted to Mapbox GL. strSubstr takes a 1-based start and a
+length, like the QGIS substr function it is converted from, and
+PropertyIsLike the % and _ wildcards of QGIS LIKE.
+
+NumPy is needed to use this module (the numpy extra of the package).
+"""
+import re
+from functools import reduce
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .optimizer import Optimizer
+
+
+class UnsupportedExpressionException(Exception):
+    pass
+
+
+def _checkNumpy():
+    if numpy is None:
+        raise ImportError("NumPy is needed to evaluate geostyler expressions. "
+                          "Install it with: pip install bridgestyle[numpy]")
+
+
+def _coerce(a, b):
+    # values that could not be compared, as numbers if possible, or as texts
+    try:
+        return numpy.asarray(a, dtype=float), numpy.asarray(b, dtype=float)
+    except (TypeError, ValueError):
+        return numpy.asarray(a).astype(str), numpy.asarray(b).astype(str)
+
+
+def _comparison(function):
+    def compare(a, b):
+        try:
+            return function(a, b)
+        except TypeError:
+            return function(*_coerce(a, b))
+    return compare
+
+
+def _all(*args):
+    return reduce(numpy.logical_and, args)
+
+
+def _any(*args):
+    return reduce(numpy.logical_or, args)
+
+
+def _likePattern(pattern):
+    parts = []
+    for char in str(pattern):
+        if char == "%":
+            parts.append(".*")
+        elif char == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("".join(parts), re.DOTALL)
+
+
+def _factorize(values):
+    # returns the sorted distinct values of an array, and the index of each
+    # value among them. Unicode texts are grouped by a hash of their
+    # characters, which is faster than sorting them
+    if values.dtype.kind == "U" and values.ndim == 1 and values.itemsize:
+        chars = values.view(numpy.uint32).reshape(len(values), -1)
+        hashes = numpy.zeros(len(values), dtype=numpy.uint64)
+        for j in range(chars.shape[1]):
+            hashes *= numpy.uint64(1000003)
+            hashes += chars[:, j]
+        hashes, inverse = numpy.unique(hashes, return_inverse=True)
+        first = numpy.empty(len(hashes), dtype=numpy.intp)
+        first[inverse] = numpy.arange(len(values))
+        uniques = values[first]
+        # unless different texts have the same hash
+        if (uniques[inverse] == values).all():
+            order = numpy.argsort(uniques)
+            rank = numpy.empty(len(order), dtype=numpy.intp)
+            rank[order] = numpy.arange(len(order))
+            return uniques[order], rank[inverse]
+    return numpy.unique(values, return_inverse=True)
+
+
+def _mapValues(function, values, *args):
+    # applies a Python function to the distinct values of an array, or to
+    # each of them if the other arguments are arrays too
+    if any(numpy.ndim(arg) for arg in args):
+        return numpy.frompyfunc(function, len(args) + 1, 1)(values, *args)
+    if not numpy.ndim(values):
+        return function(numpy.asarray(values).item(), *args)
+    try:
+        uniques, inverse = _factorize(numpy.asarray(values))
+    except TypeError:
+        return numpy.frompyfunc(function, len(args) + 1, 1)(values, *args)
+    mapped = [function(value, *args) for value in uniques.tolist()]
+    return numpy.array(mapped)[inverse] if mapped else numpy.array(mapped, dtype=bool)
+
+
+def _like(values, pattern):
+    regex = _likePattern(pattern)
+    return _mapValues(lambda value: regex.fullmatch(str(value)) is not None, values)
+
+
+def _in(values, *options):
+    try:
+        return numpy.isin(values, options)
+    except TypeError:
+        return _mapValues(lambda value: value in options, values)
+
+
+def _ifThenElse(condition, a, b):
+    return numpy.where(numpy.asarray(condition, dtype=bool), a, b)
+
+
+def _text(value):
+    if numpy.ndim(value):
+        value = numpy.asarray(value)
+        return value if value.dtype.kind == "U" else value.astype(str)
+    return numpy.asarray(str(value))
+
+
+def _concatenate(*args):
+    return reduce(numpy.char.add, [_text(arg) for arg in args])
+
+
+def _substr(value, start, length=None):
+    start = int(start)
+    if start > 0:
+        start -= 1
+    if length is None:
+        return value[start:]
+    end = start + int(length)
+    return value[start:end if end or start >= 0 else None]
+
+
+def _replace(value, old, new, replaceAll=True):
+    return value.replace(old, new, -1 if replaceAll else 1)
+
+
+def _stringFunction(function):
+    def apply(value, *args):
+        return _mapValues(lambda v, *a: function(str(v), *a), value, *args)
+    return apply
+
+
+# functions of the operators, taking the values of their arguments
+_OPERATORS = {}
+if numpy is not None:
+    _OPERATORS = {
+        "And": _all,
+        "Or": _any,
+        "Not": numpy.logical_not,
+        "PropertyIsEqualTo": _comparison(numpy.equal),
+        "PropertyIsNotEqualTo": _comparison(numpy.not_equal),
+        "PropertyIsLessThanOrEqualTo": _comparison(numpy.less_equal),
+        "PropertyIsGreaterThanOrEqualTo": _comparison(numpy.greater_equal),
+        "PropertyIsLessThan": _comparison(numpy.less),
+        "PropertyIsGreaterThan": _comparison(numpy.greater),
+        "PropertyIsLike": _like,
+        "In": _in,
+        "Add": numpy.add,
+        "Sub": numpy.subtract,
+        "Mul": numpy.multiply,
+        "Div": numpy.true_divide,
+        "toRadians": numpy.radians,
+        "toDegrees": numpy.degrees,
+        "floor": numpy.floor,
+        "ceil": numpy.ceil,
+        "if_then_else": _ifThenElse,
+        "Concatenate": _concatenate,
+        "strSubstr": _stringFunction(_substr),
+        "strToLower": _stringFunction(str.lower),
+        "strToUpper": _stringFunction(str.upper),
+        "strReplace": _stringFunction(_replace),
+        "strCapitalize": _stringFunction(str.title),
+        "acos": numpy.arccos,
+        "asin": numpy.arcsin,
+        "atan": numpy.arctan,
+        "atan2": numpy.arctan2,
+        "sin": numpy.sin,
+        "cos": numpy.cos,
+        "tan": numpy.tan,
+        "log": numpy.log,
+        "min": lambda *args: reduce(numpy.minimum, args),
+        "max": lambda *args: reduce(numpy.maximum, args),
+    }
+
+# operators evaluated on the distinct values of a text attribute, when
+# their first argument is the attribute and the others are literals
+_VALUE_OPERATORS = ("PropertyIsEqualTo", "PropertyIsNotEqualTo",
+                    "PropertyIsLessThanOrEqualTo", "PropertyIsGreaterThanOrEqualTo",
+                    "PropertyIsLessThan", "PropertyIsGreaterThan", "PropertyIsLike", "In")
+
+# finding the distinct values of a text attribute takes about as long as
+# comparing all its values this number of times
+_DISTINCT_COST = 8
+
+
+class _Batch:
+    """
+    Columns of attribute values, with the distinct values of the text
+    columns in factorized
+    """
+
+    def __init__(self, columns, size, factorized=()):
+        self.columns = columns
+        self.size = size
+        self.factorized = factorized
+        self._arrays = {}
+        self._codes = {}
+        self._distinct = {}
+
+    def column(self, name):
+        try:
+            return self._arrays[name]
+        except KeyError:
+            pass
+        try:
+            values = self.columns[name]
+        except (KeyError, ValueError):
+            raise KeyError("Missing attribute '%s'" % name) from None
+        values = self._arrays[name] = numpy.asarray(values)
+        return values
+
+    def codes(self, name):
+        """
+        Returns the distinct values of a column, and the index of each value
+        among them, or None if the column is not factorized or they cannot
+        be sorted (like None and texts)
+        """
+        try:
+            return self._codes[name]
+        except KeyError:
+            pass
+        codes = None
+        if name in self.factorized:
+            values = self.column(name)
+            if values.dtype.kind in "UOST":
+                try:
+                    codes = _factorize(values)
+                except TypeError:
+                    pass
+        self._codes[name] = codes
+        return codes
+
+    def distinct(self, name):
+        """
+        Returns a batch with the distinct values of a column, and the index
+        of each value among them, or None if the column is not factorized
+        """
+        codes = self.codes(name)
+        if codes is None:
+            return None
+        uniques, inverse = codes
+        try:
+            batch = self._distinct[name]
+        except KeyError:
+            batch = self._distinct[name] = _Batch({name: uniques}, len(uniques))
+        return batch, inverse
+
+    def subset(self, rows):
+        """Returns a batch with the features in the passed rows"""
+        return _Subset(self, rows)
+
+
+class _Subset(_Batch):
+    """Some of the features of a batch"""
+
+    def __init__(self, batch, rows):
+        _Batch.__init__(self, None, len(rows), batch.factorized)
+        self.batch = batch
+        self.rows = rows
+        self._distinct = batch._distinct
+
+    def column(self, name):
+        try:
+            return self._arrays[name]
+        except KeyError:
+            pass
+        values = self._arrays[name] = self.batch.column(name)[self.rows]
+        return values
+
+    def codes(self, name):
+        try:
+            return self._codes[name]
+        except KeyError:
+            pass
+        codes = self.batch.codes(name)
+        if codes is not None:
+            codes = (codes[0], codes[1][self.rows])
+        self._codes[name] = codes
+        return codes
+
+
+def _load(batch, name):
+    return batch.column(name)
+
+
+def _valueOperator(batch, operation):
+    name, function, args = operation
+    codes = batch.codes(name)
+    if codes is None:
+        return function(batch.column(name), *args)
+    uniques, inverse = codes
+    return numpy.asarray(function(uniques, *args))[inverse]
+
+
+def _isLiteral(value):
+    return not isinstance(value, list)
+
+
+def _mask(value, size):
+    return numpy.broadcast_to(numpy.asarray(value, dtype=bool), (size,))
+
+
+class CompiledExpression:
+    """A geostyler expression, compiled to evaluate it over columns of attribute values"""
+
+    def __init__(self, exp):
+        _checkNumpy()
+        self.expression = exp
+        # (function, value, number of arguments) tuples, run in order on a
+        # stack of values. Functions without arguments are passed the
+        # batch and the value, and literals have no function
+        self.program = []
+        # names of the attributes used, and the number of operators
+        # evaluated on the values of each one
+        self.attributes = set()
+        self.valueOperators = {}
+        stack = [(exp, False)]
+        while stack:
+            node, ready = stack.pop()
+            if ready:
+                self.program.append((_OPERATORS[node[0]], None, len(node) - 1))
+            elif not isinstance(node, list):
+                self.program.append((None, node, 0))
+            elif not node or type(node[0]) is not str:
+                raise UnsupportedExpressionException("Unsupported expression: %r" % (node,))
+            elif node[0] == "PropertyName":
+                self.program.append((_load, node[1], 0))
+                self.attributes.add(node[1])
+            elif (node[0] in _VALUE_OPERATORS and len(node) > 2
+                    and isinstance(node[1], list) and node[1][:1] == ["PropertyName"]
+                    and all(_isLiteral(arg) for arg in node[2:])):
+                name = node[1][1]
+                self.program.append((_valueOperator,
+                                     (name, _OPERATORS[node[0]], tuple(node[2:])), 0))
+                self.attributes.add(name)
+                self.valueOperators[name] = self.valueOperators.get(name, 0) + 1
+            elif _OPERATORS.get(node[0]) is None:
+                raise UnsupportedExpressionException(
+                    "Unsupported expression function for evaluation: '%s'" % node[0])
+            else:
+                stack.append((node, True))
+                stack.extend((arg, False) for arg in reversed(node[1:]))
+
+    def run(self, batch):
+        stack = []
+        with numpy.errstate(all="ignore"):
+            for function, value, nargs in self.program:
+                if nargs:
+                    args = stack[-nargs:]
+                    del stack[-nargs:]
+                    stack.append(function(*args))
+                elif function is None:
+                    stack.append(value)
+                else:
+                    stack.append(function(batch, value))
+        return stack[0]
+
+    def evaluate(self, columns, size=None):
+        """
+        Returns the values of the expression for the features with the
+        passed columns of attribute values, as an array
+        """
+        factorized = [name for name, count in self.valueOperators.items()
+                      if count >= _DISTINCT_COST]
+        batch = _Batch(columns, _size(columns, size), factorized)
+        return numpy.broadcast_to(self.run(batch), (batch.size,))
+
+
+def _size(columns, size):
+    if size is not None:
+        return size
+    if not isinstance(columns, dict):
+        return len(columns)  # a structured array or a data frame
+    for values in columns.values():
+        return len(values)
+    raise ValueError("The number of features is needed when there are no columns")
+
+
+def compileExpression(exp):
+    """Returns a CompiledExpression for a geostyler expression"""
+    return CompiledExpression(exp)
+
+
+def _inScale(rule, scale):
+    scaleDenominator = rule.get("scaleDenominator") or {}
+    minScale, maxScale = scaleDenominator.get("min"), scaleDenominator.get("max")
+    return ((minScale is None or minScale <= scale)
+            and (maxScale is None or scale < maxScale))
+
+
+class RuleEvaluator:
+    """
+    The filters of the rules of a geostyler style, compiled to find the
+    rules that apply to each feature. Rules without filter apply to all
+    features, and ELSE rules to those that no other rule applies to.
+
+    Text attributes compared by many rules (like the one of a categorized
+    style) are factorized: the rules that only use one of them are
+    evaluated once for each distinct value.
+    """
+
+    def __init__(self, geostyler):
+        _checkNumpy()
+        self.rules = list(geostyler.get("rules", []))
+        optimizer = Optimizer()
+        # a CompiledExpression, a bool, or "ELSE" for each rule
+        self.filters = []
+        uses = {}
+        for rule in self.rules:
+            ruleFilter = rule.get("filter")
+            if ruleFilter is None:
+                ruleFilter = True
+            elif isinstance(ruleFilter, list):
+                ruleFilter = optimizer.expression(ruleFilter)
+                if isinstance(ruleFilter, list):
+                    ruleFilter = CompiledExpression(ruleFilter)
+                    for name, count in ruleFilter.valueOperators.items():
+                        uses[name] = uses.get(name, 0) + count
+            self.filters.append(ruleFilter)
+        self.factorized = {name for name, count in uses.items() if count >= _DISTINCT_COST}
+
+    def _active(self, scale):
+        # (index, filter) of the rules active at the scale
+        for i, (rule, ruleFilter) in enumerate(zip(self.rules, self.filters)):
+            if scale is None or _inScale(rule, scale):
+                yield i, ruleFilter
+
+    def _distinct(self, ruleFilter, batch):
+        # the batch of distinct values of the only attribute of a filter,
+        # and the index of each feature among them, or None
+        if len(ruleFilter.attributes) != 1:
+            return None
+        name, = ruleFilter.attributes
+        if name not in self.factorized:
+            return None
+        return batch.distinct(name)
+
+    def _batch(self, columns, size):
+        return _Batch(columns, _size(columns, size), self.factorized)
+
+    def matches(self, columns, scale=None, size=None):
+        """
+        Returns a 2D bool array with a row for each rule and a column for
+        each feature, telling which rules apply to it. If a scale is passed,
+        the rules that are not active at that scale apply to no feature.
+        """
+        batch = self._batch(columns, size)
+        result = numpy.zeros((len(self.rules), batch.size), dtype=bool)
+        elseRules = []
+        for i, ruleFilter in self._active(scale):
+            if ruleFilter == "ELSE":
+                elseRules.append(i)
+            elif not isinstance(ruleFilter, CompiledExpression):
+                result[i] = bool(ruleFilter)
+            else:
+                distinct = self._distinct(ruleFilter, batch)
+                if distinct is None:
+                    result[i] = ruleFilter.run(batch)
+                else:
+                    distinctBatch, inverse = distinct
+                    result[i] = _mask(ruleFilter.run(distinctBatch), distinctBatch.size)[inverse]
+        if elseRules:
+            unmatched = ~result.any(axis=0)
+            for i in elseRules:
+                result[i] = unmatched
+        return result
+
+    def ruleIndex(self, columns, scale=None, size=None):
+        """
+        Returns an array with the index of the first rule that applies to
+        each feature (see matches), or -1 for features no rule applies to.
+        Renderers draw all the rules that apply to a feature, which
+        matches returns.
+        """
+        batch = self._batch(columns, size)
+        # larger than any rule index, until the end
+        none = len(self.rules)
+        indices = numpy.full(batch.size, none, dtype=numpy.int64)
+        # attribute -> (first rule for each distinct value, index of each
+        # feature among them), for the rules evaluated on distinct values
+        distinctIndices = {}
+        elseRules = []
+        # once most features have a rule, the next rules are only evaluated
+        # for the rest of them, in rows of the batch
+        current, rows = batch, None
+        for i, ruleFilter in self._active(scale):
+            if ruleFilter == "ELSE":
+                elseRules.append(i)
+                continue
+            if not isinstance(ruleFilter, CompiledExpression):
+                if not ruleFilter:
+                    continue
+                mask = True
+            else:
+                distinct = self._distinct(ruleFilter, current)
+                if distinct is not None:
+                    distinctBatch = distinct[0]
+                    name, = ruleFilter.attributes
+                    if name not in distinctIndices:
+                        distinctIndices[name] = (numpy.full(distinctBatch.size, none),
+                                                 batch.distinct(name)[1])
+                    first = distinctIndices[name][0]
+                    numpy.minimum(first, i, out=first,
+                                  where=_mask(ruleFilter.run(distinctBatch), distinctBatch.size))
+                    continue
+                mask = _mask(ruleFilter.run(current), current.size)
+            # rules are evaluated in order, so features that have one keep it
+            if rows is None:
+                numpy.minimum(indices, i, out=indices, where=mask)
+                unassigned = indices == none
+            else:
+                selected = rows if mask is True else rows[mask]
+                indices[selected[indices[selected] == none]] = i
+                unassigned = indices[rows] == none
+            remaining = numpy.count_nonzero(unassigned)
+            if not remaining:
+                break
+            if remaining <= current.size // 2:
+                rows = (numpy.flatnonzero(unassigned) if rows is None
+                        else rows[unassigned])
+                current = batch.subset(rows)
+        for first, inverse in distinctIndices.values():
+            numpy.minimum(indices, first[inverse], out=indices)
+        unmatched = indices == none
+        indices[unmatched] = elseRules[0] if elseRules else -1
+        return indices
+
+    def ruleIndexBatches(self, batches, scale=None):
+        """Yields the result of ruleIndex for each batch of columns"""
+        for columns in batches:
+            yield self.ruleIndex(columns, scale)
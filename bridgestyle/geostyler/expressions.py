@@ -0,0 +1,224 @@
+"""
+Shared translation of geostyler expressions.
+
+Categorized styles repeat the same expressions, and parts of them, in
+thousands of rules: the property the categories are based on, the unit
+conversions added when reading QGIS styles, the same comparisons in
+different scale ranges. Converters translate expressions through the
+ExpressionMemo of the current conversion context, so each distinct
+expression (or subexpression) is only translated once into each format.
+Translating an expression again returns the same result, and adds the
+warnings that translating it added the first time.
+
+Expressions are identified by their node in styles read with
+geostyler.model, where equal expressions are already the same object, and
+by their repr in plain lists, which tells 1, 1.0 and True apart and is
+computed in C. Long expressions in plain lists are not kept, since they are
+rarely repeated and their keys would take too much memory, but their parts
+are. Translations are only kept from the second time an expression is
+translated, so the ones of expressions used once (most filters) do not stay
+in memory until the end of the conversion.
+
+Converters translate expressions with translateTree, which walks them with
+an explicit stack instead of recursion, so filters of any depth (like the
+chains of thousands of Or expressions written by older producers) are
+translated in linear time without reaching Python's recursion limit.
+
+Since translations are shared by all the places where an expression is
+used, converters must not modify them.
+"""
+from .model import Expression
+
+# function called with the TranslationStats of each new memo table, while
+# a profile is active (see bridgestyle.profiling)
+_statsObserver = None
+
+# longest repr of a plain list for which translations are kept
+MAX_KEY_LENGTH = 256
+
+
+def _reprKeys(exp, keys):
+    # adds to keys the repr of exp and each list in it (by id), or None for
+    # those longer than MAX_KEY_LENGTH. Unlike repr, it does not recurse
+    stack = [(exp, False)]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            parts = []
+            length = 0
+            for item in node:
+                part = keys[id(item)] if isinstance(item, list) else repr(item)
+                if part is None:
+                    break
+                length += len(part) + 2
+                if length > MAX_KEY_LENGTH:
+                    break
+                parts.append(part)
+            else:
+                keys[id(node)] = "[" + ", ".join(parts) + "]"
+                continue
+            keys[id(node)] = None
+        elif id(node) not in keys:
+            stack.append((node, True))
+            stack.extend((item, False) for item in node if isinstance(item, list))
+    return keys
+
+
+class TranslationStats:
+    """Number of expressions translated into a format, and of translations reused"""
+    __slots__ = ["target", "translated", "reused"]
+
+    def __init__(self, target):
+        self.target = target
+        self.translated = 0
+        self.reused = 0
+
+    @property
+    def hitRate(self):
+        total = self.translated + self.reused
+        return self.reused / total if total else 0.0
+
+    def asDict(self):
+        return {"translated": self.translated, "reused": self.reused,
+                "hitRate": self.hitRate}
+
+
+class ExpressionMemo:
+    """
+    Translations of the expressions of a conversion, for each target
+    format. Warnings are added to the passed list.
+    """
+
+    def __init__(self, warnings):
+        self.warnings = warnings
+        # target -> (translations, TranslationStats)
+        self._tables = {}
+
+    @property
+    def stats(self):
+        """Returns a dict with the TranslationStats of each target"""
+        return {target: stats for target, (table, stats) in self._tables.items()}
+
+    def _table(self, target):
+        stats = TranslationStats(target)
+        if _statsObserver is not None:
+            _statsObserver(stats)
+        self._tables[target] = ({}, stats)
+        return self._tables[target]
+
+    def translate(self, target, function, exp, variant=None):
+        """
+        Returns function(exp) (or function(exp, variant), if a variant is
+        passed) for the expression exp, a list. The result is kept from the
+        second time an expression (and variant) is translated, and returned
+        for the next ones.
+        """
+        try:
+            table, stats = self._tables[target]
+        except KeyError:
+            table, stats = self._table(target)
+        if type(exp) is Expression:
+            key = id(exp)
+        else:
+            key = repr(exp)
+            if len(key) > MAX_KEY_LENGTH:
+                stats.translated += 1
+                return function(exp) if variant is None else function(exp, variant)
+        if variant is not None:
+            key = (key, variant)
+        entry = table.get(key)
+        if entry is None:
+            # the expression is kept, so its id is not reused while the table exists
+            table[key] = (exp,)
+            stats.translated += 1
+            return function(exp) if variant is None else function(exp, variant)
+        warnings = self.warnings
+        if len(entry) == 3:
+            stats.reused += 1
+            if entry[2]:
+                warnings.extend(entry[2])
+            return entry[1]
+        start = len(warnings)
+        result = function(exp) if variant is None else function(exp, variant)
+        table[key] = (exp, result, warnings[start:] if len(warnings) > start else None)
+        stats.translated += 1
+        return result
+
+    def translateTree(self, target, exp, prepare, combine, variant=None):
+        """
+        Translates the expression exp (a list) and its arguments without
+        recursion. prepare(exp, variant) is called for each expression before
+        its arguments are translated, and returns a value passed to combine
+        and the list of (argument, variant) tuples to translate.
+        combine(prepared, variant, translations) returns the translation of
+        the expression, given the ones of those arguments. Translations are
+        kept and reused as in translate.
+        """
+        try:
+            table, stats = self._tables[target]
+        except KeyError:
+            table, stats = self._table(target)
+        warnings = self.warnings
+        # keys of the lists in expressions too deep for repr
+        keys = None
+        results = []
+        # (expression, variant) to translate, and (expression, variant, key,
+        # prepared, number of arguments, first warning) when the arguments
+        # of an expression are translated
+        stack = [(exp, variant)]
+        while stack:
+            item = stack.pop()
+            if len(item) == 6:
+                node, nodeVariant, key, prepared, count, start = item
+                if count == 1:
+                    translations = [results.pop()]
+                else:
+                    translations = results[-count:]
+                    del results[-count:]
+                result = combine(prepared, nodeVariant, translations)
+                if key is not None:
+                    table[key] = (node, result,
+                                  warnings[start:] if len(warnings) > start else None)
+                results.append(result)
+                continue
+            node, nodeVariant = item
+            if type(node) is Expression:
+                key = id(node)
+            elif keys is not None and id(node) in keys:
+                key = keys[id(node)]
+            else:
+                try:
+                    key = repr(node)
+                    if len(key) > MAX_KEY_LENGTH:
+                        key = None
+                except RecursionError:
+                    keys = _reprKeys(node, {} if keys is None else keys)
+                    key = None
+            store = None
+            if key is not None:
+                if nodeVariant is not None:
+                    key = (key, nodeVariant)
+                entry = table.get(key)
+                if entry is None:
+                    table[key] = (node,)
+                elif len(entry) == 3:
+                    stats.reused += 1
+                    if entry[2]:
+                        warnings.extend(entry[2])
+                    results.append(entry[1])
+                    continue
+                else:
+                    store = key
+            stats.translated += 1
+            start = len(warnings)
+            prepared, arguments = prepare(node, nodeVariant)
+            if arguments:
+                stack.append((node, nodeVariant, store, prepared, len(arguments), start))
+                stack.extend(reversed(arguments))
+                continue
+            result = combine(prepared, nodeVariant, ())
+            if store is not None:
+                table[store] = (node, result,
+                                warnings[start:] if len(warnings) > start else None)
+            results.append(result)
+        return results[0]
@@ -0,0 +1,91 @@
+"""
+Lowering of geostyler expressions to the forms older consumers expect.
+
+Producers write And and Or expressions with any number of operands, and
+set membership as an In expression:
+
+    ["In", ["PropertyName", "TYPE"], "road", "street", "path"]
+
+with NOT IN written as ["Not", ["In", ...]]. Until they were added, the
+same filters were written as chains of binary expressions nested to the
+left, which get as deep as the number of values:
+
+    ["Or", ["Or", ["PropertyIsEqualTo", ["PropertyName", "TYPE"], "road"],
+                  ["PropertyIsEqualTo", ["PropertyName", "TYPE"], "street"]],
+           ["PropertyIsEqualTo", ["PropertyName", "TYPE"], "path"]]
+
+lower() returns a style in that form, for consumers of geostyler styles
+that do not support the new one. The producers take a legacy argument to
+do it.
+"""
+
+_LOGICAL = ("And", "Or")
+
+# properties of symbolizers that contain symbolizers
+_NESTED_SYMBOLIZERS = ("graphicFill", "graphicStroke")
+
+
+def expandIn(exp):
+    """
+    Returns an In expression as a flat Or of equality comparisons (or a
+    single comparison, if there is a single value)
+    """
+    prop = exp[1]
+    comparisons = [["PropertyIsEqualTo", prop, value] for value in exp[2:]]
+    if len(comparisons) == 1:
+        return comparisons[0]
+    return ["Or"] + comparisons
+
+
+def _chain(op, operands):
+    exp = operands[0]
+    for operand in operands[1:]:
+        exp = [op, exp, operand]
+    return exp
+
+
+def lowerExpression(exp):
+    """Returns an expression with In expressions and n-ary And and Or lowered"""
+    if not isinstance(exp, list) or not exp or type(exp[0]) is not str:
+        if isinstance(exp, list):
+            return [lowerExpression(item) for item in exp]
+        return exp
+    if exp[0] == "In":
+        exp = expandIn(exp)
+        if exp[0] != "Or":
+            return exp
+        return _chain("Or", exp[1:])
+    args = [lowerExpression(arg) for arg in exp[1:]]
+    if exp[0] in _LOGICAL and len(args) > 2:
+        return _chain(exp[0], args)
+    return [exp[0]] + args
+
+
+def _lowerSymbolizer(sl):
+    lowered = {}
+    for name, value in sl.items():
+        if name in _NESTED_SYMBOLIZERS and isinstance(value, list):
+            value = [_lowerSymbolizer(s) if isinstance(s, dict) else s for s in value]
+        elif isinstance(value, list):
+            value = lowerExpression(value)
+        lowered[name] = value
+    return lowered
+
+
+def lower(geostyler):
+    """
+    Returns a copy of a geostyler style with the expressions of its rules
+    and symbolizers lowered (see lowerExpression)
+    """
+    style = dict(geostyler)
+    if "rules" in style:
+        rules = []
+        for rule in style["rules"]:
+            rule = dict(rule)
+            if isinstance(rule.get("filter"), list):
+                rule["filter"] = lowerExpression(rule["filter"])
+            if "symbolizers" in rule:
+                rule["symbolizers"] = [_lowerSymbolizer(sl) for sl in rule["symbolizers"]]
+            rules.append(rule)
+        style["rules"] = rules
+    return style
@@ -0,0 +1,308 @@
+"""
+Compact in-memory representation of geostyler styles.
+
+Geostyler styles are usually handled as the plain dicts and lists that
+json.loads returns. For large styles that means many copies of the same
+strings, numbers and expressions: the same property names, colors and
+comparisons are repeated in thousands of rules. This module has a typed
+representation of the same document where they are shared:
+
+- Styles, rules and symbolizers are Style, Rule and Symbolizer objects (a
+  subclass of Symbolizer for each kind), which are dicts with the same keys
+  as the geostyler ones, whose properties can also be read as attributes
+  (rule.symbolizers, symbolizer.color).
+- Expressions (and other list values) are Expression objects, a subclass of
+  list. Identical expressions in a document, and identical strings and
+  numbers, are the same object.
+
+Since they are dicts and lists, the converters accept model objects in place
+of the plain ones, and produce the same output. Expressions are shared, so
+they must not be modified.
+
+Styles are read from the same JSON as the geostyler format, interning the
+values while it is parsed. That is several times slower than json.loads,
+so the model is worth it for styles that are kept in memory or converted
+several times, not for reading a style once:
+
+    style = model.loads(text)
+"""
+import json
+
+
+class Expression(list):
+    """A geostyler expression (or any other list value), shared between its uses"""
+    __slots__ = ()
+
+    @property
+    def operator(self):
+        return self[0]
+
+    @property
+    def arguments(self):
+        return self[1:]
+
+
+class _Record(dict):
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, dict.__repr__(self))
+
+
+class Style(_Record):
+    __slots__ = ()
+
+
+class Rule(_Record):
+    __slots__ = ()
+
+
+class Symbolizer(_Record):
+    __slots__ = ()
+
+
+class FillSymbolizer(Symbolizer):
+    __slots__ = ()
+
+
+class LineSymbolizer(Symbolizer):
+    __slots__ = ()
+
+
+class MarkSymbolizer(Symbolizer):
+    __slots__ = ()
+
+
+class IconSymbolizer(Symbolizer):
+    __slots__ = ()
+
+
+class TextSymbolizer(Symbolizer):
+    __slots__ = ()
+
+
+class RasterSymbolizer(Symbolizer):
+    __slots__ = ()
+
+
+SYMBOLIZERS = {
+    "Fill": FillSymbolizer,
+    "Line": LineSymbolizer,
+    "Mark": MarkSymbolizer,
+    "Icon": IconSymbolizer,
+    "Text": TextSymbolizer,
+    "Raster": RasterSymbolizer,
+}
+
+# properties of symbolizers that contain symbolizers
+_NESTED_SYMBOLIZERS = ("graphicFill", "graphicStroke")
+
+
+class _Interner:
+    """Makes equal values in a document the same object"""
+
+    def __init__(self):
+        # separate tables for each type, since 1 == 1.0 == True
+        self.strings = {}
+        self.floats = {}
+        self.ints = {}
+        self.expressions = {}
+
+    def value(self, value):
+        t = type(value)
+        if t is str:
+            return self.strings.setdefault(value, value)
+        if t is float:
+            return self.floats.setdefault(value, value)
+        if t is list:
+            return self.list(value)
+        if t is int:
+            return self.ints.setdefault(value, value)
+        if t is dict:
+            return self.dict(value)
+        return value
+
+    def dict(self, d, cls=dict, convert=None):
+        # convert maps keys whose values are not converted by value() to the
+        # functions that convert them
+        string = self.strings.setdefault
+        value = self.value
+        if convert is None:
+            return cls((string(k, k), value(v)) for k, v in d.items())
+        return cls((string(k, k), convert[k](v) if k in convert else value(v))
+                   for k, v in d.items())
+
+    def list(self, items):
+        string = self.strings.setdefault
+        interned = []
+        append = interned.append
+        key = []
+        keyAppend = key.append
+        shareable = True
+        for item in items:
+            t = type(item)
+            if t is str:
+                item = string(item, item)
+                keyAppend(item)
+            elif t is list:
+                item = self.list(item)
+                if type(item) is Expression:
+                    # items are already interned, so their identity is their value
+                    keyAppend(id(item))
+                else:
+                    shareable = False
+            elif t is dict:
+                item = self.dict(item)
+                shareable = False
+            else:
+                item = self.value(item)
+                keyAppend(item)
+            append(item)
+        if not shareable:
+            return interned
+        # the types are part of the key, since 1 == 1.0 and an id could be
+        # equal to a number
+        key = (tuple(key), tuple(map(type, interned)))
+        expression = self.expressions.get(key)
+        if expression is None:
+            expression = self.expressions[key] = Expression(interned)
+        return expression
+
+    def object(self, d):
+        """object_hook for json.loads, called for the innermost objects first"""
+        string = self.strings.setdefault
+        decoded = self.decoded
+        # keys need no interning, the JSON decoder already shares them
+        for k, v in d.items():
+            t = type(v)
+            if t is str:
+                d[k] = string(v, v)
+            elif t is list:
+                d[k] = decoded(v)
+            elif t is float:
+                d[k] = self.floats.setdefault(v, v)
+            elif t is int:
+                d[k] = self.ints.setdefault(v, v)
+        return d
+
+    def decoded(self, items):
+        # like list(), for lists whose objects have already been interned
+        # by object(), and that can be modified
+        types = tuple(map(type, items))
+        if list in types:
+            key = []
+            keyAppend = key.append
+            shareable = True
+            for i, t in enumerate(types):
+                item = items[i]
+                if t is list:
+                    item = items[i] = self.decoded(item)
+                    if type(item) is Expression:
+                        item = id(item)
+                    else:
+                        shareable = False
+                elif t is dict:
+                    shareable = False
+                keyAppend(item)
+            if not shareable:
+                return items
+            # the types are part of the key, since 1 == 1.0 and an id could
+            # be equal to a number
+            key = (tuple(key), types)
+        elif dict in types:
+            return items
+        else:
+            key = (tuple(items), types)
+        expression = self.expressions.get(key)
+        if expression is None:
+            # only the values of the first copy of an expression are interned
+            value = self.value
+            expression = self.expressions[key] = Expression([value(item) for item in items])
+        return expression
+
+
+def symbolizerFromDict(d, interner=None):
+    interner = interner or _Interner()
+
+    def nested(value):
+        if isinstance(value, list):
+            return [symbolizerFromDict(sl, interner) if isinstance(sl, dict)
+                    else interner.value(sl) for sl in value]
+        return interner.value(value)
+
+    cls = SYMBOLIZERS.get(d.get("kind"), Symbolizer)
+    if any(name in d for name in _NESTED_SYMBOLIZERS):
+        return interner.dict(d, cls, {name: nested for name in _NESTED_SYMBOLIZERS})
+    return interner.dict(d, cls)
+
+
+def ruleFromDict(d, interner=None):
+    interner = interner or _Interner()
+
+    def symbolizers(value):
+        return [symbolizerFromDict(sl, interner) for sl in value]
+
+    return interner.dict(d, Rule, {"symbolizers": symbolizers})
+
+
+def styleFromDict(d):
+    """Returns the model of a geostyler style given as plain dicts and lists"""
+    interner = _Interner()
+
+    def rules(value):
+        return [ruleFromDict(rule, interner) for rule in value]
+
+    return interner.dict(d, Style, {"rules": rules})
+
+
+def _decodedSymbolizer(d):
+    symbolizer = SYMBOLIZERS.get(d.get("kind"), Symbolizer)(d)
+    for name in _NESTED_SYMBOLIZERS:
+        value = symbolizer.get(name)
+        if isinstance(value, list):
+            symbolizer[name] = [_decodedSymbolizer(sl) if isinstance(sl, dict) else sl
+                                for sl in value]
+    return symbolizer
+
+
+def _decodedRule(d):
+    rule = Rule(d)
+    if "symbolizers" in rule:
+        rule["symbolizers"] = [_decodedSymbolizer(sl) for sl in rule["symbolizers"]]
+    return rule
+
+
+def _decodedStyle(d):
+    # the values are already interned, only the records are left to create
+    style = Style(d)
+    if "rules" in style:
+        style["rules"] = [_decodedRule(rule) for rule in style["rules"]]
+    return style
+
+
+def toDict(obj):
+    """Returns a model object (or a value in one) as plain dicts and lists"""
+    if isinstance(obj, dict):
+        return {name: toDict(value) for name, value in obj.items()}
+    if isinstance(obj, list):
+        return [toDict(item) for item in obj]
+    return obj
+
+
+def loads(text):
+    """Reads a geostyler style from a JSON string (or bytes)"""
+    return _decodedStyle(json.loads(text, object_hook=_Interner().object))
+
+
+def dumps(style, **kwargs):
+    """
+    Writes a geostyler style (a model or plain dicts) as a JSON string. It is
+    the same as json.dumps, to which keyword arguments are passed.
+    """
+    return json.dumps(style, **kwargs)
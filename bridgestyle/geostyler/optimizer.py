@@ -0,0 +1,471 @@
+"""
+Simplification of the expressions of geostyler styles.
+
+Styles converted from other formats contain expressions that can be
+simplified before they are converted and evaluated by a server for each
+feature: unit conversions that multiply constants (["Mul", 3.57, 2]),
+negative numbers written as ["Sub", 0, 5], And chains nested two by two.
+The optimizer rewrites them:
+
+- Arithmetic on numbers is folded into a number, and comparisons of
+  numbers (or equality comparisons of strings) into True or False.
+- Identities are removed: x * 1, 1 * x, x / 1, x + 0, 0 + x and x - 0.
+- Nested And and Or expressions are flattened into a single one, and
+  repeated operands are removed from them, as are repeated values from In
+  expressions. So are True in And and False in
+  Or expressions, which become False (or True) if any operand is. Not of a
+  boolean is folded too. Rules whose filter is always True lose it, and
+  the ones whose filter is always False keep it unchanged.
+- Equality comparisons of an integer property with consecutive values,
+  Or'ed together, are merged into a range. Since the values in between
+  would also be in the range, this is only done for the properties that
+  are known to be integers (integerProperties).
+
+Converters run it on the style before converting it (see
+geostyler.rules.analyzeRules). OptimizationStats counts the rewrites, and
+the nodes (operators, properties and literals) of the expressions that
+changed, before and after: each node less is one evaluation less for each
+feature that the expression is evaluated for.
+"""
+import math
+import operator
+import functools
+
+from .model import Expression
+
+# function called with the OptimizationStats of each optimizer, while a
+# profile is active (see bridgestyle.profiling)
+_statsObserver = None
+
+_ARITHMETIC = {
+    "Add": operator.add,
+    "Sub": operator.sub,
+    "Mul": operator.mul,
+    "Div": operator.truediv,
+}
+
+# value that leaves the other operand unchanged, and whether it can be the
+# first operand
+_IDENTITIES = {
+    "Add": (0, True),
+    "Sub": (0, False),
+    "Mul": (1, True),
+    "Div": (1, False),
+}
+
+_COMPARISONS = {
+    "PropertyIsEqualTo": operator.eq,
+    "PropertyIsNotEqualTo": operator.ne,
+    "PropertyIsLessThan": operator.lt,
+    "PropertyIsLessThanOrEqualTo": operator.le,
+    "PropertyIsGreaterThan": operator.gt,
+    "PropertyIsGreaterThanOrEqualTo": operator.ge,
+}
+
+# comparisons that can be folded for strings. Servers may order them differently
+_EQUALITIES = ("PropertyIsEqualTo", "PropertyIsNotEqualTo")
+
+_LOGICAL = ("And", "Or")
+
+# largest operands (in items, at any depth) compared to remove repeated ones
+_MAX_COMPARED_NODES = 64
+
+# properties of symbolizers that contain symbolizers
+_NESTED_SYMBOLIZERS = ("graphicFill", "graphicStroke")
+
+
+def _isNumber(value):
+    return type(value) is int or type(value) is float
+
+
+def countNodes(exp):
+    """Returns the number of operators, properties and literals in an expression"""
+    count = 0
+    stack = [exp]
+    while stack:
+        exp = stack.pop()
+        if not isinstance(exp, list):
+            count += 1
+        elif not exp or type(exp[0]) is not str:
+            # a list of values, like an offset
+            stack.extend(exp)
+        elif exp[0] == "PropertyName":
+            count += 1
+        else:
+            count += 1
+            stack.extend(exp[1:])
+    return count
+
+
+class OptimizationStats:
+    """Number of rewrites, and of nodes of the changed expressions before and after"""
+    __slots__ = ["expressions", "nodesBefore", "nodesAfter", "folded", "identities",
+                 "flattened", "duplicates", "ranges"]
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    @property
+    def saved(self):
+        """Number of node evaluations saved for each feature"""
+        return self.nodesBefore - self.nodesAfter
+
+    def add(self, other):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def asDict(self):
+        d = {name: getattr(self, name) for name in self.__slots__}
+        d["saved"] = self.saved
+        return d
+
+
+class Optimizer:
+    """
+    Simplifies expressions, symbolizers, rules and styles, returning new
+    objects for the ones that change (the passed ones are not modified).
+    """
+
+    def __init__(self, integerProperties=()):
+        self.integerProperties = frozenset(integerProperties)
+        self.stats = OptimizationStats()
+        # results for geostyler.model expressions, which are shared
+        self._nodes = {}
+        if _statsObserver is not None:
+            _statsObserver(self.stats)
+
+    def style(self, geostyler):
+        rules = geostyler.get("rules")
+        if rules is None:
+            return geostyler
+        optimized = [self.rule(rule) for rule in rules]
+        if all(a is b for a, b in zip(optimized, rules)):
+            return geostyler
+        style = type(geostyler)(geostyler)
+        style["rules"] = optimized
+        return style
+
+    def rule(self, rule):
+        changes = {}
+        ruleFilter = rule.get("filter")
+        if isinstance(ruleFilter, list):
+            optimized = self.expression(ruleFilter)
+            # filters that are always false are kept as they are, since the
+            # formats have no filter for false (pruning removes their rules)
+            if optimized is not ruleFilter and optimized is not False:
+                changes["filter"] = optimized
+        symbolizers = rule.get("symbolizers")
+        if symbolizers:
+            optimized = [self.symbolizer(sl) for sl in symbolizers]
+            if any(a is not b for a, b in zip(optimized, symbolizers)):
+                changes["symbolizers"] = optimized
+        if not changes:
+            return rule
+        rule = type(rule)(rule)
+        rule.update(changes)
+        if rule.get("filter") is True:
+            del rule["filter"]
+        return rule
+
+    def symbolizer(self, sl):
+        changes = {}
+        for name, value in sl.items():
+            if not isinstance(value, list):
+                continue
+            if name in _NESTED_SYMBOLIZERS:
+                optimized = [self.symbolizer(s) if isinstance(s, dict) else s for s in value]
+                if any(a is not b for a, b in zip(optimized, value)):
+                    changes[name] = optimized
+            else:
+                optimized = self.expression(value)
+                if optimized is not value:
+                    changes[name] = optimized
+        if not changes:
+            return sl
+        sl = type(sl)(sl)
+        sl.update(changes)
+        return sl
+
+    def expression(self, exp):
+        """Returns the simplified expression, or exp itself if it does not change"""
+        if not isinstance(exp, list):
+            return exp
+        optimized = self._optimized(exp)
+        if optimized is not exp:
+            stats = self.stats
+            stats.expressions += 1
+            stats.nodesBefore += countNodes(exp)
+            stats.nodesAfter += countNodes(optimized)
+        return optimized
+
+    def isFalse(self, exp):
+        """Returns True if an expression is always false, once simplified"""
+        if not isinstance(exp, list):
+            return exp is False
+        return self._optimized(exp) is False
+
+    def _optimized(self, exp):
+        if type(exp) is Expression:
+            entry = self._nodes.get(id(exp))
+            if entry is None:
+                entry = self._nodes[id(exp)] = (exp, self._optimize(exp))
+            return entry[1]
+        return self._optimize(exp)
+
+    def _optimize(self, exp):
+        # walks the expression with a work stack, so that deeply nested ones
+        # (long Not or arithmetic chains, And and Or alternating...) do not
+        # reach the recursion limit. Each frame is [expression, index of the
+        # next item, copy], where the copy is only made if an item changes
+        frame = self._enter(exp)
+        if frame is None:
+            return exp
+        stack = [frame]
+        while True:
+            frame = stack[-1]
+            exp, i = frame[0], frame[1]
+            while i < len(exp) and not isinstance(exp[i], list):
+                i += 1
+            frame[1] = i
+            if i < len(exp):
+                child = self._enter(exp[i])
+                if child is not None:
+                    stack.append(child)
+                    continue
+                optimized = exp[i]
+            else:
+                stack.pop()
+                optimized = self._simplify(exp if frame[2] is None else frame[2])
+                if not stack:
+                    return optimized
+                frame = stack[-1]
+                i = frame[1]
+            if optimized is not frame[0][i]:
+                if frame[2] is None:
+                    frame[2] = list(frame[0])
+                frame[2][i] = optimized
+            frame[1] = i + 1
+
+    def _enter(self, exp):
+        # returns the frame to optimize the items of an expression, or None
+        # if it has none
+        if not exp or type(exp[0]) is not str:
+            # a list of values, like an offset
+            return [exp, 0, None]
+        op = exp[0]
+        if op == "PropertyName":
+            return None
+        if op in _LOGICAL and len(exp) == 3 and _isLogical(exp[1], op):
+            exp = self._unchain(op, exp)
+        return [exp, 1, None]
+
+    def _simplify(self, optimized):
+        # simplifies an expression once its items are optimized
+        if not optimized or type(optimized[0]) is not str:
+            return optimized
+        op = optimized[0]
+        if op in _ARITHMETIC:
+            simplified = self._arithmetic(op, optimized[1:])
+        elif op in _COMPARISONS:
+            simplified = self._comparison(op, optimized)
+        elif op in _LOGICAL:
+            simplified = self._logical(op, optimized[1:])
+        elif op == "Not":
+            simplified = self._not(optimized)
+        elif op == "In":
+            simplified = self._in(optimized)
+        else:
+            return optimized
+        return optimized if simplified is None else simplified
+
+    def _arithmetic(self, op, args):
+        numbers = len(args) >= 2
+        for arg in args:
+            if type(arg) is not int and type(arg) is not float:
+                numbers = False
+                break
+        if numbers:
+            try:
+                value = functools.reduce(_ARITHMETIC[op], args)
+            except ZeroDivisionError:
+                return None
+            if type(value) is float and not math.isfinite(value):
+                return None
+            self.stats.folded += 1
+            return value
+        if len(args) == 2:
+            identity, firstOperand = _IDENTITIES[op]
+            a, b = args
+            # a string literal would become a number in the expression
+            if _isNumber(b) and b == identity and not isinstance(a, str):
+                self.stats.identities += 1
+                return a
+            if firstOperand and _isNumber(a) and a == identity and not isinstance(b, str):
+                self.stats.identities += 1
+                return b
+        return None
+
+    def _unchain(self, op, exp):
+        # older producers write a OR b OR c as ((a OR b) OR c), which can be
+        # thousands of levels deep for long lists of values, so the operands
+        # are collected without recursion
+        operands = []
+        while len(exp) == 3 and _isLogical(exp[1], op):
+            operands.append(exp[2])
+            exp = exp[1]
+            self.stats.flattened += 1
+        operands.extend(reversed(exp[1:]))
+        operands.append(op)
+        operands.reverse()
+        return operands
+
+    def _in(self, exp):
+        values = []
+        seen = set()
+        for value in exp[2:]:
+            key = _operandKey(value)
+            if key is None or key not in seen:
+                seen.add(key)
+                values.append(value)
+        self.stats.duplicates += len(exp) - 2 - len(values)
+        if len(values) == 1:
+            return ["PropertyIsEqualTo", exp[1], values[0]]
+        if len(values) < len(exp) - 2:
+            return exp[:2] + values
+        return None
+
+    def _comparison(self, op, exp):
+        if len(exp) != 3:
+            return None
+        a, b = exp[1], exp[2]
+        if _isNumber(a) and _isNumber(b):
+            pass
+        elif not (type(a) is str and type(b) is str and op in _EQUALITIES):
+            return None
+        self.stats.folded += 1
+        return _COMPARISONS[op](a, b)
+
+    def _not(self, exp):
+        if len(exp) == 2 and type(exp[1]) is bool:
+            self.stats.folded += 1
+            return not exp[1]
+        return None
+
+    def _logical(self, op, args):
+        stats = self.stats
+        # the operand that decides the result, and the one that is ignored
+        absorbing = op == "Or"
+        flat = []
+        for arg in args:
+            if isinstance(arg, list) and arg and arg[0] == op:
+                flat.extend(arg[1:])
+                stats.flattened += 1
+            elif type(arg) is bool:
+                stats.folded += 1
+                if arg is absorbing:
+                    return absorbing
+            else:
+                flat.append(arg)
+        if not flat:
+            return not absorbing
+        operands = []
+        seen = set()
+        for arg in flat:
+            key = _operandKey(arg)
+            if key is not None and key in seen:
+                stats.duplicates += 1
+            else:
+                seen.add(key)
+                operands.append(arg)
+        if op == "Or" and self.integerProperties:
+            operands = self._ranges(operands)
+        if len(operands) == 1:
+            return operands[0]
+        if len(operands) != len(args) or any(a is not b for a, b in zip(operands, args)):
+            return [op] + operands
+        return None
+
+    def _ranges(self, operands):
+        # property -> [(value, index of the comparison)]
+        comparisons = {}
+        for i, operand in enumerate(operands):
+            comparison = _integerEquality(operand)
+            if comparison is not None and comparison[0] in self.integerProperties:
+                comparisons.setdefault(comparison[0], []).append((comparison[1], i))
+        replaced = {}
+        for name, values in comparisons.items():
+            for low, high in _runs(sorted({value for value, i in values})):
+                indexes = [i for value, i in values if low <= value <= high]
+                replaced[indexes[0]] = ["And",
+                                        ["PropertyIsGreaterThanOrEqualTo",
+                                         ["PropertyName", name], low],
+                                        ["PropertyIsLessThanOrEqualTo",
+                                         ["PropertyName", name], high]]
+                for i in indexes[1:]:
+                    replaced[i] = None
+                self.stats.ranges += 1
+        if not replaced:
+            return operands
+        return [replaced.get(i, operand) for i, operand in enumerate(operands)
+                if replaced.get(i, operand) is not None]
+
+
+def _operandKey(value):
+    # the repr of a value, to find repeated ones, or None if it is too large
+    # to compare. Large operands are seldom repeated, and comparing them
+    # would walk a deep expression again at each of its levels
+    if isinstance(value, list):
+        nodes = 0
+        stack = [value]
+        while stack:
+            item = stack.pop()
+            nodes += 1
+            if nodes > _MAX_COMPARED_NODES:
+                return None
+            if isinstance(item, list):
+                stack.extend(item)
+    return repr(value)
+
+
+def _isLogical(exp, op):
+    return isinstance(exp, list) and len(exp) > 0 and exp[0] == op
+
+
+def _integerEquality(exp):
+    # returns (property name, value) for a comparison of a property with an
+    # integer, or None
+    if not isinstance(exp, list) or len(exp) != 3 or exp[0] != "PropertyIsEqualTo":
+        return None
+    for prop, value in (exp[1], exp[2]), (exp[2], exp[1]):
+        if (isinstance(prop, list) and len(prop) == 2 and prop[0] == "PropertyName"
+                and type(value) is int):
+            return prop[1], value
+    return None
+
+
+def _runs(values):
+    # returns (first, last) tuples for the runs of at least three consecutive
+    # integers in a sorted list. Shorter ones are not worth a range
+    runs = []
+    start = 0
+    for i in range(1, len(values) + 1):
+        if i == len(values) or values[i] != values[i - 1] + 1:
+            if i - start >= 3:
+                runs.append((values[start], values[i - 1]))
+            start = i
+    return runs
+
+
+def optimizeExpression(exp, integerProperties=()):
+    """Returns the simplified version of an expression"""
+    return Optimizer(integerProperties).expression(exp)
+
+
+def optimize(geostyler, integerProperties=()):
+    """
+    Returns the simplified version of a geostyler style and the
+    OptimizationStats. The passed style is not modified.
+    """
+    optimizer = Optimizer(integerProperties)
+    return optimizer.style(geostyler), optimizer.stats
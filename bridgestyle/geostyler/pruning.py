@@ -0,0 +1,148 @@
+"""
+Removal of the rules and symbolizers of geostyler styles that draw nothing.
+
+Styles converted from other formats often contain rules that can never be
+rendered, but still cost a filter evaluation per feature in GeoServer and
+MapServer, and a layer in Mapbox GL:
+
+- Rules with an empty scale range (min >= max), easy to get from QGIS,
+  where the scales of a rule are inverted.
+- Rules whose filter is always false, once simplified (see
+  geostyler.optimizer).
+- Symbolizers with an opacity of 0, fills without colour, graphic or
+  outline (a QGIS fill with no brush and no pen), marks with transparent
+  fill and stroke, texts without label and icons without image. Lines and
+  marks without colour are kept, since SLD renders them with the default
+  colour.
+- Symbolizers repeated in a rule. Drawing a translucent symbolizer twice
+  is not the same as drawing it once, so only opaque ones are removed.
+- Rules that are left without symbolizers. An ELSE rule only applies to
+  features that no other rule applies to, even if it draws nothing, so in
+  styles that have one these rules keep their symbolizers: SLD and Mapbox
+  GL write a Rule (or layer) for each symbolizer, and a rule without any
+  would let its features fall to the ELSE rule.
+
+Each removal is reported as a warning. Converters only prune styles when
+asked to (convert(geostyler, prune=True)).
+"""
+from .optimizer import Optimizer
+
+
+def _isZero(value):
+    return (type(value) is int or type(value) is float) and value == 0
+
+
+def _isOpaque(sl):
+    for name in ("opacity", "fillOpacity", "strokeOpacity", "outlineOpacity"):
+        value = sl.get(name, 1)
+        if type(value) not in (int, float) or value != 1:
+            return False
+    return True
+
+
+def deadSymbolizerReason(sl):
+    """Returns why a symbolizer draws nothing, or None if it may draw something"""
+    if _isZero(sl.get("opacity")):
+        return "its opacity is 0"
+    kind = sl.get("kind")
+    if kind == "Fill":
+        fill = sl.get("color") is not None and not _isZero(sl.get("fillOpacity"))
+        outline = (sl.get("outlineColor") is not None
+                   and not _isZero(sl.get("outlineOpacity")))
+        if not (fill or outline or sl.get("graphicFill")):
+            return "it has no colour, graphic or outline"
+    elif kind == "Mark":
+        if _isZero(sl.get("fillOpacity")) and _isZero(sl.get("strokeOpacity")):
+            return "its fill and stroke are transparent"
+    elif kind == "Text":
+        if sl.get("label") is None:
+            return "it has no label"
+    elif kind == "Icon":
+        if not sl.get("image"):
+            return "it has no image"
+    return None
+
+
+def emptyScaleReason(rule):
+    """Returns why the scale range of a rule is empty, or None if it is not"""
+    scale = rule.get("scaleDenominator") or {}
+    minScale, maxScale = scale.get("min"), scale.get("max")
+    if (type(minScale) in (int, float) and type(maxScale) in (int, float)
+            and minScale >= maxScale):
+        return "its scale range is empty (min %s >= max %s)" % (minScale, maxScale)
+    return None
+
+
+def pruneSymbolizers(rule, warnings):
+    """
+    Returns the rule without the symbolizers that draw nothing or are
+    repeated (or the rule itself, if there are none)
+    """
+    symbolizers = rule.get("symbolizers")
+    if not symbolizers:
+        return rule
+    name = rule.get("name", "")
+    kept = []
+    for sl in symbolizers:
+        reason = deadSymbolizerReason(sl)
+        if reason is None and sl in kept and _isOpaque(sl):
+            reason = "it is repeated"
+        if reason is None:
+            kept.append(sl)
+        else:
+            warnings.append("Removed %s symbolizer from rule '%s': %s"
+                            % (sl.get("kind"), name, reason))
+    if len(kept) == len(symbolizers):
+        return rule
+    rule = type(rule)(rule)
+    rule["symbolizers"] = kept
+    return rule
+
+
+def pruneRules(rules, warnings, optimizer=None):
+    """
+    Takes a list of (index, rule) tuples and returns the ones of the rules
+    that can draw something, with the symbolizers that draw nothing removed.
+    Warnings are added to the passed list. Filters are simplified with the
+    passed Optimizer (the one that optimized the rules, if they were) to
+    know if they are always false, since optimized rules keep those filters.
+    """
+    hasElse = any(rule.get("filter") == "ELSE" for i, rule in rules)
+    optimizer = optimizer or Optimizer()
+    pruned = []
+    for i, rule in rules:
+        name = rule.get("name", "")
+        reason = emptyScaleReason(rule)
+        if reason is None and optimizer.isFalse(rule.get("filter")):
+            reason = "its filter is always false"
+        if reason is None:
+            ruleWarnings = []
+            kept = pruneSymbolizers(rule, ruleWarnings)
+            if kept.get("symbolizers") == [] and hasElse and rule.get("symbolizers"):
+                # its symbolizers keep its features from the ELSE rule
+                kept, ruleWarnings = rule, []
+            warnings.extend(ruleWarnings)
+            rule = kept
+            if rule.get("symbolizers") == [] and not hasElse:
+                reason = "it draws nothing"
+        if reason is None:
+            pruned.append((i, rule))
+        else:
+            warnings.append("Removed rule '%s': %s" % (name, reason))
+    return pruned
+
+
+def prune(geostyler):
+    """
+    Returns a geostyler style without the rules and symbolizers that draw
+    nothing, and a list of warnings describing what was removed. The passed
+    style is not modified.
+    """
+    warnings = []
+    rules = geostyler.get("rules", [])
+    pruned = pruneRules(list(enumerate(rules)), warnings)
+    if len(pruned) == len(rules) and all(a is b for (i, a), b in zip(pruned, rules)):
+        return geostyler, warnings
+    style = type(geostyler)(geostyler)
+    style["rules"] = [rule for i, rule in pruned]
+    return style, warnings
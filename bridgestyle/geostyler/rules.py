@@ -0,0 +1,87 @@
+"""
+Analysis of geostyler rules shared by the converters.
+
+The properties of a rule that all converters need (its filter, scale range,
+the corresponding zoom levels and the Z value of each symbolizer) are read
+once into a RuleInfo, so converting a style into several formats at once
+does not repeat that work for each of them. Their expressions are
+simplified first, and, if asked for, the rules and symbolizers that draw
+nothing are removed (see geostyler.optimizer and geostyler.pruning).
+"""
+import math
+
+from ..conversioncontext import current
+from .optimizer import Optimizer
+from .pruning import pruneRules
+
+
+def scaleToZoom(scale):
+    if scale < 1:  # scale=0 is valid in QGIS
+        return 24  # 24 is largest value (according to mapbox spec)
+    #val = int(math.log(1000000000 / scale, 2))
+    # https://docs.mapbox.com/help/glossary/zoom-level/
+    # https://wiki.openstreetmap.org/wiki/Zoom_levels
+    # and experimentation
+    val = (math.log(279581257 / scale, 2))
+
+    return min(max(val, 0), 24)  # keep between 0 and 24
+
+
+def zoomToScale(zoom):
+    """Returns the scale denominator of a zoom level (the inverse of scaleToZoom)"""
+    return 279581257 / 2 ** zoom
+
+
+class RuleInfo:
+    __slots__ = ["rule", "index", "name", "filter", "minScale", "maxScale",
+                 "_minZoom", "_maxZoom", "symbolizers"]
+
+    def __init__(self, rule, index=0):
+        self.rule = rule
+        self.index = index
+        self.name = rule.get("name")
+        self.filter = rule.get("filter", None)
+        scale = rule.get("scaleDenominator", {})
+        self.minScale = scale.get("min")
+        self.maxScale = scale.get("max")
+        self._minZoom = self._maxZoom = False
+        # (Z, symbolizer) tuples, in the order of the rule
+        self.symbolizers = [(sl.get("Z", 0), sl) for sl in rule["symbolizers"]]
+
+    @property
+    def isElse(self):
+        return self.filter == "ELSE"
+
+    @property
+    def minZoom(self):
+        # mapbox gl has minzoom as the smaller zoom number, which
+        # corresponds to the max scale
+        if self._minZoom is False:
+            self._minZoom = (None if self.maxScale is None
+                             else max(scaleToZoom(self.maxScale), 0))
+        return self._minZoom
+
+    @property
+    def maxZoom(self):
+        if self._maxZoom is False:
+            self._maxZoom = None if self.minScale is None else scaleToZoom(self.minScale)
+        return self._maxZoom
+
+
+def analyzeRules(geostyler, optimize=True, prune=False, warnings=None):
+    """
+    Returns a list with a RuleInfo for each rule of a geostyler style. Unless
+    optimize is False, the rules of the RuleInfo objects are the optimized
+    ones. If prune is True, there are none for the rules that draw nothing.
+    Removals are reported in the passed list of warnings, or in the ones of
+    the current conversion.
+    """
+    rules = list(enumerate(geostyler.get("rules", [])))
+    optimizer = None
+    if optimize:
+        optimizer = Optimizer()
+        rules = [(i, optimizer.rule(rule)) for i, rule in rules]
+    if prune:
+        rules = pruneRules(rules, current().warnings if warnings is None else warnings,
+                           optimizer)
+    return [RuleInfo(rule, i) for i, rule in rules]
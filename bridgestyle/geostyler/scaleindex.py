@@ -0,0 +1,164 @@
+"""
+Index of the rules of a geostyler style by scale.
+
+A rule with a scaleDenominator is active for the scales s with
+min <= s < max (as in SLD), and a rule without one at every scale. The
+scale bounds of all the rules, sorted, split the scales into bands where
+the same rules are active. ScaleIndex keeps, for each rule, the range of
+bands where it is active, in a segment tree over the bands, so that the
+rules active at a scale are found in logarithmic time (plus the time to
+list them) without checking every rule, and without storing the rules of
+each band, which grows with the square of the number of rules when their
+ranges overlap:
+
+    index = ScaleIndex(geostyler)
+    rules = index.rulesAt(25000)
+
+It also splits a style into styles with only the rules of a scale or zoom
+range, to serve a smaller style for each range:
+
+    for minZoom, maxZoom, style in index.splitByZoom(range(0, 25, 4)):
+        sld.fromgeostyler.convert(style)
+
+Rules are not modified, so they keep their scale ranges.
+"""
+from bisect import bisect_left, bisect_right
+
+from .rules import zoomToScale
+
+
+def _bound(value):
+    # scale bounds that are not numbers are ignored, like missing ones
+    return value if type(value) in (int, float) else None
+
+
+class ScaleIndex:
+    """Rules of a geostyler style, indexed by their scale ranges"""
+
+    def __init__(self, geostyler):
+        self.geostyler = geostyler
+        self.rules = list(geostyler.get("rules", []))
+        ranges = []
+        bounds = set()
+        for rule in self.rules:
+            scale = rule.get("scaleDenominator") or {}
+            minScale, maxScale = _bound(scale.get("min")), _bound(scale.get("max"))
+            ranges.append((minScale, maxScale))
+            bounds.update(b for b in (minScale, maxScale) if b is not None)
+        self.breakpoints = sorted(bounds)
+        # band i has the scales between breakpoints i - 1 and i
+        nbands = len(self.breakpoints) + 1
+        size = 1
+        while size < nbands:
+            size *= 2
+        self._size = size
+        # the rules of a node apply to all the bands under it. The ones
+        # without scale range are kept apart, instead of in several nodes
+        self._nodes = {}
+        self._unbounded = []
+        # (first band, rule index) of the other rules, by first band
+        starts = []
+        position = {b: i for i, b in enumerate(self.breakpoints)}
+        for i, (minScale, maxScale) in enumerate(ranges):
+            if minScale is None and maxScale is None:
+                self._unbounded.append(i)
+                continue
+            start = 0 if minScale is None else position[minScale] + 1
+            end = nbands if maxScale is None else position[maxScale] + 1
+            if start >= end:
+                continue  # never active
+            starts.append((start, i))
+            self._insert(start, end, i)
+        starts.sort()
+        self._starts = [start for start, i in starts]
+        self._startIndices = [i for start, i in starts]
+
+    def _insert(self, start, end, index):
+        nodes = self._nodes
+        start += self._size
+        end += self._size
+        while start < end:
+            if start & 1:
+                nodes.setdefault(start, []).append(index)
+                start += 1
+            if end & 1:
+                end -= 1
+                nodes.setdefault(end, []).append(index)
+            start >>= 1
+            end >>= 1
+
+    def _band(self, band):
+        # rule indices of the rules active in a band. Rules are added in
+        # order, so the list of each node is sorted
+        nodes = self._nodes
+        found = list(self._unbounded)
+        node = band + self._size
+        while node:
+            indices = nodes.get(node)
+            if indices:
+                found.extend(indices)
+            node >>= 1
+        return found
+
+    def indicesAt(self, scale):
+        """Returns the indices of the rules active at a scale, in style order"""
+        return sorted(self._band(bisect_right(self.breakpoints, scale)))
+
+    def indicesBetween(self, minScale=None, maxScale=None):
+        """
+        Returns the indices of the rules active at some scale s with
+        minScale <= s < maxScale, in style order. A bound of None leaves the
+        range open on that side.
+        """
+        if minScale is not None and maxScale is not None and minScale >= maxScale:
+            return []
+        first = 0 if minScale is None else bisect_right(self.breakpoints, minScale)
+        last = (len(self.breakpoints) if maxScale is None
+                else bisect_left(self.breakpoints, maxScale))
+        # the rules active in the first band, and those that start after it
+        found = self._band(first)
+        found.extend(self._startIndices[bisect_right(self._starts, first):
+                                        bisect_right(self._starts, last)])
+        return sorted(found)
+
+    def rulesAt(self, scale):
+        """Returns the rules active at a scale"""
+        return [self.rules[i] for i in self.indicesAt(scale)]
+
+    def subStyle(self, minScale=None, maxScale=None):
+        """
+        Returns a copy of the style with the rules active between minScale
+        and maxScale (see indicesBetween)
+        """
+        style = type(self.geostyler)(self.geostyler)
+        style["rules"] = [self.rules[i] for i in self.indicesBetween(minScale, maxScale)]
+        return style
+
+    def split(self, scales=None):
+        """
+        Splits the style at the passed scales (by default, the breakpoints of
+        the index, so that all the rules of each style are active in all its
+        range). Returns a list of (minScale, maxScale, style) tuples, from
+        the smallest scale denominator, where the open bounds of the first
+        and last styles are None.
+        """
+        scales = sorted(set(self.breakpoints if scales is None else scales))
+        bounds = [None] + scales + [None]
+        bands = [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+        return [(minScale, maxScale, self.subStyle(minScale, maxScale))
+                for minScale, maxScale in bands]
+
+    def splitByZoom(self, zooms=range(25)):
+        """
+        Splits the style at the passed zoom levels. Returns a list of
+        (minZoom, maxZoom, style) tuples, one for each pair of consecutive
+        zoom levels, with the rules active in that range. Zoom levels up to
+        0 and from 24 are the ends of the scale range (see scaleToZoom).
+        """
+        zooms = sorted(set(zooms))
+        result = []
+        for minZoom, maxZoom in zip(zooms, zooms[1:]):
+            minScale = None if maxZoom >= 24 else zoomToScale(maxZoom)
+            maxScale = None if minZoom <= 0 else zoomToScale(minZoom)
+            result.append((minZoom, maxZoom, self.subStyle(minScale, maxScale)))
+        return result
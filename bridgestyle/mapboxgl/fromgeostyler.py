@@ -4,16 +4,32 @@ import json
 
 import tempfile
 
-_warnings = []
+from ..conversioncontext import conversionContext, current
+from ..geostyler.legacy import expandIn
+from ..geostyler.rules import RuleInfo, analyzeRules, scaleToZoom
+
 _source_name = "vector-source"
 
 _processTextSymbolizer = False
 
 
-def convert(geostyler):
-    global _warnings
-    _warnings = []
-    layers = processLayer(geostyler)
+def convert(geostyler, prune=False):
+    """
+    Converts a geostyler style. If prune is True, the rules and symbolizers
+    that draw nothing are left out (see geostyler.pruning).
+    """
+    with conversionContext():
+        return finish(geostyler, [processRuleInfo(info, geostyler)
+                                  for info in analyzeRules(geostyler, prune=prune)])
+
+
+def finish(geostyler, processedRules):
+    """
+    Creates the Mapbox GL style from the results of processRuleInfo for all
+    the rules of the style. Returns the style as a JSON string and the list
+    of warnings.
+    """
+    layers = [layer for ruleLayers in processedRules for layer in ruleLayers]
     layers.sort(key=lambda l: l["Z"])
     obj = {
         "version": 8,
@@ -34,7 +50,53 @@ def convert(geostyler):
         "sprite": "spriteSheet",
     }
 
-    return json.dumps(obj, indent=4), _warnings
+    try:
+        text = json.dumps(obj, indent=4)
+    except RecursionError:
+        text = _dumpsDeep(obj, 4)
+    return text, current().warnings
+
+
+# deepest indentation of styles written by _dumpsDeep
+_MAX_INDENT_LEVEL = 64
+
+
+def _dumpsDeep(obj, indent):
+    # same as json.dumps(obj, indent=indent), with a work stack instead of
+    # recursion, for expressions nested deeper than the recursion limit.
+    # Levels deeper than _MAX_INDENT_LEVEL are not indented further, so the
+    # size of the text does not grow with the square of their depth.
+    # The stack has (text, None) tuples to write and (value, level) ones
+    parts = []
+    stack = [(obj, 0)]
+    while stack:
+        value, level = stack.pop()
+        if level is None:
+            parts.append(value)
+            continue
+        if isinstance(value, dict):
+            items = [(json.dumps(k if isinstance(k, str) else str(k)) + ": ", v)
+                     for k, v in value.items()]
+            brackets = "{}"
+        elif isinstance(value, (list, tuple)):
+            items = [("", v) for v in value]
+            brackets = "[]"
+        else:
+            parts.append(json.dumps(value))
+            continue
+        if not items:
+            parts.append(brackets)
+            continue
+        parts.append(brackets[0])
+        separator = "\n" + " " * (indent * min(level + 1, _MAX_INDENT_LEVEL))
+        work = []
+        for i, (prefix, item) in enumerate(items):
+            work.append(("," * bool(i) + separator + prefix, None))
+            work.append((item, level + 1))
+        work.append(("\n" + " " * (indent * min(level, _MAX_INDENT_LEVEL)) + brackets[1],
+                     None))
+        stack.extend(reversed(work))
+    return "".join(parts)
 
 # requires configuration with the tiles server URL
 # This is only available during publishing
@@ -55,39 +117,33 @@ def spriteURLFull(baseurl, workspace, layer):
          .format(baseurl, workspace, layer)
 
 def _toZoomLevel(scale):
-    if scale < 1:  # scale=0 is valid in QGIS
-        return 24  # 24 is largest value (according to mapbox spec)
-    #val = int(math.log(1000000000 / scale, 2))
-    # https://docs.mapbox.com/help/glossary/zoom-level/
-    # https://wiki.openstreetmap.org/wiki/Zoom_levels
-    # and experimentation
-    val = (math.log(279581257 / scale, 2))
-
-    return min(max(val, 0), 24)  # keep between 0 and 24
+    return scaleToZoom(scale)
 
 
 def processLayer(layer):
     allLayers = []
 
-    ruleNumber = 0
-    for rule in layer.get("rules", []):
-        layers = processRule(rule, layer["name"], ruleNumber)
-        ruleNumber += 1
-        allLayers += layers
+    for info in analyzeRules(layer):
+        allLayers += processRuleInfo(info, layer)
 
     return allLayers
 
 
 def processRule(rule, source, ruleNumber):
-    filt = convertExpression(rule.get("filter", None))
-    minzoom = None
-    maxzoom = None
-    if "scaleDenominator" in rule:
-        scale = rule["scaleDenominator"]
-        if "max" in scale:
-            minzoom = max(_toZoomLevel(scale["max"]), 0)  # mapbox gl has maxzoom as the larger zoom number
-        if "min" in scale:
-            maxzoom = _toZoomLevel(scale["min"])  # mapbox gl has minzoom as the smaller zoom number
+    return _processRule(RuleInfo(rule, ruleNumber), source)
+
+
+def processRuleInfo(info, geostyler):
+    """Converts a rule, given its RuleInfo. Returns a list of Mapbox GL layers"""
+    return _processRule(info, geostyler["name"])
+
+
+def _processRule(info, source):
+    rule = info.rule
+    ruleNumber = info.index
+    filt = convertExpression(info.filter)
+    minzoom = info.minZoom
+    maxzoom = info.maxZoom
     name = rule.get("name", "rule")
     layers = [processSymbolizer(s) for s in rule["symbolizers"]]
     layers = [item for sublist in layers for item in sublist]   # flattens list
@@ -104,7 +160,7 @@ def processRule(rule, source, ruleNumber):
             if maxzoom is not None:
                 lay["maxzoom"] = maxzoom
         except Exception as e:
-            _warnings.append("Empty style rule: '%s'" % (name + ":" + str(i)))
+            current().warnings.append("Empty style rule: '%s'" % (name + ":" + str(i)))
     return layers
 
 
@@ -149,19 +205,48 @@ def convertExpression(exp):
     if exp is None:
         return None
     if isinstance(exp, list):
-        funcName = func.get(exp[0], None)
-        if funcName is None:
-            _warnings.append("Unsupported expression function for mapbox conversion: '%s'" % exp[0])
-            return None
-        else:
-            convertedExp = [funcName]
-            for arg in exp[1:]:
-                convertedExp.append(convertExpression(arg))
-            return convertedExp
+        return current().expressions.translateTree("mapbox", exp, _prepareList, _combineList)
     else:
         return exp
 
 
+def _prepareList(exp, variant):
+    # returns the name of the mapbox expression (None if it is not
+    # supported), the expression and its arguments to translate first
+    if exp[0] == "In":
+        # match needs unique labels, all of them strings or all integers
+        labels = list(dict.fromkeys(exp[2:]))
+        if (all(isinstance(v, str) for v in labels)
+                or all(type(v) is int or (type(v) is float and v.is_integer())
+                       for v in labels)):
+            return ("match", [exp[0], exp[1], labels]), _listArguments(exp[:2])
+        exp = expandIn(exp)
+    funcName = func.get(exp[0], None)
+    if funcName is None:
+        current().warnings.append("Unsupported expression function for mapbox conversion: '%s'" % exp[0])
+        return (None, exp), ()
+    return (funcName, exp), _listArguments(exp)
+
+
+def _listArguments(exp):
+    return [(arg, None) for arg in exp[1:] if isinstance(arg, list)]
+
+
+def _combineList(prepared, variant, translations):
+    funcName, exp = prepared
+    if funcName is None:
+        return None
+    translations = iter(translations)
+    if funcName == "match":
+        # exp is the In expression with its labels
+        prop = next(translations) if isinstance(exp[1], list) else exp[1]
+        return ["match", prop, exp[2], True, False]
+    convertedExp = [funcName]
+    for arg in exp[1:]:
+        convertedExp.append(next(translations) if isinstance(arg, list) else arg)
+    return convertedExp
+
+
 def processSymbolizer(sl):
     symbolizerType = sl["kind"]
     if symbolizerType == "Icon":
@@ -179,7 +264,7 @@ def processSymbolizer(sl):
 
     geom = _geometryFromSymbolizer(sl)
     if geom is not None:
-        _warnings.append("Derived geometries are not supported in mapbox gl")
+        current().warnings.append("Derived geometries are not supported in mapbox gl")
 
     for s in symbolizer:
         if s:  # might be None
@@ -249,7 +334,7 @@ def _lineSymbolizer(sl, graphicStrokeLayer=0):
 
     paint = {}
     if graphicStroke is not None:
-        _warnings.append("Marker lines not supported for Mapbox GL conversion")
+        current().warnings.append("Marker lines not supported for Mapbox GL conversion")
         # TODO
 
     if color is None:
@@ -338,7 +423,7 @@ def _fillSymbolizer(sl):
     color = sl.get("color", None)
     graphicFill = sl.get("graphicFill", None)
     if graphicFill is not None:
-        _warnings.append("Marker fills not supported for Mapbox GL conversion")
+        current().warnings.append("Marker fills not supported for Mapbox GL conversion")
         # TODO
         # fill = {"type": "fill", "paint": {
         #     "fill-color":   _symbolProperty(graphicFill[0], "color"),
@@ -1,8 +1,8 @@
-from qgis.PyQt.QtCore import QSize, Qt
-from qgis.PyQt.QtGui import QColor, QImage, QPainter
+import os
+import json
+from .fromgeostyler import convert, spriteURLFull, tileURLFull, _source_name
+
 NO_ICON = "no_icon"
-from ..qgis.togeostyler import spriteSize
-from .fromgeostyler import spriteURLFull, tileURLFull
 
 def convertGroup(group, geostylers, sprites, baseUrl, workspace, name):
     obj = {"version": 8,
@@ -41,6 +41,11 @@ def convertGroup(group, geostylers, sprites, baseUrl, workspace, name):
 
 # allSprites ::== sprite name -> {"image":Image, "image2x":Image}
 def toSpriteSheet(allSprites):
+    # Qt is only needed (and imported) when there are sprites to draw
+    from qgis.PyQt.QtCore import Qt
+    from qgis.PyQt.QtGui import QColor, QImage, QPainter
+    from ..qgis.togeostyler import spriteSize
+
     if allSprites:
         height = spriteSize
         width = spriteSize * len(allSprites)
@@ -2,23 +2,35 @@ import os
 import math
 import json
 
-_warnings = []
+from ..conversioncontext import conversionContext, current
+from ..geostyler.legacy import expandIn
+from ..geostyler.rules import RuleInfo, analyzeRules
 
 
 def convertToDict(geostyler):
-    global _warnings
-    _warnings = []
-    global _symbols
-    _symbols = []
-    layer = processLayer(geostyler)
-    return layer, _symbols, _warnings
+    with conversionContext() as context:
+        layer = processLayer(geostyler)
+    return layer, context.symbols, context.warnings
 
 
-def convert(geostyler):
-    d, _, _ = convertToDict(geostyler)
-    mapfile = convertDictToMapfile(d)
-    symbols = convertDictToMapfile({"SYMBOLS": _symbols})
-    return mapfile, symbols, _warnings
+def convert(geostyler, prune=False):
+    """
+    Converts a geostyler style. If prune is True, the rules and symbolizers
+    that draw nothing are left out (see geostyler.pruning).
+    """
+    with conversionContext():
+        return finish(geostyler, [processRuleInfo(info) for info in analyzeRules(geostyler, prune=prune)])
+
+
+def finish(geostyler, processedRules):
+    """
+    Creates the mapfile from the results of processRuleInfo for all the
+    rules of the style. Returns the mapfile, the symbols file and the list
+    of warnings.
+    """
+    mapfile = convertDictToMapfile(_layerDict(geostyler, processedRules))
+    symbols = convertDictToMapfile({"SYMBOLS": current().symbols})
+    return mapfile, symbols, current().warnings
 
 
 def convertDictToMapfile(d):
@@ -44,12 +56,11 @@ def convertDictToMapfile(d):
 
 
 def processLayer(layer):
-    classes = []
+    classes = [processRuleInfo(info) for info in analyzeRules(layer)]
+    return _layerDict(layer, classes)
 
-    for rule in layer.get("rules", []):
-        clazz = processRule(rule)
-        classes.append(clazz)
 
+def _layerDict(layer, classes):
     layerData = {
         "LAYER": {
             "NAME": _quote(layer.get("name", "")),
@@ -62,21 +73,25 @@ def processLayer(layer):
 
 
 def processRule(rule):
+    return processRuleInfo(RuleInfo(rule))
+
+
+def processRuleInfo(info, geostyler=None):
+    """Converts a rule, given its RuleInfo. Returns a CLASS dict"""
+    rule = info.rule
     d = {"NAME": _quote(rule.get("name", "") or "default")}
     name = rule.get("name", "rule")
 
-    expression = convertExpression(rule.get("filter", None))
+    expression = convertExpression(info.filter)
     if expression is not None:
         d["EXPRESSION"] = expression
 
     styles = [{"STYLE": processSymbolizer(s)} for s in rule["symbolizers"]]
 
-    if "scaleDenominator" in rule:
-        scale = rule["scaleDenominator"]
-        if "max" in scale:
-            d["MAXSCALEDENOM"] = scale["max"]
-        if "min" in scale:
-            d["MINSCALEDENOM"] = scale["min"]
+    if info.maxScale is not None:
+        d["MAXSCALEDENOM"] = info.maxScale
+    if info.minScale is not None:
+        d["MINSCALEDENOM"] = info.minScale
 
     d["STYLES"] = styles
 
@@ -105,22 +120,8 @@ def convertExpression(exp):
     if exp is None:
         return None
     if isinstance(exp, list):
-        funcName = func.get(exp[0], None)
-        if funcName is None:
-            _warnings.append(
-                "Unsupported expression function for MapServer conversion: '%s'"
-                % exp[0]
-            )
-            return None
-        elif funcName == "PropertyName":
-            return '"[%s]"' % exp[1]
-        else:
-            arg1 = convertExpression(exp[1])
-            if len(exp) == 3:
-                arg2 = convertExpression(exp[2])
-                return "(%s %s %s)" % (arg1, funcName, arg2)
-            else:
-                return "%s(%s)" % (funcName, arg1)
+        return current().expressions.translateTree("mapserver", exp, _prepareList,
+                                                   _combineList)
     else:
         try:
             f = float(exp)
@@ -129,6 +130,66 @@ def convertExpression(exp):
             return _quote(exp)
 
 
+def _prepareList(exp, variant):
+    # returns the mapserver operator or function (None if it is not
+    # supported), the expression and its arguments to translate first
+    if exp[0] == "In":
+        # the list of values is a comma separated string, compared as text,
+        # so values with commas or quotes, and floats, are compared one by one
+        if (isinstance(exp[1], list) and exp[1][0] == "PropertyName"
+                and all((isinstance(v, str) and "," not in v and '"' not in v)
+                        or type(v) is int for v in exp[2:])):
+            return ("IN", exp), [(exp[1], None)]
+        exp = expandIn(exp)
+    funcName = func.get(exp[0], None)
+    if funcName is None:
+        current().warnings.append(
+            "Unsupported expression function for MapServer conversion: '%s'"
+            % exp[0]
+        )
+        return (None, exp), ()
+    elif funcName == "PropertyName":
+        return (funcName, exp), ()
+    elif funcName in ("AND", "OR"):
+        # nested expressions with the same operator are written as one,
+        # instead of copying their text into each level of a long chain
+        exp = _flatten(exp)
+    return (funcName, exp), [(arg, None) for arg in exp[1:] if isinstance(arg, list)]
+
+
+def _flatten(exp):
+    op = exp[0]
+    operands = []
+    stack = list(reversed(exp[1:]))
+    while stack:
+        operand = stack.pop()
+        if isinstance(operand, list) and operand and operand[0] == op:
+            stack.extend(reversed(operand[1:]))
+        else:
+            operands.append(operand)
+    return [op] + operands
+
+
+def _combineList(prepared, variant, translations):
+    funcName, exp = prepared
+    if funcName is None:
+        return None
+    elif funcName == "PropertyName":
+        return '"[%s]"' % exp[1]
+    elif funcName == "IN":
+        return '(%s IN "%s")' % (translations[0], ",".join(str(v) for v in exp[2:]))
+    translations = iter(translations)
+    args = [next(translations) if isinstance(arg, list) else convertExpression(arg)
+            for arg in exp[1:]]
+    if len(args) > 2:
+        # And and Or with more than two operands
+        return "(%s)" % (" %s " % funcName).join(str(arg) for arg in args)
+    elif len(args) == 2:
+        return "(%s %s %s)" % (args[0], funcName, args[1])
+    else:
+        return "%s(%s)" % (funcName, args[0])
+
+
 def processSymbolizer(sl):
     symbolizerType = sl["kind"]
     if symbolizerType == "Icon":
@@ -146,7 +207,7 @@ def processSymbolizer(sl):
 
     geom = _geometryFromSymbolizer(sl)
     if geom is not None:
-        _warnings.append("Derived geometries are not supported in mapbox gl")
+        current().warnings.append("Derived geometries are not supported in mapbox gl")
 
     return symbolizer
 
@@ -233,7 +294,7 @@ def _createSymbol(sl):
     if symbolizerType == "Icon":
         path = os.path.basename(sl["image"])
         name = "icon_" + os.path.splitext(path)[0]
-        _symbols.append(
+        current().symbols.append(
             {"SYMBOL": {"TYPE": "PIXMAP", "IMAGE": _quote(path), "NAME": _quote(name)}}
         )
     elif symbolizerType == "Mark":
@@ -242,7 +303,7 @@ def _createSymbol(sl):
             svgFilename = shape.split("//")[-1]
             svgName = os.path.splitext(svgFilename)[0]
             name = "svgicon_" + svgName
-            _symbols.append(
+            current().symbols.append(
                 {
                     "SYMBOL": {
                         "TYPE": "svg",
@@ -256,7 +317,7 @@ def _createSymbol(sl):
             font, code = token.split("#")
             character = chr(int(code, 16))
             name = "txtmarker_%s_%s" % (font, character)
-            _symbols.append(
+            current().symbols.append(
                 {
                     "SYMBOL": {
                         "TYPE": "TRUETYPE",
@@ -0,0 +1,386 @@
+"""
+Optional instrumentation of conversions.
+
+While a profile is active, the main stages of a conversion and the hot
+functions of each converter (per rule, per symbolizer and per expression)
+are wrapped to record their wall time and number of calls:
+
+    from bridgestyle import profiling
+    with profiling.profile() as p:
+        style2style.convertFile("roads.geostyler", "roads.sld")
+    p.report()
+    p.saveChromeTrace("trace.json")  # open it in chrome://tracing or Perfetto
+
+Functions are wrapped when the profile starts and restored when it ends,
+so converters run exactly the same code, at the same speed, when no
+profile is active. Only one profile can be active at a time.
+
+Besides the number of calls, for each function the report shows its total
+time (including the functions it calls, and counting recursive calls only
+once) and its own time (excluding the instrumented functions it calls).
+
+With memory=True, memory allocations are traced with tracemalloc, and the
+stages (but not the per-rule, per-symbolizer and per-expression functions,
+which are called too often) also record the peak memory used while they
+run and the memory they retain when they return, both relative to the
+memory in use when they were called. Memory figures are only meaningful
+when a single conversion runs at a time.
+
+The report also shows how many expressions each converter translated,
+and how many translations it reused (see geostyler.expressions), and how
+many node evaluations per feature the optimizer removed from the
+expressions of the styles (see geostyler.optimizer).
+"""
+import sys
+import json
+import time
+import threading
+import tracemalloc
+import functools
+import importlib
+from contextlib import contextmanager
+
+# (module, function, category). Categories are used to group functions in
+# the Chrome trace
+INSTRUMENTED = [
+    ("bridgestyle.style2style", "convertStyle", "stage"),
+    ("bridgestyle.style2style", "convertGeostyler", "stage"),
+    ("bridgestyle.registry", "StyleFormat.toGeostyler", "stage"),
+    ("bridgestyle.registry", "StyleFormat.fromGeostyler", "stage"),
+    ("bridgestyle.geostyler", "toGeostyler", "parse"),
+    ("bridgestyle.geostyler", "fromGeostyler", "serialize"),
+    ("bridgestyle.fanout", "convert", "stage"),
+    ("bridgestyle.geostyler.rules", "analyzeRules", "rule"),
+    ("bridgestyle.sld.togeostyler", "convert", "stage"),
+    ("bridgestyle.sld.fromgeostyler", "convert", "stage"),
+    ("bridgestyle.sld.fromgeostyler", "processRuleInfo", "rule"),
+    ("bridgestyle.sld.fromgeostyler", "_createSymbolizer", "symbolizer"),
+    ("bridgestyle.sld.fromgeostyler", "convertExpression", "expression"),
+    ("bridgestyle.sld.fromgeostyler", "finish", "build"),
+    ("bridgestyle.sld.fromgeostyler", "_prettyXml", "serialize"),
+    ("bridgestyle.mapboxgl.togeostyler", "convert", "stage"),
+    ("bridgestyle.mapboxgl.fromgeostyler", "convert", "stage"),
+    ("bridgestyle.mapboxgl.fromgeostyler", "processRuleInfo", "rule"),
+    ("bridgestyle.mapboxgl.fromgeostyler", "processSymbolizer", "symbolizer"),
+    ("bridgestyle.mapboxgl.fromgeostyler", "convertExpression", "expression"),
+    ("bridgestyle.mapboxgl.fromgeostyler", "finish", "build"),
+    ("bridgestyle.mapserver.fromgeostyler", "convert", "stage"),
+    ("bridgestyle.mapserver.fromgeostyler", "processRuleInfo", "rule"),
+    ("bridgestyle.mapserver.fromgeostyler", "processSymbolizer", "symbolizer"),
+    ("bridgestyle.mapserver.fromgeostyler", "convertExpression", "expression"),
+    ("bridgestyle.mapserver.fromgeostyler", "convertDictToMapfile", "serialize"),
+    ("bridgestyle.arcgis.togeostyler", "convert", "stage"),
+    ("bridgestyle.arcgis.togeostyler", "processUniqueValueGroup", "rule"),
+    ("bridgestyle.arcgis.togeostyler", "processSymbolLayer", "symbolizer"),
+    ("bridgestyle.qgis.togeostyler", "convert", "stage"),
+    ("bridgestyle.qgis.togeostyler", "processRule", "rule"),
+    ("bridgestyle.qgis.togeostyler", "_createSymbolizer", "symbolizer"),
+    ("bridgestyle.qgis.togeostyler", "processExpression", "expression"),
+]
+
+# modules that are only instrumented if they are already loaded, since
+# importing them has side effects or needs other libraries
+_IF_LOADED = ["bridgestyle.qgis.togeostyler"]
+
+# categories of functions that record memory in memory mode
+MEMORY_CATEGORIES = {"stage", "parse", "build", "serialize"}
+
+_active = None
+_activeLock = threading.Lock()
+
+
+class FunctionStats:
+    __slots__ = ["name", "category", "calls", "totalTime", "ownTime", "peakMemory",
+                 "retainedMemory"]
+
+    def __init__(self, name, category):
+        self.name = name
+        self.category = category
+        self.calls = 0
+        self.totalTime = 0  # nanoseconds
+        self.ownTime = 0
+        self.peakMemory = None  # bytes, only in memory mode
+        self.retainedMemory = None
+
+    def asDict(self):
+        d = {"category": self.category, "calls": self.calls,
+             "totalTime": self.totalTime / 1e9, "ownTime": self.ownTime / 1e9}
+        if self.peakMemory is not None:
+            d["peakMemory"] = self.peakMemory
+            d["retainedMemory"] = self.retainedMemory
+        return d
+
+
+class _Frame:
+    __slots__ = ["name", "start", "childTime", "startMemory", "peakMemory"]
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.childTime = 0
+        self.startMemory = None
+        self.peakMemory = None
+
+
+class Profile:
+    """
+    Times and call counts recorded while a profile was active. If trace is
+    True, each call is also recorded, for the Chrome trace export.
+    """
+
+    def __init__(self, trace=True, memory=False):
+        self.trace = trace
+        self.memory = memory
+        self.stats = {}
+        self.events = []
+        self.translations = []  # TranslationStats of the conversions
+        self.optimizations = []  # OptimizationStats of the conversions
+        self.start = None
+        self.end = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        try:
+            return self._local.stack, self._local.active
+        except AttributeError:
+            self._local.stack = []
+            self._local.active = {}
+            self._local.memoryStack = []
+            return self._local.stack, self._local.active
+
+    def _enterMemory(self, frame):
+        # tracemalloc only keeps one peak, so it is reset when a stage starts
+        # and ends, after passing the peak so far to the enclosing stage
+        memoryStack = self._local.memoryStack
+        current, peak = tracemalloc.get_traced_memory()
+        if memoryStack:
+            parent = memoryStack[-1]
+            parent.peakMemory = max(parent.peakMemory, peak)
+        tracemalloc.reset_peak()
+        frame.startMemory = frame.peakMemory = current
+        memoryStack.append(frame)
+
+    def _exitMemory(self, frame, stats):
+        memoryStack = self._local.memoryStack
+        memoryStack.pop()
+        current, peak = tracemalloc.get_traced_memory()
+        frame.peakMemory = max(frame.peakMemory, peak)
+        if memoryStack:
+            parent = memoryStack[-1]
+            parent.peakMemory = max(parent.peakMemory, frame.peakMemory)
+        tracemalloc.reset_peak()
+        with self._lock:
+            stats.peakMemory = max(stats.peakMemory or 0, frame.peakMemory - frame.startMemory)
+            stats.retainedMemory = ((stats.retainedMemory or 0)
+                                    + current - frame.startMemory)
+
+    def _wrap(self, function, name, category):
+        with self._lock:
+            if name not in self.stats:
+                self.stats[name] = FunctionStats(name, category)
+        stats = self.stats[name]
+        profile = self
+        memory = self.memory and category in MEMORY_CATEGORIES
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stack, active = profile._stack()
+            frame = _Frame(name, time.perf_counter_ns())
+            if memory:
+                profile._enterMemory(frame)
+            stack.append(frame)
+            active[name] = active.get(name, 0) + 1
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if memory:
+                    profile._exitMemory(frame, stats)
+                end = time.perf_counter_ns()
+                stack.pop()
+                active[name] -= 1
+                duration = end - frame.start
+                if stack:
+                    stack[-1].childTime += duration
+                with profile._lock:
+                    stats.calls += 1
+                    stats.ownTime += duration - frame.childTime
+                    if not active[name]:
+                        stats.totalTime += duration
+                    if profile.trace:
+                        profile.events.append((name, category, frame.start, duration,
+                                               threading.get_ident()))
+
+        return wrapper
+
+    def functionStats(self):
+        """Returns a dict with the stats of each function that was called"""
+        return {name: s.asDict() for name, s in self.stats.items() if s.calls}
+
+    def expressionStats(self):
+        """
+        Returns a dict with the number of expressions translated and reused
+        by each converter, and the proportion of reused ones (hitRate)
+        """
+        totals = {}
+        with self._lock:
+            translations = list(self.translations)
+        for t in translations:
+            total = totals.setdefault(t.target, {"translated": 0, "reused": 0})
+            total["translated"] += t.translated
+            total["reused"] += t.reused
+        for total in totals.values():
+            count = total["translated"] + total["reused"]
+            total["hitRate"] = total["reused"] / count if count else 0.0
+        return totals
+
+    def _addTranslationStats(self, stats):
+        with self._lock:
+            self.translations.append(stats)
+
+    def optimizationStats(self):
+        """
+        Returns a dict with the total number of rewrites done by the
+        optimizer, and of nodes of the expressions it changed before and
+        after them (see geostyler.optimizer.OptimizationStats)
+        """
+        from bridgestyle.geostyler.optimizer import OptimizationStats
+        total = OptimizationStats()
+        with self._lock:
+            optimizations = list(self.optimizations)
+        for stats in optimizations:
+            total.add(stats)
+        return total.asDict()
+
+    def _addOptimizationStats(self, stats):
+        with self._lock:
+            self.optimizations.append(stats)
+
+    def formatMemory(self):
+        """
+        Returns a dict with the peak memory of the stages of each format
+        (in bytes), keyed by format module (e.g. 'sld.fromgeostyler').
+        Only available in memory mode.
+        """
+        formats = {}
+        for s in self.stats.values():
+            if s.peakMemory is not None:
+                fmt = s.name.rsplit(".", 1)[0]
+                formats[fmt] = max(formats.get(fmt, 0), s.peakMemory)
+        return formats
+
+    def report(self, file=None, limit=None):
+        """Writes a table with the stats, sorted by own time, to file (stderr by default)"""
+        file = file or sys.stderr
+        rows = sorted((s for s in self.stats.values() if s.calls),
+                      key=lambda s: s.ownTime, reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        if self.start is not None and self.end is not None:
+            print("Total time: %.3f s" % ((self.end - self.start) / 1e9), file=file)
+        header = "%10s %12s %12s" % ("calls", "total (s)", "own (s)")
+        if self.memory:
+            header += " %12s %12s" % ("peak (MB)", "retained (MB)")
+        print(header + "  function", file=file)
+        for s in rows:
+            line = "%10i %12.4f %12.4f" % (s.calls, s.totalTime / 1e9, s.ownTime / 1e9)
+            if self.memory:
+                if s.peakMemory is not None:
+                    line += " %12.2f %12.2f" % (s.peakMemory / 1e6, s.retainedMemory / 1e6)
+                else:
+                    line += " %12s %12s" % ("", "")
+            print(line + "  " + s.name, file=file)
+        expressions = self.expressionStats()
+        if expressions:
+            print("\n%10s %12s %12s  expressions" % ("translated", "reused", "hit rate"),
+                  file=file)
+            for target, total in sorted(expressions.items()):
+                print("%10i %12i %11.1f%%  %s" % (total["translated"], total["reused"],
+                                                  total["hitRate"] * 100, target), file=file)
+        if self.optimizations:
+            stats = self.optimizationStats()
+            print("\nOptimized expressions: %i (%i nodes, %i after), %i node evaluations "
+                  "saved per feature" % (stats["expressions"], stats["nodesBefore"],
+                                         stats["nodesAfter"], stats["saved"]), file=file)
+            print("Folded: %i, identities: %i, flattened: %i, duplicates: %i, ranges: %i"
+                  % (stats["folded"], stats["identities"], stats["flattened"],
+                     stats["duplicates"], stats["ranges"]), file=file)
+
+    def chromeTrace(self):
+        """Returns the recorded calls as a dict in Chrome trace event format"""
+        origin = self.start or 0
+        events = [{"name": name, "cat": category, "ph": "X",
+                   "ts": (start - origin) / 1000.0, "dur": duration / 1000.0,
+                   "pid": 1, "tid": tid}
+                  for name, category, start, duration, tid in self.events]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def saveChromeTrace(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.chromeTrace(), f)
+
+
+def _resolve(moduleName, functionName):
+    # returns the object that owns the function and its attribute name
+    if moduleName in _IF_LOADED:
+        module = sys.modules.get(moduleName)
+        if module is None:
+            return None, None
+    else:
+        try:
+            module = importlib.import_module(moduleName)
+        except ImportError:
+            return None, None
+    owner = module
+    path = functionName.split(".")
+    for attr in path[:-1]:
+        owner = getattr(owner, attr)
+    return owner, path[-1]
+
+
+@contextmanager
+def profile(trace=True, memory=False):
+    """
+    Instruments the converters while the with block is executed, and
+    returns a Profile with the results. If memory is True, memory is
+    also accounted (see the module documentation).
+    """
+    global _active
+    with _activeLock:
+        if _active is not None:
+            raise RuntimeError("A profile is already active")
+        p = _active = Profile(trace, memory)
+    patched = []
+    startedTracing = False
+    from bridgestyle.geostyler import expressions, optimizer
+    try:
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            startedTracing = True
+        for moduleName, functionName, category in INSTRUMENTED:
+            owner, attr = _resolve(moduleName, functionName)
+            if owner is None:
+                continue
+            # use the class __dict__, so methods are patched as plain functions
+            original = owner.__dict__[attr]
+            name = "%s.%s" % (moduleName.replace("bridgestyle.", "", 1), functionName)
+            setattr(owner, attr, p._wrap(original, name, category))
+            patched.append((owner, attr, original))
+        expressions._statsObserver = p._addTranslationStats
+        optimizer._statsObserver = p._addOptimizationStats
+        p.start = time.perf_counter_ns()
+        yield p
+    finally:
+        p.end = time.perf_counter_ns()
+        expressions._statsObserver = None
+        optimizer._statsObserver = None
+        for owner, attr, original in reversed(patched):
+            setattr(owner, attr, original)
+        if startedTracing:
+            tracemalloc.stop()
+        with _activeLock:
+            _active = None
+
+
+def isActive():
+    return _active is not None
@@ -9,6 +9,7 @@ from bridgestyle import qgis
 from bridgestyle import sld
 from bridgestyle import mapboxgl
 from bridgestyle import mapserver
+from bridgestyle import fanout
 from qgis.core import QgsWkbTypes, QgsMarkerSymbol, QgsSymbol, QgsSVGFillSymbolLayer, QgsSvgMarkerSymbolLayer, \
     QgsRasterLayer, QgsVectorLayer
 from qgis.PyQt.QtCore import QSize, Qt
@@ -31,13 +32,17 @@ def saveLayerStyleAsSld(layer, filename):
 
 def saveLayerStyleAsZippedSld(layer, filename):
     sldstring, icons, warnings = layerStyleAsSld(layer)
+    writeZippedSld(filename, layer.name(), sldstring, icons)
+    return warnings
+
+
+def writeZippedSld(filename, name, sldstring, icons):
     z = zipfile.ZipFile(filename, "w")
     for icon in icons.keys():
         if icon:
             z.write(icon, os.path.basename(icon))
-    z.writestr(layer.name() + ".sld", sldstring)
+    z.writestr(name + ".sld", sldstring)
     z.close()
-    return warnings
 
 
 def layerStyleAsMapbox(layer):
@@ -64,7 +69,21 @@ def layerStyleAsMapfile(layer):
     return mserver, mserverSymbols, icons, warnings
 
 
-def layerStyleAsMapfileFolder(layer, folder, additional=None):
+def layerStyleAsFormats(layer, formats=None):
+    """
+    Converts the style of a layer into several formats (all the supported
+    ones by default) in a single pass. Returns a dict with the result of
+    each format, the used icons and the warnings of the QGIS conversion.
+    """
+    geostyler, icons, sprites, warnings = togeostyler.convert(layer)
+    return fanout.convert(geostyler, formats), icons, warnings
+
+
+def layerStyleAsMapfileFiles(layer, additional=None):
+    """
+    Returns the mapfile and symbols file written by layerStyleAsMapfileFolder,
+    the used icons and the warnings.
+    """
     geostyler, icons, sprites, warnings = togeostyler.convert(layer)
     mserverDict, mserverSymbolsDict, msWarnings = mapserver.fromgeostyler.convertToDict(geostyler)
     warnings.extend(msWarnings)
@@ -72,6 +91,11 @@ def layerStyleAsMapfileFolder(layer, folder, additional=None):
     mserverDict["LAYER"].update(additional)
     mapfile = mapserver.fromgeostyler.convertDictToMapfile(mserverDict)
     symbols = mapserver.fromgeostyler.convertDictToMapfile({"SYMBOLS": mserverSymbolsDict})
+    return mapfile, symbols, icons, warnings
+
+
+def layerStyleAsMapfileFolder(layer, folder, additional=None):
+    mapfile, symbols, icons, warnings = layerStyleAsMapfileFiles(layer, additional)
     filename = os.path.join(folder, layer.name() + ".txt")
     with open(filename, "w", encoding='utf-8') as f:
         f.write(mapfile)
@@ -105,10 +105,9 @@ def walkExpression(node, layer):
 
 
 # handle IN expression
-# convert to a series of (A='a') OR (B='b')
+# convert to ["In", property, value1, value2...], or to
+# ["Not", ["In", ...]] for NOT IN
 def handle_in(node, layer):
-    if node.isNotIn():
-        raise UnsupportedExpressionException("expression NOT IN is unsupported")
     # convert this expression to another (equivelent Expression)
     if node.node().nodeType() != QgsExpressionNode.ntColumnRef:
         raise UnsupportedExpressionException("expression  IN doesn't ref column!")
@@ -118,21 +117,19 @@ def handle_in(node, layer):
         )
 
     colRef = handleColumnRef(node.node(), layer)
-    propEqualsExprs = []  # one for each of the literals in the expression
+    values = []  # one for each of the literals in the expression
     for item in node.list().list():
         if item.nodeType() != QgsExpressionNode.ntLiteral:
             raise UnsupportedExpressionException("expression  IN isn't literal")
-        # equals_expr = QgsExpressionNodeBinaryOperator(2,colRef,item) #2 is "="
-        equals_expr = [binaryOps[2], colRef, handleLiteral(item)]  # 2 is "="
-        propEqualsExprs.append(equals_expr)
+        values.append(handleLiteral(item))
 
-    # bulid into single expression
-    if len(propEqualsExprs) == 1:
-        return propEqualsExprs[0]  # handle 1 item in the list
-    accum = [binaryOps[0], propEqualsExprs[0], propEqualsExprs[1]]  # 0="OR"
-    for idx in range(2, len(propEqualsExprs)):
-        accum = [binaryOps[0], accum, propEqualsExprs[idx]]  # 0="OR"
-    return accum
+    if len(values) == 1:
+        exp = [binaryOps[2], colRef, values[0]]  # 2 is "="
+    else:
+        exp = ["In", colRef] + values
+    if node.isNotIn():
+        return ["Not", exp]
+    return exp
 
 
 def handleBinary(node, layer):
@@ -142,9 +139,19 @@ def handleBinary(node, layer):
     right = node.opRight()
     retLeft = walkExpression(left, layer)
     retRight = walkExpression(right, layer)
+    if retOp in ("And", "Or"):
+        # a AND b AND c is parsed as (a AND b) AND c
+        return [retOp] + logicalOperands(retOp, retLeft) + logicalOperands(retOp, retRight)
     return [retOp, retLeft, retRight]
 
 
+def logicalOperands(op, exp):
+    # returns the operands of exp if it is an op expression, or exp itself
+    if isinstance(exp, list) and exp and exp[0] == op:
+        return exp[1:]
+    return [exp]
+
+
 def handleUnary(node, layer):
     op = node.op()
     operand = node.operand()
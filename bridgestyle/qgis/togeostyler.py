@@ -3,7 +3,9 @@ import json
 import math
 import zipfile
 import tempfile
-from .expressions import walkExpression, UnsupportedExpressionException
+from .expressions import walkExpression, UnsupportedExpressionException, logicalOperands
+from ..conversioncontext import ConversionContext, conversionContext, current
+from ..geostyler.legacy import lower
 
 try:
     from qgis.core import *
@@ -11,32 +13,22 @@ try:
 except:
     pass
 
-_usedIcons = {}
-_usedSprites = {}  # sprite name -> {"image":Image, "image2x":Image}
-_warnings = []
 
-
-class ExpressionConverter():
-    layer = None
-
-    def walkExpression(self, node):
-        return walkExpression(node, self.layer)
-
-
-_expressionConverter = ExpressionConverter()
-
-
-def convert(layer):
-    global _usedIcons, _usedSprites
-    _usedIcons = {}
-    _usedSprites = {}
-    global _warnings
-    _warnings = []
-    geostyler = processLayer(layer)
+def convert(layer, legacy=False):
+    """
+    Converts the style of a QGIS layer into a geostyler style. Returns the
+    style, the icons and sprites it uses, and the warnings. If legacy is
+    True, And, Or and In expressions are written as chains of binary
+    expressions (see geostyler.legacy).
+    """
+    with conversionContext(ConversionContext(layer=layer)) as context:
+        geostyler = processLayer(layer)
     if geostyler is None:
         geostyler = {"name": layer.name()}
+    elif legacy:
+        geostyler = lower(geostyler)
 
-    return geostyler, _usedIcons, _usedSprites, _warnings
+    return geostyler, context.usedIcons, context.usedSprites, context.warnings
 
 
 blendModes = {
@@ -55,8 +47,6 @@ blendModes = {
 
 
 def processLayer(layer):
-    _expressionConverter.layer = layer
-
     geostyler = {"name": layer.name()}
     if layer.type() == layer.VectorLayer:
         rules = []
@@ -74,7 +64,7 @@ def processLayer(layer):
                 else:
                     ruleRenderer = renderer
                 if ruleRenderer is None:
-                    _warnings.append(
+                    current().warnings.append(
                         "Unsupported renderer type: %s" % str(renderer))
                     return
                 for rule in ruleRenderer.rootRule().children():
@@ -99,7 +89,7 @@ def heatmapRenderer(renderer):
     hmRadius = renderer.radius()
     colorRamp = renderer.colorRamp()
     if not isinstance(colorRamp, QgsGradientColorRamp):
-        _warnings.append("Unsupported color ramp class: %s" % str(colorRamp))
+        current().warnings.append("Unsupported color ramp class: %s" % str(colorRamp))
         return
     colMap = {}
     colMap["type"] = "intervals" if colorRamp.isDiscrete() else "ramp"
@@ -116,7 +106,7 @@ def heatmapRenderer(renderer):
     weightAttr = renderer.weightExpression()
     radius = renderer.radius()
     if renderer.radiusUnit() != QgsUnitTypes.RenderPixels:
-        _warnings.append(
+        current().warnings.append(
             "Radius for heatmap renderer can only be expressed in pixels")
 
     channel = {"grayChannel": {"sourceChannelName": 1}}
@@ -157,7 +147,7 @@ def channelSelection(renderer):
             channels["blueChannel"] = {"sourceChannelName": str(bands[2])}
         return channels
     else:
-        _warnings.append(
+        current().warnings.append(
             "Unsupported raster renderer class: '%s'" % str(renderer))
         return None
 
@@ -191,11 +181,11 @@ def colorMap(renderer):
             mapEntries.append({"color": c.color.name(), "quantity": c.value,
                                "label": c.label, "opacity": c.color.alphaF()})
     elif isinstance(renderer, QgsMultiBandColorRenderer):
-        _warnings.append("Unsupported raster renderer class: '%s'" %
+        current().warnings.append("Unsupported raster renderer class: '%s'" %
                          str(renderer))  # TODO
         return None
     else:
-        _warnings.append(
+        current().warnings.append(
             "Unsupported raster renderer class: '%s'" % str(renderer))
         return None
 
@@ -229,7 +219,7 @@ def processLabelingLayer(layer):
     if isinstance(labeling, QgsRuleBasedLabeling):
         return processRuleLabeling(layer, labeling.rootRule(), "labeling")
     if not isinstance(labeling, QgsVectorLayerSimpleLabeling):
-        _warnings.append("Unsupported labeling class: '%s'" % str(labeling))
+        current().warnings.append("Unsupported labeling class: '%s'" % str(labeling))
         return None
     return [processLabeling(layer, labeling)]
 
@@ -301,9 +291,9 @@ def processLabeling(layer, labeling, name="labeling", filter=None):
         if not exp.isValid():
             label=''
         else:
-            label = _expressionConverter.walkExpression(exp.rootNode())
+            label = walkExpression(exp.rootNode(), current().layer)
     except UnsupportedExpressionException as e:
-        _warnings.append(str(e))
+        current().warnings.append(str(e))
         label = ""
     symbolizer.update({"color": color,
                        "font": font,
@@ -377,7 +367,7 @@ def andFilter(f1, f2):
         return f2
     if f2 is None:
         return f1
-    return ['And', f1, f2]
+    return ['And'] + logicalOperands('And', f1) + logicalOperands('And', f2)
 
 
 def processRule(rule, filters=None,layerOpacity=1,layer=None):
@@ -430,11 +420,11 @@ def processExpression(expstr):
     try:
         if expstr:
             exp = QgsExpression(expstr)
-            return _expressionConverter.walkExpression(exp.rootNode())
+            return walkExpression(exp.rootNode(), current().layer)
         else:
             return None
     except UnsupportedExpressionException as e:
-        _warnings.append(str(e))
+        current().warnings.append(str(e))
         return None
 
 
@@ -466,7 +456,7 @@ def _handleUnits(value, units, propertyConstant=None):
             return float(value) * MM2PIXEL
     elif units == "RenderMetersInMapUnits":
         if isinstance(value, list):
-            _warnings.append(
+            current().warnings.append(
                 "Cannot render in map units when using a data-defined size value: '%s'" % str(value))
             return value
         else:
@@ -474,7 +464,7 @@ def _handleUnits(value, units, propertyConstant=None):
     elif units in ["Pixel", QgsUnitTypes.RenderMillimeters]:
         return value
     else:
-        _warnings.append("Unsupported units: '%s'" % units)
+        current().warnings.append("Unsupported units: '%s'" % units)
         return value
 
 
@@ -571,7 +561,7 @@ def _createSymbolizer(sl, opacity):
         symbolizer = _fontMarkerSymbolizer(sl, opacity)
 
     if symbolizer is None:
-        _warnings.append("Symbol layer type not supported: '%s'" %
+        current().warnings.append("Symbol layer type not supported: '%s'" %
                          sl.__class__.__name__)
     return symbolizer
 
@@ -738,10 +728,9 @@ def _markGraphic(sl):
     spriteName = ""
     try:
         path = sl.path()
-        global _usedIcons, _usedSprites
         spriteName = os.path.basename(path)
-        _usedIcons[sl.path()] = sl
-        _usedSprites[spriteName] = _createSprite(sl)
+        current().usedIcons[sl.path()] = sl
+        current().usedSprites[spriteName] = _createSprite(sl)
         name = "file://" + os.path.basename(path)
         outlineStyle = "solid"
         size = _symbolProperty(sl, "size", QgsSymbolLayer.PropertyWidth)
@@ -755,7 +744,7 @@ def _markGraphic(sl):
         spriteName = name.replace(":", "_").replace("/", "_")
         spriteName = spriteName + "-{0}-{1}-{2}-{3}-{4}" \
                 .format(color, fillOpacity, outlineColor, strokeOpacity, outlineWidth)
-        _usedSprites[spriteName] = _createSprite(sl)
+        current().usedSprites[spriteName] = _createSprite(sl)
 
 
     mark = {"kind": "Mark",
@@ -792,8 +781,7 @@ def _markFillPattern(shape, color, size=FIXED_PATTERN_SIZE, strokeWidth=1, rotat
 
 
 def _iconGraphic(sl, color=None):
-    global _usedIcons
-    _usedIcons[sl.path()] = sl
+    current().usedIcons[sl.path()] = sl
     path = os.path.basename(sl.path())
     size = _symbolProperty(sl, "size", QgsSymbolLayer.PropertySize)
     return {"kind": "Icon",
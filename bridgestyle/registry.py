@@ -0,0 +1,142 @@
+"""
+Registry of the style formats that bridgestyle can convert.
+
+Formats are registered by file extension and point to a package with the
+same layout as the ones in bridgestyle: a 'togeostyler' and/or a
+'fromgeostyler' module, each with a 'convert' function, or 'toGeostyler'
+and 'fromGeostyler' functions in the package itself.
+
+Formats that can only be written, like MapServer mapfiles, are registered
+with readable=False.
+
+Nothing is imported when a format is registered. Each module is loaded the
+first time it is needed, so converting from geostyler to SLD does not load
+any of the other formats.
+
+Other packages can add formats through the 'bridgestyle.formats' entry
+point group. The name of the entry point is the file extension and its
+value is the name of the package, for instance:
+
+    entry_points={"bridgestyle.formats": ["ysld = mypackage.ysld"]}
+"""
+import importlib
+import importlib.util
+
+ENTRY_POINT_GROUP = "bridgestyle.formats"
+
+
+class StyleFormat:
+    def __init__(self, name, package, readable=True):
+        self.name = name
+        self.package = package
+        self.readable = readable
+        self._modules = {}
+
+    def _module(self, name):
+        # returns the togeostyler/fromgeostyler module of the package, or
+        # None if it does not have one
+        if name not in self._modules:
+            fullname = "%s.%s" % (self.package, name)
+            if importlib.util.find_spec(fullname) is not None:
+                self._modules[name] = importlib.import_module(fullname)
+            else:
+                self._modules[name] = None
+        return self._modules[name]
+
+    def load(self):
+        """Loads all the modules of the format"""
+        importlib.import_module(self.package)
+        self._module("togeostyler")
+        self._module("fromgeostyler")
+
+    def toGeostyler(self, style):
+        return importlib.import_module(self.package).toGeostyler(style)
+
+    def fromGeostyler(self, geostyler):
+        """
+        Converts a geostyler object into this format. Returns the converted
+        style and a list of warnings.
+        """
+        module = self._module("fromgeostyler")
+        if module is not None:
+            # the fromGeostyler function in the package only returns the
+            # style, so we use the module to keep the warnings as well.
+            # Warnings are always the last returned element.
+            result = module.convert(geostyler)
+            return result[0], result[-1]
+        return importlib.import_module(self.package).fromGeostyler(geostyler), []
+
+    def fromGeostylerFunction(self):
+        """
+        Returns the convert function of the fromgeostyler module of this
+        format, or None if it does not have one.
+        """
+        module = self._module("fromgeostyler")
+        return module.convert if module is not None else None
+
+
+_formats = {}
+_entryPointsLoaded = False
+
+
+def register(ext, package, readable=True):
+    """
+    Registers a format for the given file extension, implemented in the
+    given package (which is not imported until needed). If readable is
+    False, styles can only be converted into it.
+    """
+    _formats[ext] = StyleFormat(ext, package, readable)
+
+
+def _entryPoints():
+    from importlib import metadata
+
+    eps = metadata.entry_points()
+    if hasattr(eps, "select"):
+        return eps.select(group=ENTRY_POINT_GROUP)
+    return eps.get(ENTRY_POINT_GROUP, [])
+
+
+def _loadEntryPoints():
+    # scanning the installed distributions is not free, so it is only done
+    # when a format that is not built-in is requested
+    global _entryPointsLoaded
+    if _entryPointsLoaded:
+        return
+    _entryPointsLoaded = True
+    try:
+        entryPoints = _entryPoints()
+    except Exception:
+        return
+    for ep in entryPoints:
+        if ep.name not in _formats:
+            register(ep.name, ep.value)
+
+
+def get(ext):
+    """Returns the StyleFormat for the given extension, or None if not supported"""
+    if ext not in _formats:
+        _loadEntryPoints()
+    return _formats.get(ext)
+
+
+def isSupported(ext):
+    return get(ext) is not None
+
+
+def isReadable(ext):
+    """Returns True if styles in the format with the given extension can be read"""
+    styleFormat = get(ext)
+    return styleFormat is not None and styleFormat.readable
+
+
+def formats():
+    """Returns a dict with all the available formats, keyed by extension"""
+    _loadEntryPoints()
+    return dict(_formats)
+
+
+register("geostyler", "bridgestyle.geostyler")
+register("sld", "bridgestyle.sld")
+register("mapbox", "bridgestyle.mapboxgl")
+register("mapserver", "bridgestyle.mapserver", readable=False)
@@ -0,0 +1,323 @@
+"""
+A small local conversion service.
+
+It keeps the converters loaded between requests, so each conversion does
+not pay the cost of starting a process and importing the format modules.
+Identical requests that arrive while the same conversion is running are
+served with the result of that conversion instead of running it again.
+
+Endpoints:
+
+    POST /convert   body: {"from": "geostyler", "to": "sld", "style": ...}
+                    response: {"style": "...", "warnings": [...]}
+                    or {"error": "..."} with a 400 status code
+    GET /stats      latency and throughput counters
+    GET /health     returns {"status": "ok"}
+
+It can listen on a TCP port (only on localhost by default) or on a Unix
+socket.
+"""
+import os
+import sys
+import json
+import stat
+import time
+import hashlib
+import argparse
+import threading
+import socketserver
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bridgestyle import style2style
+from bridgestyle import registry
+
+MAX_BODY_SIZE = 64 * 1024 * 1024
+_LATENCY_SAMPLES = 1000
+
+_warmupStyle = {
+    "name": "warmup",
+    "rules": [
+        {
+            "name": "warmup",
+            "filter": ["PropertyIsEqualTo", ["PropertyName", "a"], 1],
+            "symbolizers": [
+                {"kind": "Line", "color": "#000000", "width": 1, "opacity": 1.0, "Z": 0}
+            ],
+        }
+    ],
+}
+
+
+class _Pending:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ConversionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.conversions = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.totalTime = 0.0
+        self.maxTime = 0.0
+        self._latencies = deque(maxlen=_LATENCY_SAMPLES)
+
+    def addRequest(self, elapsed, error=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.totalTime += elapsed
+            self.maxTime = max(self.maxTime, elapsed)
+            self._latencies.append(elapsed)
+
+    def addConversion(self):
+        with self._lock:
+            self.conversions += 1
+
+    def addCoalesced(self):
+        with self._lock:
+            self.coalesced += 1
+
+    def asDict(self):
+        with self._lock:
+            uptime = time.time() - self.started
+            latencies = sorted(self._latencies)
+
+            def _percentile(p):
+                if not latencies:
+                    return None
+                return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+            return {
+                "uptime": uptime,
+                "requests": self.requests,
+                "conversions": self.conversions,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "requestsPerSecond": self.requests / uptime if uptime else 0,
+                "latency": {
+                    "mean": self.totalTime / self.requests if self.requests else None,
+                    "max": self.maxTime,
+                    "p50": _percentile(0.5),
+                    "p95": _percentile(0.95),
+                    "p99": _percentile(0.99),
+                },
+            }
+
+
+class ConversionService:
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.stats = ConversionStats()
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def warmup(self):
+        """
+        Loads all the format modules and runs a small conversion to each
+        format, so the first request does not pay for it.
+        """
+        for ext, styleFormat in registry.formats().items():
+            try:
+                styleFormat.load()
+                style2style.convertGeostyler(_warmupStyle, ext)
+            except Exception:
+                pass
+
+    def _convert(self, fromFormat, toFormat, style):
+        if isinstance(style, str):
+            return style2style.convertStyle(style, fromFormat, toFormat, self.cache)
+        elif fromFormat == "geostyler":
+            return style2style.convertGeostyler(style, toFormat, self.cache)
+        else:
+            raise ValueError("Style must be a string for '%s' requests" % fromFormat)
+
+    @staticmethod
+    def _key(fromFormat, toFormat, style):
+        if not isinstance(style, str):
+            style = json.dumps(style, sort_keys=True)
+        h = hashlib.sha256()
+        for s in [fromFormat, toFormat, style]:
+            h.update(str(s).encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def convert(self, fromFormat, toFormat, style):
+        """
+        Converts a style, returning the converted string and the list of
+        warnings. If the same conversion is already running, waits for it
+        and returns its result.
+        """
+        key = self._key(fromFormat, toFormat, style)
+        with self._lock:
+            pending = self._inflight.get(key)
+            leader = pending is None
+            if leader:
+                pending = _Pending()
+                self._inflight[key] = pending
+        if leader:
+            try:
+                pending.result = self._convert(fromFormat, toFormat, style)
+                self.stats.addConversion()
+            except Exception as e:
+                pending.error = e
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+                pending.event.set()
+        else:
+            self.stats.addCoalesced()
+            pending.event.wait()
+        if pending.error is not None:
+            raise pending.error
+        converted, warnings = pending.result
+        return converted, list(warnings)
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # client_address is not a (host, port) tuple for Unix sockets
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return str(self.client_address or "unix")
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send(200, self.server.service.stats.asDict())
+        elif self.path == "/health":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"error": "Not found: %s" % self.path})
+
+    def do_POST(self):
+        if self.path != "/convert":
+            self._send(404, {"error": "Not found: %s" % self.path})
+            return
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY_SIZE:
+            self.close_connection = True
+            self._send(413, {"error": "Invalid or too large request body"})
+            return
+        body = self.rfile.read(length)
+        try:
+            request = json.loads(body)
+            converted, warnings = self.server.service.convert(
+                request["from"], request["to"], request["style"])
+            status, response = 200, {"style": converted, "warnings": warnings}
+        except Exception as e:
+            status, response = 400, {"error": "%s: %s" % (e.__class__.__name__, e)}
+        self.server.service.stats.addRequest(time.perf_counter() - start, status != 200)
+        self._send(status, response)
+
+
+class _ServerMixin:
+    daemon_threads = True
+    # the default backlog of 5 drops connections when many clients
+    # connect at once
+    request_queue_size = 128
+    verbose = False
+    service = None
+
+
+class ConversionHTTPServer(_ServerMixin, ThreadingHTTPServer):
+    pass
+
+
+class UnixConversionHTTPServer(_ServerMixin, socketserver.ThreadingMixIn,
+                               socketserver.UnixStreamServer):
+    pass
+
+
+def _isSocket(path):
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+def createServer(service=None, host="127.0.0.1", port=8765, socketPath=None, verbose=False):
+    """
+    Creates a server for the given conversion service (a new one, warmed up,
+    if not passed). If socketPath is passed, it listens on that Unix socket
+    instead of on host:port, replacing the socket if it already exists
+    (ValueError is raised if the path is another kind of file). Call
+    serve_forever() on the returned object to start serving.
+    """
+    if service is None:
+        service = ConversionService()
+        service.warmup()
+    if socketPath is not None:
+        if os.path.exists(socketPath):
+            # a leftover socket from an earlier run, but never another file
+            if not _isSocket(socketPath):
+                raise ValueError("Not a socket, will not replace it: '%s'" % socketPath)
+            os.remove(socketPath)
+        server = UnixConversionHTTPServer(socketPath, ConversionRequestHandler)
+    else:
+        server = ConversionHTTPServer((host, port), ConversionRequestHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bridgestyle-service",
+                                     description="Runs a local style conversion service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", dest="socketPath", help="Listen on this Unix socket instead")
+    parser.add_argument("--verbose", action="store_true", help="Log each request")
+    parser.add_argument("--cache", metavar="FOLDER",
+                        help="Also cache conversion results on disk, in this folder")
+    args = parser.parse_args()
+
+    service = ConversionService()
+    if args.cache is not None:
+        from bridgestyle.cache import ConversionCache
+        service.cache = ConversionCache(args.cache)
+    service.warmup()
+    try:
+        server = createServer(service, host=args.host, port=args.port,
+                              socketPath=args.socketPath, verbose=args.verbose)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print("Listening on %s" % (args.socketPath or "http://%s:%i" % (args.host, args.port)),
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socketPath is not None and _isSocket(args.socketPath):
+            os.remove(args.socketPath)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
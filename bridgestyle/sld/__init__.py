@@ -1,11 +1,20 @@
-from . import togeostyler
-from . import fromgeostyler
+import importlib
+
+
+def __getattr__(name):
+    # togeostyler and fromgeostyler are only imported when first used, so
+    # importing the package does not load all the converters
+    if name in ("togeostyler", "fromgeostyler"):
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 def toGeostyler(style):
+    from . import togeostyler
     return togeostyler.convert(style)  # TODO
 
 
 def fromGeostyler(style):
+    from . import fromgeostyler
     sld, warnings = fromgeostyler.convert(style)
     return sld
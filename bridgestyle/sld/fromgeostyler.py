@@ -1,13 +1,12 @@
 import os
 from xml.etree.ElementTree import Element, SubElement
-from xml.etree import ElementTree
-from xml.dom import minidom
 from .transformations import processTransformation
+from ..conversioncontext import conversionContext, current
+from ..geostyler.legacy import expandIn
+from ..geostyler.rules import RuleInfo, analyzeRules
 
 import zipfile
 
-_warnings = []
-
 # return a dictionary<int,list of rules>, where int is the Z value
 # symbolizers are marked with a Z
 #
@@ -34,9 +33,66 @@ def processRulesByZ(rules):
     return result
 
 
-def convert(geostyler):
-    global _warnings
-    _warnings = []
+def convert(geostyler, prune=False):
+    """
+    Converts a geostyler style. If prune is True, the rules and symbolizers
+    that draw nothing are left out (see geostyler.pruning).
+    """
+    with conversionContext():
+        return finish(geostyler, [processRuleInfo(info) for info in analyzeRules(geostyler, prune=prune)])
+
+
+# depth of the Rule elements in the SLD document
+_RULE_DEPTH = 4
+
+
+class _SerializedElement(Element):
+    # An element that has already been written as XML, so the tree below it
+    # does not have to be kept in memory until the whole document is written
+
+    def __init__(self, element, depth):
+        super().__init__(element.tag)
+        self.xml = _writeXml(element, depth)
+        self.depth = depth
+
+
+class _ExpressionElement(Element):
+    # The translation of an expression, which is shared by all the places
+    # where the expression is used (see geostyler.expressions). Once it has
+    # been written twice with the same indentation, its XML is kept, so it
+    # is not generated again for the following ones. written maps each
+    # indentation to its XML, or to None if it has only been written once.
+    written = None
+
+
+class _Recording:
+    # marks the end of the XML of an element whose XML is being kept
+    __slots__ = ["element", "pad", "start"]
+
+    def __init__(self, element, pad, start):
+        self.element = element
+        self.pad = pad
+        self.start = start
+
+
+def processRuleInfo(info, geostyler=None):
+    """
+    Converts a rule, given its RuleInfo. Returns a list of (Z, Rule element)
+    tuples, with a Rule element for each symbolizer. Rule elements are
+    written as XML right away, so they can only be used in the document
+    created by finish.
+    """
+    filterElement = _filterElement(info.filter)
+    return [(z, _SerializedElement(_ruleElement(str(info.name) + ", Z=" + str(z),
+                                                filterElement, info, [sl]), _RULE_DEPTH))
+            for z, sl in info.symbolizers]
+
+
+def finish(geostyler, processedRules):
+    """
+    Creates the SLD document from the results of processRuleInfo for all
+    the rules of the style. Returns the SLD string and the list of warnings.
+    """
     attribs = {
         "version": "1.0.0",
         "xsi:schemaLocation": "http://www.opengis.net/sld StyledLayerDescriptor.xsd",
@@ -46,7 +102,10 @@ def convert(geostyler):
         "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
     }
 
-    rulesByZ = processRulesByZ(geostyler["rules"])
+    rulesByZ = {}
+    for ruleElements in processedRules:
+        for z, ruleElement in ruleElements:
+            rulesByZ.setdefault(z, []).append(ruleElement)
 
     root = Element("StyledLayerDescriptor", attrib=attribs)
     namedLayer = SubElement(root, "NamedLayer")
@@ -63,41 +122,136 @@ def convert(geostyler):
         featureTypeStyle = SubElement(userStyle, "FeatureTypeStyle")
         if "transformation" in geostyler:
             featureTypeStyle.append(processTransformation(geostyler["transformation"]))
-        for rule in zrules:
-            featureTypeStyle.append(processRule(rule))
+        featureTypeStyle.extend(zrules)
         if "blendMode" in geostyler:
             _addVendorOption(featureTypeStyle, "composite", geostyler["blendMode"])
 
-    sldstring = ElementTree.tostring(root, encoding="utf8", method="xml").decode()
-    dom = minidom.parseString(sldstring)
-    result = dom.toprettyxml(indent="  "), _warnings
-    return result
+    return _prettyXml(root), current().warnings
+
+
+def _escapeXml(data):
+    return (data.replace("&", "&amp;").replace("<", "&lt;")
+            .replace("\"", "&quot;").replace(">", "&gt;"))
+
+
+def _normalizeNewlines(text):
+    # an XML parser would turn these into a single \n
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+# deepest indentation. Elements nested deeper, as in long filter chains, are
+# not indented further, so the size of the document does not grow with the
+# square of their depth
+_MAX_INDENT_DEPTH = 64
+
+
+def _prettyXml(root, indent="  "):
+    # Writes the element tree as an indented XML string. The output is the
+    # same that we would get serializing the tree and pretty-printing it with
+    # minidom, but without building the intermediate string and DOM, and
+    # without recursion, so deeply nested filters can be written.
+    return '<?xml version="1.0" ?>\n' + _writeXml(root, 0, indent)
+
+
+def _writeXml(root, depth=0, indent="  "):
+    parts = []
+    write = parts.append
+    stack = [(root, depth)]
+    while stack:
+        node, depth = stack.pop()
+        pad = indent * min(depth, _MAX_INDENT_DEPTH)
+        if isinstance(node, _SerializedElement):
+            if node.depth != depth:
+                raise ValueError("Element written at depth %i used at depth %i"
+                                 % (node.depth, depth))
+            write(node.xml)
+            continue
+        if isinstance(node, str):
+            # closing tag
+            write("%s</%s>\n" % (pad, node))
+            continue
+        if isinstance(node, tuple):
+            # text between elements
+            write(_escapeXml(pad + _normalizeNewlines(node[0]) + "\n"))
+            continue
+        if isinstance(node, _Recording):
+            node.element.written[node.pad] = "".join(parts[node.start:])
+            continue
+        recording = None
+        if isinstance(node, _ExpressionElement):
+            written = node.written
+            if written is None:
+                node.written = {pad: None}
+            elif written.get(pad) is not None:
+                write(written[pad])
+                continue
+            elif pad in written:
+                recording = _Recording(node, pad, len(parts))
+            else:
+                written[pad] = None
+        write(pad + "<" + node.tag)
+        # namespace declarations go first, as in a namespace-aware DOM
+        attribs = sorted(node.attrib.items(),
+                         key=lambda item: not (item[0] == "xmlns" or item[0].startswith("xmlns:")))
+        for name, value in attribs:
+            write(' %s="%s"' % (name, _escapeXml(str(value))))
+        text = str(node.text) if node.text is not None else ""
+        if len(node) == 0:
+            if text:
+                write(">%s</%s>\n" % (_escapeXml(_normalizeNewlines(text)), node.tag))
+            else:
+                write("/>\n")
+            if recording is not None:
+                node.written[pad] = "".join(parts[recording.start:])
+            continue
+        write(">\n")
+        children = []
+        if text:
+            children.append((text,))
+        for child in node:
+            children.append(child)
+            if child.tail:
+                children.append((child.tail,))
+        if recording is not None:
+            stack.append((recording, depth))
+        stack.append((node.tag, depth))
+        stack.extend((child, depth + 1) for child in reversed(children))
+    return "".join(parts)
 
 
 def processRule(rule):
+    info = RuleInfo(rule)
+    return _ruleElement(rule.get("name", ""), _filterElement(info.filter), info,
+                        rule["symbolizers"])
+
+
+def _filterElement(ruleFilter):
+    if ruleFilter == "ELSE":
+        return Element("ElseFilter")
+    filt = convertExpression(ruleFilter)
+    if filt is not None:
+        filterElement = Element("ogc:Filter")
+        filterElement.append(filt)
+        return filterElement
+    return None
+
+
+def _ruleElement(name, filterElement, info, symbolizers):
+    # filterElement can be shared by several rules, since elements are not
+    # modified once created
     ruleElement = Element("Rule")
     ruleName = SubElement(ruleElement, "Name")
-    ruleName.text = rule.get("name", "")
+    ruleName.text = name
 
-    ruleFilter = rule.get("filter", None)
-    if ruleFilter == "ELSE":
-        filterElement = Element("ElseFilter")
+    if filterElement is not None:
         ruleElement.append(filterElement)
-    else:
-        filt = convertExpression(ruleFilter)
-        if filt is not None:
-            filterElement = Element("ogc:Filter")
-            filterElement.append(filt)
-            ruleElement.append(filterElement)
-    if "scaleDenominator" in rule:
-        scale = rule["scaleDenominator"]
-        if "min" in scale:
-            minScale = SubElement(ruleElement, "MinScaleDenominator")
-            minScale.text = str(scale["min"])
-        if "max" in scale:
-            maxScale = SubElement(ruleElement, "MaxScaleDenominator")
-            maxScale.text = str(scale["max"])
-    symbolizers = _createSymbolizers(rule["symbolizers"])
+    if info.minScale is not None:
+        minScale = SubElement(ruleElement, "MinScaleDenominator")
+        minScale.text = str(info.minScale)
+    if info.maxScale is not None:
+        maxScale = SubElement(ruleElement, "MaxScaleDenominator")
+        maxScale.text = str(info.maxScale)
+    symbolizers = _createSymbolizers(symbolizers)
     ruleElement.extend(symbolizers)
 
     return ruleElement
@@ -564,33 +718,60 @@ def convertExpression(exp, inFunction=False):
     if exp is None:
         return None
     elif isinstance(exp, list):
-        if exp[0] in operators and not (inFunction and exp[0] in operatorToFunction):
-            return handleOperator(exp)
-        else:
-            return handleFunction(exp)
+        # function arguments are translated differently, so they are a variant
+        return current().expressions.translateTree("sld", exp, _prepareList, _combineList,
+                                                   True if inFunction else None)
     else:
         return handleLiteral(exp)
 
 
-def handleOperator(exp):
+def _prepareList(exp, inFunction):
+    # returns the expression to write, whether it is written as a function,
+    # and its arguments to translate first, with their variant
+    if exp[0] == "In":
+        # there is no set membership operator in Filter Encoding 1.1
+        exp = expandIn(exp)
+    if exp[0] in operators and not (inFunction and exp[0] in operatorToFunction):
+        if exp[0] == "PropertyName":
+            return (exp, False), ()
+        return (exp, False), [(arg, None) for arg in exp[1:] if isinstance(arg, list)]
+    return (exp, True), [(arg, True) for arg in exp[1:] if isinstance(arg, list)]
+
+
+def _combineList(prepared, inFunction, translations):
+    exp, function = prepared
+    if function:
+        return handleFunction(exp, translations)
+    return handleOperator(exp, translations)
+
+
+def _appendArguments(elem, exp, translations, inFunction):
+    # translations are the ones of the arguments that are lists
+    translations = iter(translations)
+    for arg in exp[1:]:
+        if isinstance(arg, list):
+            elem.append(next(translations))
+        else:
+            elem.append(convertExpression(arg, inFunction))
+
+
+def handleOperator(exp, translations):
     name = exp[0]
-    elem = Element("ogc:" + name)
+    elem = _ExpressionElement("ogc:" + name)
     if name == "PropertyIsLike":
         elem.attrib["wildCard"] = "%"
     if name == "PropertyName":
         elem.text = exp[1]
     else:
-        for operand in exp[1:]:
-            elem.append(convertExpression(operand))
+        _appendArguments(elem, exp, translations, False)
     return elem
 
 
-def handleFunction(exp):
+def handleFunction(exp, translations):
     name = operatorToFunction.get(exp[0], exp[0])
-    elem = Element("ogc:Function", name=name)
+    elem = _ExpressionElement("ogc:Function", name=name)
     if len(exp) > 1:
-        for arg in exp[1:]:
-            elem.append(convertExpression(arg, True))
+        _appendArguments(elem, exp, translations, True)
     return elem
 
 
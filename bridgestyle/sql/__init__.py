@@ -0,0 +1,15 @@
+"""
+Translation of the filters of geostyler styles into SQL WHERE clauses, so
+that datasources only return the features of each rule (see
+fromgeostyler), removal of the rules that no feature of a table uses (see
+pruning), and classification of the features of a table by the rules
+that apply to them (see classification).
+"""
+import importlib
+
+
+def __getattr__(name):
+    # modules are only imported when first used, like the converters
+    if name in ("fromgeostyler", "pruning", "classification"):
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
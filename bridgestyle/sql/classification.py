@@ -0,0 +1,373 @@
+"""
+Classification of the features of a table by the rules of a geostyler
+style that apply to them.
+
+Evaluating the filters of a style for every feature is slow when there are
+many rules, or complex ones. classify() evaluates them once, for all the
+features of an SQLite table (or a GeoPackage layer), and writes the class
+of each feature to a column, so that the server only has to compare it:
+
+    style, warnings = classify(geostyler, "roads.gpkg", "roads")
+
+Each class is a combination of rules that apply to a feature, and its
+number is written to the "style_class" column (or the one passed), which
+is added to the table if needed. Class 0 has the features that no rule
+applies to. The style returned has the same rules, with filters that
+compare that column ("style_class" = 3, or In if the features of several
+classes have the rule), except the ones that no feature has, which are
+removed. It can be converted to SLD, Mapbox GL or MapServer as usual. Rules without filter, ELSE rules, and rules whose
+filter cannot be evaluated (see geostyler.evaluator) or uses columns the
+table does not have, keep their filter. Scale ranges are not changed, so
+the style draws the same features at every scale.
+
+Passing the name of a side table writes the classes there instead, with
+the primary key of each feature, to join them to the table, which is not
+modified.
+
+Features are read in batches, in the order of their primary key, and the
+classes of each batch are written in a transaction, so a classification
+that stops can be resumed by calling classify again, which starts after
+the last feature written. Features added later are classified the same
+way. Features that are modified, or a modified style, need restart=True,
+which classifies all the features again. Two tables, named after the
+table and the column, keep the filters of the rules that were classified
+("roads_style_class_rules"), and the rules of each class
+("roads_style_class_classes", with the indices of the rules as a JSON
+list).
+
+NumPy is needed to use this module (the numpy extra of the package).
+"""
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from ..geostyler.evaluator import (RuleEvaluator, UnsupportedExpressionException,
+                                   compileExpression)
+from ..geostyler.optimizer import Optimizer
+from .fromgeostyler import quoteIdentifier
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+def _connect(database):
+    if isinstance(database, sqlite3.Connection):
+        return database, False
+    if not os.path.exists(database):
+        raise ValueError("Database not found: '%s'" % database)
+    return sqlite3.connect(database), True
+
+
+# functions of the R-tree triggers of GeoPackage layers, which SQLite needs
+# to update them even if they are only called when a key changes
+_GEOPACKAGE_FUNCTIONS = ["ST_IsEmpty", "ST_MinX", "ST_MaxX", "ST_MinY", "ST_MaxY"]
+
+
+def _geometryFunction(name):
+    def function(geometry):
+        raise sqlite3.NotSupportedError(
+            "%s is not available: GeoPackage geometries cannot be updated here" % name)
+    return function
+
+
+def _addGeoPackageFunctions(connection):
+    # classes are written without changing the keys or geometries, so the
+    # triggers that call these functions do not run. If they did, the
+    # update would fail, instead of leaving the R-tree out of date
+    for name in _GEOPACKAGE_FUNCTIONS:
+        try:
+            connection.execute("SELECT %s(NULL)" % name)
+        except sqlite3.OperationalError:
+            connection.create_function(name, 1, _geometryFunction(name))
+
+
+def _tableInfo(connection, table):
+    # names of the columns of a table, and its integer primary key
+    info = list(connection.execute("PRAGMA table_info(%s)" % quoteIdentifier(table)))
+    if not info:
+        raise ValueError("Table not found: '%s'" % table)
+    keys = [row for row in info if row[5]]
+    if len(keys) == 1 and keys[0][2].upper() == "INTEGER":
+        key = keys[0][1]
+    else:
+        key = "rowid"
+    return [row[1] for row in info], key
+
+
+def _classifiedRules(geostyler, columns, warnings):
+    # (index, rule) of the rules whose filters are evaluated
+    optimizer = Optimizer()
+    available = {name.lower() for name in columns}
+    rules = []
+    for i, rule in enumerate(geostyler.get("rules", [])):
+        ruleFilter = rule.get("filter")
+        if not isinstance(ruleFilter, list):
+            continue
+        name = rule.get("name", "")
+        try:
+            optimized = optimizer.expression(ruleFilter)
+            attributes = (compileExpression(optimized).attributes
+                          if isinstance(optimized, list) else set())
+        except UnsupportedExpressionException as e:
+            warnings.append("Rule '%s' not classified: %s" % (name, e))
+            continue
+        missing = sorted(str(a) for a in attributes if str(a).lower() not in available)
+        if missing:
+            warnings.append("Rule '%s' not classified: the table has no %s"
+                            % (name, ", ".join(missing)))
+            continue
+        rules.append((i, rule))
+    return rules
+
+
+def _array(values):
+    # the values of a column of a batch, with the type NumPy would give
+    # them, unless they have NULLs or values of several types
+    types = set(map(type, values))
+    if types and types <= {int, float}:
+        return numpy.array(values)
+    if types == {str}:
+        return numpy.array(values, dtype=str)
+    array = numpy.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class _Tables:
+    """Names of the tables and columns of a classification"""
+
+    def __init__(self, table, column, sideTable):
+        self.columnName = column
+        self.table = quoteIdentifier(table)
+        self.column = quoteIdentifier(column)
+        self.side = None if sideTable is None else quoteIdentifier(sideTable)
+        self.rules = quoteIdentifier("%s_%s_rules" % (table, column))
+        self.classes = quoteIdentifier("%s_%s_classes" % (table, column))
+
+
+def _prepare(connection, tables, columns, key, classified, restart):
+    # creates the tables, or checks those of a previous classification.
+    # Returns the known classes, as a dict of rule indices -> class
+    with connection:
+        if tables.side is None and tables.columnName.lower() not in {
+                c.lower() for c in columns}:
+            connection.execute("ALTER TABLE %s ADD COLUMN %s INTEGER"
+                               % (tables.table, tables.column))
+        if tables.side is not None:
+            connection.execute("CREATE TABLE IF NOT EXISTS %s (%s INTEGER PRIMARY KEY, %s INTEGER)"
+                               % (tables.side, quoteIdentifier(key if key != "rowid" else "fid"),
+                                  tables.column))
+        connection.execute("CREATE TABLE IF NOT EXISTS %s (rule INTEGER PRIMARY KEY, "
+                           "name TEXT, filter TEXT)" % tables.rules)
+        connection.execute("CREATE TABLE IF NOT EXISTS %s (%s INTEGER PRIMARY KEY, rules TEXT)"
+                           % (tables.classes, tables.column))
+        rules = [(i, rule.get("name"), json.dumps(rule["filter"])) for i, rule in classified]
+        stored = list(connection.execute("SELECT rule, name, filter FROM %s ORDER BY rule"
+                                          % tables.rules))
+        started = connection.execute("SELECT 1 FROM %s" % tables.classes).fetchone()
+        if started and stored != rules and not restart:
+            raise ValueError("The rules of the style are not the ones the features were "
+                             "classified with. Pass restart=True to classify them again")
+        if restart or not started or stored != rules:
+            if tables.side is None:
+                connection.execute("UPDATE %s SET %s = NULL" % (tables.table, tables.column))
+            else:
+                connection.execute("DELETE FROM %s" % tables.side)
+            connection.execute("DELETE FROM %s" % tables.rules)
+            connection.execute("DELETE FROM %s" % tables.classes)
+            connection.executemany("INSERT INTO %s VALUES (?, ?, ?)" % tables.rules, rules)
+            connection.execute("INSERT INTO %s VALUES (0, '[]')" % tables.classes)
+    return {tuple(json.loads(rules)): c for c, rules in connection.execute(
+        "SELECT %s, rules FROM %s" % (tables.column, tables.classes))}
+
+
+def _lastKey(connection, tables, key):
+    if tables.side is None:
+        sql = "SELECT MAX(%s) FROM %s WHERE %s IS NOT NULL" % (
+            quoteIdentifier(key) if key != "rowid" else key, tables.table, tables.column)
+    else:
+        sql = "SELECT MAX(%s) FROM %s" % (
+            quoteIdentifier(key if key != "rowid" else "fid"), tables.side)
+    return connection.execute(sql).fetchone()[0]
+
+
+def _batchClasses(matches, indices, classes, packedClasses, newClasses):
+    # the class of each feature, from the rules that apply to it (a row of
+    # matches for each rule). Combinations of rules are found by their bits
+    # in packedClasses, and get a new class if they have none
+    size = matches.shape[1]
+    if not len(indices):
+        return numpy.zeros(size, dtype=numpy.int64)
+    # transposed before packing, which is faster than packing the columns
+    packed = numpy.packbits(numpy.ascontiguousarray(matches.T), axis=1)
+    combinations = packed.view(numpy.dtype((numpy.void, packed.shape[1]))).ravel()
+    uniques, first, inverse = numpy.unique(combinations, return_index=True,
+                                           return_inverse=True)
+    uniqueClasses = numpy.empty(len(uniques), dtype=numpy.int64)
+    # new classes are numbered in the order of their first feature
+    keys = uniques.tolist()
+    for u in numpy.argsort(first).tolist():
+        key = keys[u]
+        if key not in packedClasses:
+            bits = numpy.unpackbits(numpy.frombuffer(key, dtype=numpy.uint8))
+            rules = tuple(indices[r] for r in numpy.flatnonzero(bits[:len(indices)]).tolist())
+            if rules not in classes:
+                classes[rules] = len(classes)
+                newClasses.append((classes[rules], json.dumps(list(rules))))
+            packedClasses[key] = classes[rules]
+        uniqueClasses[u] = packedClasses[key]
+    return uniqueClasses[inverse.ravel()]
+
+
+def _classifyRows(connection, tables, key, classified, classes, batchSize):
+    indices = [i for i, rule in classified]
+    rules = [rule for i, rule in classified]
+    evaluator = RuleEvaluator({"rules": rules})
+    attributes = set()
+    for ruleFilter in evaluator.filters:
+        if not isinstance(ruleFilter, (bool, str)):
+            attributes.update(ruleFilter.attributes)
+    attributes = sorted(attributes, key=str)
+    keyName = quoteIdentifier(key) if key != "rowid" else key
+    select = "SELECT %s FROM %s WHERE %s > ? ORDER BY %s LIMIT %i" % (
+        ", ".join([keyName] + [quoteIdentifier(a) for a in attributes]),
+        tables.table, keyName, keyName, batchSize)
+    if tables.side is None:
+        write = "UPDATE %s SET %s = ? WHERE %s = ?" % (tables.table, tables.column, keyName)
+    else:
+        write = "INSERT INTO %s VALUES (?, ?)" % tables.side
+    last = _lastKey(connection, tables, key)
+    packedClasses = {}
+    count = 0
+    while True:
+        rows = connection.execute(select, (-math.inf if last is None else last,)).fetchall()
+        if not rows:
+            return count
+        values = list(zip(*rows))
+        keys = values[0]
+        columns = {a: _array(v) for a, v in zip(attributes, values[1:])}
+        newClasses = []
+        batchClasses = _batchClasses(evaluator.matches(columns, size=len(rows)), indices,
+                                     classes, packedClasses, newClasses).tolist()
+        with connection:
+            connection.executemany("INSERT INTO %s VALUES (?, ?)" % tables.classes,
+                                   newClasses)
+            if tables.side is None:
+                connection.executemany(write, zip(batchClasses, keys))
+            else:
+                connection.executemany(write, zip(keys, batchClasses))
+        count += len(rows)
+        last = keys[-1]
+
+
+def classifiedStyle(geostyler, classes, column="style_class", classifiedRules=None):
+    """
+    Returns a copy of a geostyler style whose filters compare the class
+    column, given the classes as a dict of tuples of rule indices -> class.
+    Only the rules with the passed indices (by default, those that have a
+    class) are changed. Those that no class has are removed, since they
+    apply to no feature.
+    """
+    ruleClasses = {}
+    for rules, c in classes.items():
+        for i in rules:
+            ruleClasses.setdefault(i, []).append(c)
+    if classifiedRules is None:
+        classifiedRules = set(ruleClasses)
+    prop = ["PropertyName", column]
+    style = type(geostyler)(geostyler)
+    style["rules"] = []
+    for i, rule in enumerate(geostyler.get("rules", [])):
+        if i in classifiedRules:
+            values = sorted(ruleClasses.get(i, []))
+            if not values:
+                continue
+            rule = type(rule)(rule)
+            if len(values) == 1:
+                rule["filter"] = ["PropertyIsEqualTo", prop, values[0]]
+            else:
+                rule["filter"] = ["In", prop] + values
+        style["rules"].append(rule)
+    return style
+
+
+def classify(geostyler, database, table, column="style_class", sideTable=None,
+             batchSize=DEFAULT_BATCH_SIZE, restart=False):
+    """
+    Writes the class of each feature of a table of an SQLite database (a
+    path or a connection), or of the features added since the last call,
+    and returns the style with filters that compare it, and the list of
+    warnings (see the module documentation).
+    """
+    connection, close = _connect(database)
+    warnings = []
+    try:
+        columns, key = _tableInfo(connection, table)
+        tables = _Tables(table, column, sideTable)
+        if sideTable is None:
+            _addGeoPackageFunctions(connection)
+        classified = _classifiedRules(geostyler, columns, warnings)
+        classes = _prepare(connection, tables, columns, key, classified, restart)
+        _classifyRows(connection, tables, key, classified, classes, batchSize)
+    finally:
+        if close:
+            connection.close()
+    return classifiedStyle(geostyler, classes, column, {i for i, rule in classified}), warnings
+
+
+def classifyFile(styleFile, database, table, output, column="style_class", sideTable=None,
+                 batchSize=DEFAULT_BATCH_SIZE, restart=False):
+    """
+    Classifies the features of a table with a geostyler style file, and
+    writes the style with filters that compare the classes. Returns the
+    list of warnings.
+    """
+    with open(styleFile) as f:
+        geostyler = json.load(f)
+    style, warnings = classify(geostyler, database, table, column, sideTable, batchSize,
+                               restart)
+    with open(output, "w") as f:
+        json.dump(style, f, indent=4)
+    return warnings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m bridgestyle.sql.classification",
+        description="Writes the class of each feature of an SQLite table or GeoPackage "
+        "layer, from the rules of a geostyler style, and the style with filters that "
+        "compare it")
+    parser.add_argument("style", help="Geostyler style file")
+    parser.add_argument("database", help="SQLite database or GeoPackage file")
+    parser.add_argument("table", help="Table or layer")
+    parser.add_argument("output", help="File to write the classified style to")
+    parser.add_argument("--column", default="style_class",
+                        help="Column to write the classes to (default: style_class)")
+    parser.add_argument("--side-table", metavar="TABLE",
+                        help="Write the classes to this table, instead of the layer")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, metavar="N",
+                        help="Number of features classified in each transaction")
+    parser.add_argument("--restart", action="store_true",
+                        help="Classify all the features again, instead of the ones "
+                        "without class")
+    args = parser.parse_args()
+    try:
+        warnings = classifyFile(args.style, args.database, args.table, args.output,
+                                args.column, args.side_table, args.batch_size, args.restart)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(e)
+        return 1
+    for w in warnings:
+        print("Warning: %s" % w)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+Translation of the filters of geostyler styles into SQL WHERE clauses.
+
+convert() returns, for each rule of a style, a WHERE clause that selects
+the features the rule applies to, and its parameters, so the filtering
+can be done by the datasource:
+
+    rules, warnings = convert(geostyler, dialect="sqlite")
+    for rule in rules:
+        sql = 'SELECT * FROM "roads"'
+        if rule["where"] is not None:
+            sql += " WHERE " + rule["where"]
+        rows = connection.execute(sql, rule["params"])
+
+Two dialects are supported: "sqlite", for SQLite databases and GeoPackage
+files, with ? placeholders, and "postgresql", with the %s placeholders of
+psycopg. createViews() returns CREATE VIEW statements with a view for each
+rule instead, with the values written in the statements, since views
+cannot have parameters.
+
+Filters use the semantics of QGIS, which most of them come from: LIKE is
+case sensitive (written as GLOB in SQLite), divisions are not rounded to
+integers, strSubstr takes a 1-based start and a length, and Concatenate
+ignores NULL values. The math functions need SQLite 3.35 or later, built
+with them, and strCapitalize is only supported in PostgreSQL.
+
+Filters with operators or functions that have no translation are not
+pushed down: the rule has no WHERE clause and "exact" is False, so its
+rows still have to be filtered, and a warning is added. ELSE rules select
+the rows that no other rule selects, at any scale.
+"""
+from ..conversioncontext import conversionContext, current
+from ..geostyler.rules import analyzeRules
+
+
+def _sqliteConcatenate(args):
+    return "(%s)" % " || ".join("COALESCE(%s, '')" % arg for arg in args)
+
+
+def _postgresqlConcatenate(args):
+    return "CONCAT(%s)" % ", ".join(args)
+
+
+class Dialect:
+    def __init__(self, name, placeholder, false, true, real, functions, concatenate,
+                 like):
+        self.name = name
+        self.placeholder = placeholder
+        # literals of the boolean values
+        self.false = false
+        self.true = true
+        # type that numbers are cast to, so divisions are not rounded
+        self.real = real
+        # geostyler function -> SQL function
+        self.functions = functions
+        self.concatenate = concatenate
+        # case sensitive pattern matching operator
+        self.like = like
+
+
+_FUNCTIONS = {
+    "strToLower": "lower",
+    "strToUpper": "upper",
+    "strReplace": "replace",
+    "strSubstr": "substr",
+    "floor": "floor",
+    "ceil": "ceil",
+    "toRadians": "radians",
+    "toDegrees": "degrees",
+    "acos": "acos",
+    "asin": "asin",
+    "atan": "atan",
+    "atan2": "atan2",
+    "sin": "sin",
+    "cos": "cos",
+    "tan": "tan",
+    "log": "ln",
+}
+
+DIALECTS = {
+    "sqlite": Dialect("sqlite", "?", "0", "1", "REAL",
+                      dict(_FUNCTIONS, min="min", max="max"),
+                      _sqliteConcatenate, "GLOB"),
+    "postgresql": Dialect("postgresql", "%s", "FALSE", "TRUE", "DOUBLE PRECISION",
+                          dict(_FUNCTIONS, min="LEAST", max="GREATEST",
+                               strCapitalize="initcap"),
+                          _postgresqlConcatenate, "LIKE"),
+}
+
+_OPERATORS = {
+    "PropertyIsEqualTo": "=",
+    "PropertyIsNotEqualTo": "<>",
+    "PropertyIsLessThanOrEqualTo": "<=",
+    "PropertyIsGreaterThanOrEqualTo": ">=",
+    "PropertyIsLessThan": "<",
+    "PropertyIsGreaterThan": ">",
+    "Add": "+",
+    "Sub": "-",
+    "Mul": "*",
+}
+
+# expressions with their own translation
+_EXPRESSIONS = ("PropertyName", "And", "Or", "Not", "In", "PropertyIsLike", "Div",
+                "Concatenate", "if_then_else")
+
+
+def _dialect(name):
+    try:
+        return DIALECTS[name]
+    except KeyError:
+        raise ValueError("Unsupported SQL dialect: '%s'" % name) from None
+
+
+def quoteIdentifier(name):
+    return '"%s"' % str(name).replace('"', '""')
+
+
+def quoteLiteral(value, dialect="sqlite"):
+    """Returns a value written as an SQL literal"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        dialect = _dialect(dialect)
+        return dialect.true if value else dialect.false
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'%s'" % str(value).replace("'", "''")
+
+
+def _globPattern(pattern):
+    # a LIKE pattern as a GLOB pattern, where * ? and [ are special
+    special = {"%": "*", "_": "?", "*": "[*]", "?": "[?]", "[": "[[]"}
+    return "".join(special.get(char, char) for char in pattern)
+
+
+def _literal(value, variant):
+    dialectName, inline = variant
+    if inline or value is None or isinstance(value, bool):
+        return quoteLiteral(value, dialectName), ()
+    return DIALECTS[dialectName].placeholder, (value,)
+
+
+def convertExpression(exp, dialect="sqlite", inline=False):
+    """
+    Returns an (sql, params) tuple for a geostyler expression, or None if
+    it cannot be translated. If inline is True, values are written in the
+    SQL instead of passed as parameters.
+    """
+    variant = (_dialect(dialect).name, bool(inline))
+    if isinstance(exp, list):
+        return current().expressions.translateTree("sql", exp, _prepareList, _combineList,
+                                                   variant)
+    return _literal(exp, variant)
+
+
+def _prepareList(exp, variant):
+    name = exp[0]
+    if name == "PropertyName":
+        return exp, ()
+    if (name not in _EXPRESSIONS and name not in _OPERATORS
+            and name not in DIALECTS[variant[0]].functions):
+        current().warnings.append(
+            "Unsupported expression function for SQL conversion: '%s'" % name)
+        return None, ()
+    return exp, [(arg, variant) for arg in exp[1:] if isinstance(arg, list)]
+
+
+def _combineList(exp, variant, translations):
+    if exp is None:
+        return None
+    name = exp[0]
+    if name == "PropertyName":
+        return quoteIdentifier(exp[1]), ()
+    dialect = DIALECTS[variant[0]]
+    if name == "PropertyIsLike" and dialect.like == "GLOB":
+        if not isinstance(exp[2], str):
+            current().warnings.append(
+                "Unsupported LIKE pattern for SQL conversion: the pattern must be a text")
+            return None
+        exp = [name, exp[1], _globPattern(exp[2])]
+    translations = iter(translations)
+    args = []
+    params = []
+    for arg in exp[1:]:
+        translation = next(translations) if isinstance(arg, list) else _literal(arg, variant)
+        if translation is None:
+            return None
+        args.append(translation[0])
+        params.extend(translation[1])
+    params = tuple(params)
+    if name in ("And", "Or"):
+        return "(%s)" % (" %s " % name.upper()).join(args), params
+    elif name == "Not":
+        return "(NOT %s)" % args[0], params
+    elif name == "In":
+        return "(%s IN (%s))" % (args[0], ", ".join(args[1:])), params
+    elif name == "PropertyIsLike":
+        return "(%s %s %s)" % (args[0], dialect.like, args[1]), params
+    elif name == "Div":
+        return "(CAST(%s AS %s) / %s)" % (args[0], dialect.real, args[1]), params
+    elif name == "Concatenate":
+        return dialect.concatenate(args), params
+    elif name == "if_then_else":
+        return "(CASE WHEN %s THEN %s ELSE %s END)" % tuple(args), params
+    elif name in _OPERATORS:
+        return "(%s %s %s)" % (args[0], _OPERATORS[name], args[1]), params
+    return "%s(%s)" % (dialect.functions[name], ", ".join(args)), params
+
+
+def convert(geostyler, dialect="sqlite"):
+    """
+    Translates the filters of the rules of a geostyler style. Returns a
+    list with a dict for each rule (see processRuleInfo) and the list of
+    warnings.
+    """
+    with conversionContext():
+        rules = [processRuleInfo(info, geostyler, dialect) for info in analyzeRules(geostyler)]
+        return finish(geostyler, rules, dialect)
+
+
+def processRuleInfo(info, geostyler=None, dialect="sqlite", inline=False):
+    """
+    Translates the filter of a rule, given its RuleInfo. Returns a dict with
+    the name and index of the rule, its scale range, the WHERE clause
+    ("where", None to select all rows), its parameters ("params"), and
+    whether the clause selects exactly the rows of the rule ("exact").
+    """
+    rule = {"name": info.name, "index": info.index, "minScale": info.minScale,
+            "maxScale": info.maxScale, "where": None, "params": (), "exact": True,
+            "else": info.isElse}
+    if info.filter is not None and not info.isElse:
+        translation = convertExpression(info.filter, dialect, inline)
+        if translation is None:
+            rule["exact"] = False
+            current().warnings.append(
+                "Filter of rule '%s' not converted to SQL: all its rows are selected"
+                % (info.name or ""))
+        else:
+            rule["where"], rule["params"] = translation
+    return rule
+
+
+def finish(geostyler, processedRules, dialect="sqlite"):
+    """
+    Completes the clauses of the ELSE rules, which select the rows that no
+    other rule selects. Returns the list of rules and the list of warnings.
+    """
+    dialect = _dialect(dialect)
+    others = [rule for rule in processedRules if not rule["else"]]
+    for rule in processedRules:
+        if not rule["else"] or not others:
+            continue
+        if not all(other["exact"] for other in others):
+            rule["exact"] = False
+        elif any(other["where"] is None for other in others):
+            rule["where"] = dialect.false
+        else:
+            rule["where"] = "(NOT COALESCE(%s, %s))" % (
+                " OR ".join(other["where"] for other in others), dialect.false)
+            rule["params"] = tuple(param for other in others for param in other["params"])
+    return processedRules, current().warnings
+
+
+def createViews(geostyler, table, dialect="sqlite", prefix=None):
+    """
+    Returns a list of CREATE VIEW statements, with a view for each rule of
+    a geostyler style that selects the rows of the table the rule applies
+    to, and the list of warnings. Views are named after the table (or the
+    prefix) and the index of their rule ("roads_0", "roads_1"...). Rules
+    whose filter cannot be translated have no view.
+    """
+    with conversionContext():
+        rules = [processRuleInfo(info, geostyler, dialect, inline=True)
+                 for info in analyzeRules(geostyler)]
+        rules, warnings = finish(geostyler, rules, dialect)
+        statements = []
+        for rule in rules:
+            if not rule["exact"]:
+                warnings.append("No view created for rule '%s'" % (rule["name"] or ""))
+                continue
+            statement = "CREATE VIEW %s AS SELECT * FROM %s" % (
+                quoteIdentifier("%s_%i" % (prefix or table, rule["index"])),
+                quoteIdentifier(table))
+            if rule["where"] is not None:
+                statement += " WHERE " + rule["where"]
+            statements.append(statement)
+        return statements, warnings
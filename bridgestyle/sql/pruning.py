@@ -0,0 +1,363 @@
+"""
+Removal of the rules of geostyler styles that no feature of a table uses.
+
+Categorized styles often have classes for values that are no longer in
+the data, which still cost a filter evaluation per feature. prune() counts
+the features of an SQLite table (or a GeoPackage layer) that each rule
+selects, and the ones that have each value of the In filters, and removes
+the rules and the In values without features:
+
+    style, report, warnings = prune(geostyler, "roads.gpkg", "roads")
+
+The counts are computed by the database, in a single scan of the table
+that counts the rows with each combination of values of the columns used
+by the filters. SQLite keeps them in a temporary table (on disk, unless
+configured otherwise), so memory does not grow with the size of the
+table, and the filters, translated to SQL (see sql.fromgeostyler), are
+evaluated once for each combination instead of once for each row. Passing
+a sample size only reads the first rows, for large tables, in which case
+rules that only some rows use may be removed.
+
+Rules whose filter cannot be translated, or that draw nothing anyway (see
+geostyler.pruning), are kept, and have no count in the report. In values
+are only removed from In expressions that compare a property, and an In
+expression keeps its values if none of them is in the table. The report
+is a dict with the number of rows read, the number of them that no rule
+selects, and the counts of each rule and In value:
+
+    {"table": "roads", "features": 1000, "sample": False, "unmatched": 0,
+     "rules": [{"index": 0, "name": "primary", "features": 120,
+                "removed": False}, ...],
+     "values": [{"rule": 0, "property": "type", "value": "primary",
+                 "features": 120, "removed": False}, ...]}
+
+It can also be used from the command line, to write the pruned style and
+the report as JSON files:
+
+    python -m bridgestyle.sql.pruning style.json roads.gpkg pruned.json
+        --table roads --report report.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from urllib.request import pathname2url
+
+from ..conversioncontext import conversionContext, current
+from ..geostyler.rules import analyzeRules
+from .fromgeostyler import processRuleInfo, quoteIdentifier, quoteLiteral
+
+# counts computed by each query. SQLite queries have at most 2000 columns
+_MAX_COUNTS = 1000
+# temporary table with the distinct values of the columns of the filters
+_ROWS = "bridgestyle_rows"
+# column of that table with the number of rows that have each value
+_WEIGHT = quoteIdentifier("bridgestyle_count")
+
+
+def _connect(database):
+    if isinstance(database, sqlite3.Connection):
+        return database, False
+    if not os.path.exists(database):
+        raise ValueError("Database not found: '%s'" % database)
+    uri = "file:%s?mode=ro" % pathname2url(os.path.abspath(database))
+    return sqlite3.connect(uri, uri=True), True
+
+
+def featureTable(connection):
+    """Returns the name of the only feature table of a GeoPackage"""
+    try:
+        names = [row[0] for row in connection.execute(
+            "SELECT table_name FROM gpkg_contents WHERE data_type = 'features'")]
+    except sqlite3.OperationalError:
+        names = []
+    if len(names) != 1:
+        raise ValueError("A table name is needed, the database does not have "
+                         "exactly one feature table")
+    return names[0]
+
+
+def _valueKey(value):
+    # 1, 1.0 and True are equal in Python, but not for the database
+    return type(value).__name__, value
+
+
+def _scanFilter(exp, properties, inValues):
+    # collects the properties used by a filter, and the In expressions
+    # that compare a property, without recursion
+    stack = [exp]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, list) or not node:
+            continue
+        if node[0] == "PropertyName":
+            properties.add(node[1])
+            continue
+        if (node[0] == "In" and len(node) > 2 and isinstance(node[1], list)
+                and node[1][:1] == ["PropertyName"]):
+            for value in node[2:]:
+                if not isinstance(value, (list, dict)):
+                    inValues.setdefault((node[1][1], _valueKey(value)), value)
+        stack.extend(node[1:])
+
+
+def _removeValues(exp, removed):
+    """
+    Returns a filter without the In values of the passed set of (property,
+    value key) tuples, or the filter itself if it has none
+    """
+    results = {}
+    stack = [(exp, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if not isinstance(node, list) or id(node) in results:
+            continue
+        if not expanded:
+            stack.append((node, True))
+            stack.extend((arg, False) for arg in node[1:])
+            continue
+        args = [results.get(id(arg), arg) if isinstance(arg, list) else arg
+                for arg in node[1:]]
+        if (node[0] == "In" and len(node) > 2 and isinstance(node[1], list)
+                and node[1][:1] == ["PropertyName"]):
+            prop = node[1][1]
+            values = [v for v in args[1:] if isinstance(v, (list, dict))
+                      or (prop, _valueKey(v)) not in removed]
+            if values:
+                args = args[:1] + values
+        if len(args) == len(node) - 1 and all(a is b for a, b in zip(args, node[1:])):
+            results[id(node)] = node
+        else:
+            results[id(node)] = [node[0]] + args
+    return results.get(id(exp), exp)
+
+
+def _count(where):
+    return "SUM(CASE WHEN %s THEN %s ELSE 0 END)" % (where, _WEIGHT)
+
+
+def _countNone(wheres):
+    # rows selected by none of the clauses. A CASE with a WHEN for each
+    # clause, unlike a chain of ORs, has no depth limit in SQLite
+    if not wheres:
+        return "SUM(%s)" % _WEIGHT
+    return "SUM(CASE %s ELSE %s END)" % (" ".join("WHEN %s THEN 0" % w for w in wheres),
+                                         _WEIGHT)
+
+
+def _runCounts(connection, counts, warnings):
+    # runs the (description, count expression) tuples, in as few queries as
+    # possible. A query that fails (e.g. too deep for SQLite) is split, and
+    # counts that fail on their own are None
+    results = [None] * len(counts)
+    pending = [(start, min(start + _MAX_COUNTS, len(counts)))
+               for start in range(0, len(counts), _MAX_COUNTS)]
+    while pending:
+        start, end = pending.pop()
+        sql = "SELECT %s FROM temp.%s" % (", ".join(c for d, c in counts[start:end]), _ROWS)
+        try:
+            row = connection.execute(sql).fetchone()
+        except sqlite3.OperationalError as e:
+            if end - start > 1:
+                middle = (start + end) // 2
+                pending.extend([(middle, end), (start, middle)])
+            else:
+                warnings.append("Features not counted for %s: %s" % (counts[start][0], e))
+            continue
+        results[start:end] = [value or 0 for value in row]
+    return results
+
+
+def coverage(geostyler, database, table=None, sample=None):
+    """
+    Counts the rows of a table of an SQLite database (a path or a
+    connection) that each rule of a geostyler style selects, and that have
+    each In value. The table can be omitted for GeoPackages with a single
+    layer. Returns the report (see the module documentation) and the list
+    of warnings.
+    """
+    connection, close = _connect(database)
+    try:
+        if table is None:
+            table = featureTable(connection)
+        with conversionContext():
+            return _coverage(geostyler, connection, table, sample)
+    finally:
+        if close:
+            connection.close()
+
+
+def _columns(connection, table):
+    columns = {row[1].lower() for row in connection.execute(
+        "PRAGMA table_info(%s)" % quoteIdentifier(table))}
+    if not columns:
+        raise ValueError("Table not found: '%s'" % table)
+    return columns
+
+
+def _coverage(geostyler, connection, table, sample):
+    warnings = current().warnings
+    columns = _columns(connection, table)
+    rules = geostyler.get("rules", [])
+    processed = {info.index: processRuleInfo(info, geostyler, inline=True)
+                 for info in analyzeRules(geostyler)}
+    properties = set()
+    inValues = []
+    for i, rule in enumerate(rules):
+        ruleProperties = set()
+        values = {}
+        _scanFilter(rule.get("filter"), ruleProperties, values)
+        # SQLite takes unknown quoted names as texts, so rules that use
+        # them would seem to select nothing
+        missing = sorted(p for p in ruleProperties if str(p).lower() not in columns)
+        if missing and i in processed:
+            processed[i]["exact"] = False
+            warnings.append("Features of rule '%s' not counted: the table has no %s"
+                            % (rule.get("name", ""), ", ".join(map(str, missing))))
+        properties.update(p for p in ruleProperties if p not in missing)
+        inValues.extend((i, prop, key, value) for (prop, key), value in values.items()
+                        if prop not in missing)
+
+    counts = [("the table", "SUM(%s)" % _WEIGHT)]
+    # the rows selected by no rule but the ELSE ones, which are the rows of
+    # the ELSE rules
+    others = [r for r in processed.values() if not r["else"]]
+    noneIndex = None
+    if all(r["exact"] for r in others) and all(r["where"] is not None for r in others):
+        noneIndex = len(counts)
+        counts.append(("the rows of no rule", _countNone([r["where"] for r in others])))
+    ruleCounts = {}
+    for i, rule in processed.items():
+        if rule["exact"] and not rule["else"]:
+            ruleCounts[i] = len(counts)
+            counts.append(("rule '%s'" % (rule["name"] or ""), counts[0][1]
+                           if rule["where"] is None else _count(rule["where"])))
+    valueCounts = {}
+    for i, prop, key, value in inValues:
+        if (prop, key) not in valueCounts:
+            valueCounts[(prop, key)] = len(counts)
+            where = "%s = %s" % (quoteIdentifier(prop), quoteLiteral(value))
+            counts.append(("%s=%r" % (prop, value), _count(where)))
+
+    # the table is read once, to count the rows with each combination of
+    # values of the columns of the filters. Filters are then evaluated once
+    # for each combination, instead of once for each row
+    selected = ", ".join(quoteIdentifier(p) for p in sorted(properties, key=str))
+    source = quoteIdentifier(table)
+    if sample is not None:
+        source = "(SELECT %s FROM %s LIMIT %i)" % (selected or "1", source, sample)
+    sql = "CREATE TEMP TABLE %s AS SELECT %sCOUNT(*) AS %s FROM %s" % (
+        _ROWS, selected + ", " if selected else "", _WEIGHT, source)
+    if selected:
+        sql += " GROUP BY " + selected
+    connection.execute(sql)
+    try:
+        results = _runCounts(connection, counts, warnings)
+    finally:
+        connection.execute("DROP TABLE temp.%s" % _ROWS)
+
+    noneCount = None
+    if noneIndex is not None:
+        noneCount = results[noneIndex]
+    elif any(r["exact"] and r["where"] is None for r in others):
+        noneCount = 0
+    hasElse = any(r["else"] for r in processed.values())
+    report = {"table": table, "features": results[0],
+              "sample": sample is not None and results[0] >= sample,
+              "unmatched": 0 if hasElse else noneCount, "rules": [], "values": []}
+    for i, rule in enumerate(rules):
+        if i in ruleCounts:
+            features = results[ruleCounts[i]]
+        elif i in processed and processed[i]["else"]:
+            features = noneCount
+        else:
+            features = None
+        report["rules"].append({"index": i, "name": rule.get("name"),
+                                "features": features, "removed": features == 0})
+    for i, prop, key, value in inValues:
+        features = results[valueCounts[(prop, key)]]
+        report["values"].append({"rule": i, "property": prop, "value": value,
+                                 "features": features, "removed": features == 0})
+    return report, warnings
+
+
+def prune(geostyler, database, table=None, sample=None):
+    """
+    Returns a geostyler style without the rules and the In values that no
+    row of a table uses (see coverage), the report of the counts of each
+    rule and value, and a list of warnings describing what was removed. The
+    passed style is not modified.
+    """
+    report, warnings = coverage(geostyler, database, table, sample)
+    rules = geostyler.get("rules", [])
+    removedRules = {r["index"] for r in report["rules"] if r["removed"]}
+    removedValues = {}
+    for v in report["values"]:
+        if v["removed"] and v["rule"] not in removedRules:
+            removedValues.setdefault(v["rule"], []).append(v)
+    pruned = []
+    for i, rule in enumerate(rules):
+        name = rule.get("name", "")
+        if i in removedRules:
+            warnings.append("Removed rule '%s': no feature matches its filter" % name)
+            continue
+        if i in removedValues:
+            values = removedValues[i]
+            ruleFilter = _removeValues(rule.get("filter"), {
+                (v["property"], _valueKey(v["value"])) for v in values})
+            if ruleFilter is not rule.get("filter"):
+                rule = type(rule)(rule)
+                rule["filter"] = ruleFilter
+                warnings.append("Removed values from rule '%s': %s" % (name, ", ".join(
+                    "%s=%r" % (v["property"], v["value"]) for v in values)))
+        pruned.append(rule)
+    style = type(geostyler)(geostyler)
+    style["rules"] = pruned
+    return style, report, warnings
+
+
+def pruneFile(styleFile, database, output, table=None, reportFile=None, sample=None):
+    """
+    Prunes a geostyler style file, and writes the pruned style and, if a
+    file is passed, the report, as JSON. Returns the list of warnings.
+    """
+    with open(styleFile) as f:
+        geostyler = json.load(f)
+    style, report, warnings = prune(geostyler, database, table, sample)
+    with open(output, "w") as f:
+        json.dump(style, f, indent=4)
+    if reportFile is not None:
+        with open(reportFile, "w") as f:
+            json.dump(report, f, indent=4)
+    return warnings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m bridgestyle.sql.pruning",
+        description="Removes the rules and In values of a geostyler style that no "
+        "feature of an SQLite table or GeoPackage layer uses")
+    parser.add_argument("style", help="Geostyler style file")
+    parser.add_argument("database", help="SQLite database or GeoPackage file")
+    parser.add_argument("output", help="File to write the pruned style to")
+    parser.add_argument("--table", help="Table or layer (by default, the only layer "
+                        "of the GeoPackage)")
+    parser.add_argument("--report", metavar="FILE",
+                        help="File to write the counts of each rule and value to")
+    parser.add_argument("--sample", type=int, default=None, metavar="N",
+                        help="Only read the first N rows of the table")
+    args = parser.parse_args()
+    try:
+        warnings = pruneFile(args.style, args.database, args.output, args.table,
+                             args.report, args.sample)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(e)
+        return 1
+    for w in warnings:
+        print("Warning: %s" % w)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Streaming conversion of newline-delimited JSON records.
+
+Each input line is a JSON object like this:
+
+    {"id": "roads", "from": "geostyler", "to": "sld", "style": "..."}
+
+The style is the content of the style in the source format, as a string.
+For geostyler, the style object itself can also be used instead of its
+string representation.
+
+For each input record, a line with the result is written:
+
+    {"id": "roads", "style": "...", "warnings": []}
+
+or, if the record could not be converted:
+
+    {"id": "roads", "error": "..."}
+
+Records are converted one at a time, as they are read, and results are
+flushed right away, so memory use does not grow with the length of the
+stream.
+"""
+import json
+
+from bridgestyle import style2style
+
+MAX_RECORD_SIZE = 64 * 1024 * 1024
+_READ_SIZE = 1024 * 1024
+
+
+def _readLines(instream, maxSize):
+    # like iterating the stream, but never keeping more than maxSize
+    # characters of a single line in memory. Lines that are too long are
+    # returned as None
+    while True:
+        line = instream.readline(maxSize + 1)
+        if not line:
+            return
+        if len(line) > maxSize and not line.endswith("\n"):
+            while True:
+                rest = instream.readline(_READ_SIZE)
+                if not rest or rest.endswith("\n"):
+                    break
+            yield None
+        else:
+            yield line
+
+
+def convertRecord(record, cache=None):
+    """
+    Converts a single record (already parsed from JSON) and returns the
+    result record.
+    """
+    recordId = record.get("id") if isinstance(record, dict) else None
+    try:
+        if not isinstance(record, dict):
+            raise ValueError("Record is not a JSON object")
+        for key in ["from", "to", "style"]:
+            if key not in record:
+                raise ValueError("Missing '%s' key in record" % key)
+        style = record["style"]
+        if isinstance(style, str):
+            converted, warnings = style2style.convertStyle(style, record["from"], record["to"], cache)
+        elif record["from"] == "geostyler":
+            converted, warnings = style2style.convertGeostyler(style, record["to"], cache)
+        else:
+            raise ValueError("Style must be a string for '%s' records" % record["from"])
+        return {"id": recordId, "style": converted, "warnings": warnings}
+    except Exception as e:
+        return {"id": recordId, "error": "%s: %s" % (e.__class__.__name__, e)}
+
+
+def convertLines(lines, cache=None):
+    """
+    Generator that takes NDJSON lines and yields a result record for each
+    non-empty line.
+    """
+    for i, line in enumerate(lines):
+        if line is None:
+            yield {"id": None, "error": "Line %i is longer than the maximum record size" % (i + 1)}
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield {"id": None, "error": "Line %i is not valid JSON: %s" % (i + 1, e)}
+            continue
+        yield convertRecord(record, cache)
+
+
+def convertStream(instream, outstream, maxRecordSize=MAX_RECORD_SIZE, cache=None):
+    """
+    Reads NDJSON records from instream and writes a result line for each of
+    them to outstream, flushing after each one.
+    """
+    for result in convertLines(_readLines(instream, maxRecordSize), cache):
+        outstream.write(json.dumps(result))
+        outstream.write("\n")
+        outstream.flush()
@@ -1,36 +1,244 @@
 import os
 import sys
-from bridgestyle import sld
-from bridgestyle import geostyler
-from bridgestyle import mapboxgl
+import argparse
+from bridgestyle import registry
 
-_exts = {"sld": sld, "geostyler": geostyler, "mapbox": mapboxgl}
 
+class UnsupportedFormatException(Exception):
+    pass
 
-def convert(fileA, fileB):
-    extA = os.path.splitext(fileA)[1][1:]
-    extB = os.path.splitext(fileB)[1][1:]
-    if extA not in _exts:
-        print("Unsupported style type: '%s'" % extA)
-        return
-    if extB not in _exts:
-        print("Unsupported style type: '%s'" % ext)
-        return
 
+def _extension(filename):
+    return os.path.splitext(filename)[1][1:]
+
+
+def _format(ext):
+    styleFormat = registry.get(ext)
+    if styleFormat is None:
+        raise UnsupportedFormatException("Unsupported style type: '%s'" % ext)
+    return styleFormat
+
+
+def _readableFormat(ext):
+    styleFormat = _format(ext)
+    if not styleFormat.readable:
+        raise UnsupportedFormatException("Style type '%s' can only be written" % ext)
+    return styleFormat
+
+
+def convertGeostyler(geostyler, ext, cache=None):
+    """
+    Converts a geostyler object into the format with the given extension.
+    Returns the converted string and a list of warnings.
+    If a ConversionCache is passed, the result is taken from it when available.
+    """
+    styleFormat = _format(ext)
+    convertFunction = styleFormat.fromGeostylerFunction()
+    if cache is not None and convertFunction is not None:
+        result = cache.convert(ext, geostyler, convertFunction)
+        return result[0], result[-1]
+    return styleFormat.fromGeostyler(geostyler)
+
+
+def convertStyle(styleA, extA, extB, cache=None):
+    """
+    Converts a style string from the format with extension extA to the one
+    with extension extB. Returns the converted string and a list of warnings
+    """
+    formatA = _readableFormat(extA)
+    _format(extB)
+    geostyler = formatA.toGeostyler(styleA)
+    return convertGeostyler(geostyler, extB, cache)
+
+
+def convertFile(fileA, fileB, cache=None):
     with open(fileA) as f:
         styleA = f.read()
 
-    geostyler = _exts[extA].toGeostyler(styleA)
-    styleB = _exts[extB].fromGeostyler(geostyler)
+    styleB, warnings = convertStyle(styleA, _extension(fileA), _extension(fileB), cache)
 
     with open(fileB, "w") as f:
         f.write(styleB)
 
+    return warnings
 
-def main():
-    if len(sys.argv) != 3:
-        print(
-            "Wrong number of parameters\nUsage: style2style original_style_file.ext destination_style_file.ext"
-        )
+
+def convertStyleToFormats(styleA, extA, base, exts, cache=None):
+    """
+    Converts a style string into several formats at once, walking the style
+    only once. Returns a list of (filename, content) tuples with the files
+    to write, named as base (a path without extension) followed by the
+    extension of each format, and a list of warnings, each of them prefixed
+    with the name of its format.
+    """
+    from bridgestyle import fanout
+
+    geostyler = _readableFormat(extA).toGeostyler(styleA)
+    files = []
+    warnings = []
+    for ext, result in fanout.convert(geostyler, exts, cache).items():
+        files.extend(fanout.outputFiles(base, ext, result))
+        warnings.extend("%s: %s" % (ext, w) for w in result[-1])
+    return files, warnings
+
+
+def convertFileToFormats(fileA, base, exts, cache=None):
+    """
+    Converts a style file into several formats at once (see
+    convertStyleToFormats), writes the converted files and returns the list
+    of warnings.
+    """
+    with open(fileA) as f:
+        styleA = f.read()
+
+    files, warnings = convertStyleToFormats(styleA, _extension(fileA), base, exts, cache)
+    for filename, content in files:
+        with open(filename, "w") as f:
+            f.write(content)
+
+    return warnings
+
+
+def convert(fileA, fileB, cache=None):
+    try:
+        return convertFile(fileA, fileB, cache)
+    except UnsupportedFormatException as e:
+        print(e)
+
+
+def _printBatchResult(result):
+    if result.error is not None:
+        print("FAILED %s: %s" % (result.input, result.error))
     else:
-        convert(sys.argv[1], sys.argv[2])
+        print("%s -> %s (%i warnings)" % (result.input, result.output, len(result.warnings)))
+
+
+def _printBatchSummary(results):
+    failed = [r for r in results if r.error is not None]
+    withWarnings = [r for r in results if r.warnings]
+    print("\n%i files converted, %i failed, %i with warnings"
+          % (len(results) - len(failed), len(failed), len(withWarnings)))
+    if failed:
+        print("\nFailures:")
+        for r in sorted(failed, key=lambda r: r.input):
+            print("  %s: %s" % (r.input, r.error))
+    if withWarnings:
+        print("\nWarnings:")
+        for r in sorted(withWarnings, key=lambda r: r.input):
+            print("  %s:" % r.input)
+            for w in r.warnings:
+                print("    %s" % w)
+
+
+def convertBatch(inputs, folder, ext, jobs=None, chunksize=None, cache=None):
+    from bridgestyle import batch
+
+    results = []
+    for result in batch.convertBatch(inputs, folder, ext, jobs, chunksize, cache):
+        _printBatchResult(result)
+        results.append(result)
+    _printBatchSummary(results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="style2style",
+        description="Converts map styles between formats. File format is inferred from "
+        "the file extension.",
+        usage="\n  style2style original_style_file.ext destination_style_file.ext"
+        "\n  style2style --to ext[,ext...] [--jobs N] input_folder_or_glob [...] destination_folder"
+        "\n  style2style --to ext,ext[,...] original_style_file.ext destination_name"
+        "\n  style2style --ndjson < records.ndjson > results.ndjson",
+    )
+    parser.add_argument("paths", nargs="*", metavar="path",
+                        help="Input style files (or folders/glob patterns in batch mode), "
+                        "followed by the destination file (or folder in batch mode)")
+    parser.add_argument("--to", dest="ext",
+                        help="Extension of the destination format. Enables batch mode. "
+                        "Several comma-separated formats (sld, mapbox, mapserver) can be "
+                        "passed to convert into all of them at once")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="Number of worker processes in batch mode (default: number of CPUs)")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Number of files sent to a worker at once in batch mode")
+    parser.add_argument("--ndjson", action="store_true",
+                        help="Read conversion records from stdin as newline-delimited JSON "
+                        "and write results to stdout")
+    parser.add_argument("--cache", metavar="FOLDER",
+                        help="Cache conversion results in this folder")
+    parser.add_argument("--cache-size", type=int, default=None, metavar="MB",
+                        help="Maximum size of the cache in megabytes")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print the time spent in each stage and hot function to stderr. "
+                        "Batch conversions run in a single process when profiling")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Profile the conversion and save the calls to this file, "
+                        "in Chrome trace format")
+    parser.add_argument("--memory", action="store_true",
+                        help="Profile the conversion, also reporting the peak and retained "
+                        "memory of each stage (slower)")
+    args = parser.parse_args()
+
+    cache = None
+    if args.cache is not None:
+        from bridgestyle.cache import ConversionCache, DEFAULT_MAX_SIZE
+        maxSize = args.cache_size * 1024 * 1024 if args.cache_size else DEFAULT_MAX_SIZE
+        cache = ConversionCache(args.cache, maxSize)
+
+    if not args.profile and not args.memory and args.trace is None:
+        return _run(parser, args, cache)
+
+    from bridgestyle import profiling
+    # calls in worker processes would not be recorded
+    args.jobs = 1
+    with profiling.profile(trace=args.trace is not None, memory=args.memory) as p:
+        ret = _run(parser, args, cache)
+    p.report()
+    if args.trace is not None:
+        p.saveChromeTrace(args.trace)
+    return ret
+
+
+def _run(parser, args, cache):
+    if args.ndjson:
+        if args.paths:
+            parser.error("--ndjson does not take input or output files")
+        from bridgestyle import stream
+        stream.convertStream(sys.stdin, sys.stdout, cache=cache)
+        return 0
+
+    if len(args.paths) < 2:
+        parser.error("an input and an output are required")
+    inputs, output = args.paths[:-1], args.paths[-1]
+
+    singleFile = len(inputs) == 1 and not os.path.isdir(inputs[0])
+    if args.ext is None and singleFile:
+        warnings = convert(inputs[0], output, cache)
+        for w in warnings or []:
+            print("Warning: %s" % w)
+        return 0 if warnings is not None else 1
+
+    if args.ext is None:
+        parser.error("--to is required when converting folders or several files")
+    exts = args.ext.split(",")
+    if len(exts) > 1 and singleFile and not any(c in inputs[0] for c in "*?["):
+        # output is the name of the destination files, without extension
+        try:
+            warnings = convertFileToFormats(inputs[0], output, exts, cache)
+        except Exception as e:
+            print(e)
+            return 1
+        for w in warnings:
+            print("Warning: %s" % w)
+        return 0
+    # mapfiles are written with their symbols file, as when converting into
+    # several formats
+    multiple = len(exts) > 1 or exts[0] == "mapserver"
+    results = convertBatch(inputs, output, exts if multiple else exts[0],
+                           args.jobs, args.chunksize, cache)
+    return 1 if any(r.error is not None for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Seeded generator of synthetic styles, used to measure how the converters
+scale with the size of a style.
+
+geostylerStyle() creates geostyler documents modelled on
+test/data/sample.geostyler, and lyrxDocument() creates ArcGIS Pro .lyrx
+documents with a unique value renderer, like the ones in test/data/arcgis.
+categorizedStyle() creates geostyler documents like the ones converted
+from QGIS categorized renderers, and attributeColumns() attribute values
+of features to evaluate their filters. The same arguments and seed always
+produce the same style.
+
+Filters are binary trees of And/Or/Not with the given depth, and their
+leaves are chains of Or'ed comparisons of the given length, like the ones
+created for classes with several values. Note that the number of leaves
+grows exponentially with the depth.
+
+Styles can also be written to a file from the command line:
+
+    python -m bridgestyle.synthetic --rules 1000 --seed 1 style.geostyler
+    python -m bridgestyle.synthetic --rules 1000 --seed 1 style.lyrx
+"""
+import sys
+import json
+import random
+import argparse
+
+SYMBOLIZER_KINDS = ["Fill", "Line", "Mark", "Icon", "Text"]
+
+# default proportion of each kind of symbolizer
+DEFAULT_SYMBOLIZERS = {"Fill": 3, "Line": 3, "Mark": 2, "Icon": 1, "Text": 1}
+
+_FIELDS = ["NAME", "TYPE", "CLASS", "CODE"]
+_NUMERIC_FIELDS = ["POP_EST", "SCALERANK", "WIDTH", "AREA"]
+_COMPARISONS = ["PropertyIsEqualTo", "PropertyIsNotEqualTo", "PropertyIsLessThan",
+                "PropertyIsGreaterThan", "PropertyIsLessThanOrEqualTo",
+                "PropertyIsGreaterThanOrEqualTo"]
+_MARKS = ["circle", "square", "triangle", "star", "cross", "hexagon"]
+_FONTS = ["Arial", "DejaVu Sans", "Open Sans"]
+
+
+def _color(rng):
+    return "#%02x%02x%02x" % (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+
+
+def _comparison(rng):
+    if rng.random() < 0.5:
+        return ["PropertyIsEqualTo", ["PropertyName", rng.choice(_FIELDS)],
+                "value%i" % rng.randrange(1000)]
+    return [rng.choice(_COMPARISONS), ["PropertyName", rng.choice(_NUMERIC_FIELDS)],
+            rng.randrange(10000000)]
+
+
+def _orChain(rng, length):
+    # ["Or", ["Or", a, b], c], as older producers created when a class has
+    # several values
+    exp = _comparison(rng)
+    for i in range(length - 1):
+        exp = ["Or", exp, _comparison(rng)]
+    return exp
+
+
+def expression(rng, depth=2, orLength=2):
+    """Returns a random filter with the given depth of And/Or/Not nodes"""
+    if depth <= 1:
+        return _orChain(rng, orLength)
+    op = rng.choice(["And", "Or", "Not"])
+    if op == "Not":
+        return ["Not", expression(rng, depth - 1, orLength)]
+    return [op, expression(rng, depth - 1, orLength), expression(rng, depth - 1, orLength)]
+
+
+def _sizeExpression(rng):
+    # like the proportional symbols of sample.geostyler
+    return ["Mul", round(rng.uniform(1, 5), 4),
+            ["Div", ["PropertyName", rng.choice(_NUMERIC_FIELDS)], 10000000]]
+
+
+def symbolizer(rng, kind, z=0, proportionalRatio=0.0):
+    if kind == "Fill":
+        return {"kind": "Fill", "opacity": 1.0, "color": _color(rng), "fillOpacity": 1.0,
+                "outlineColor": _color(rng), "outlineWidth": round(rng.uniform(0.1, 3), 4),
+                "outlineOpacity": 1.0, "Z": z}
+    if kind == "Line":
+        line = {"kind": "Line", "opacity": 1.0, "color": _color(rng),
+                "width": round(rng.uniform(0.1, 5), 4), "cap": "round", "join": "round",
+                "perpendicularOffset": 0.0, "Z": z}
+        if rng.random() < 0.3:
+            line["dasharray"] = "%i %i" % (rng.randrange(1, 10), rng.randrange(1, 10))
+        return line
+    if kind == "Mark":
+        mark = {"kind": "Mark", "opacity": 1.0, "rotate": float(rng.randrange(360)),
+                "color": _color(rng), "wellKnownName": rng.choice(_MARKS),
+                "size": round(rng.uniform(2, 30), 4), "strokeColor": _color(rng),
+                "strokeWidth": round(rng.uniform(0.1, 3), 4), "Z": z}
+        if rng.random() < proportionalRatio:
+            mark["size"] = _sizeExpression(rng)
+            mark["Geometry"] = ["centroid", ["PropertyName", "geom"]]
+        return mark
+    if kind == "Icon":
+        return {"kind": "Icon", "opacity": 1.0, "rotate": 0.0, "color": None,
+                "image": "icon%i.png" % rng.randrange(100),
+                "size": round(rng.uniform(8, 32), 4), "Z": z}
+    if kind == "Text":
+        return {"kind": "Text", "offset": [0.0, 0.0], "anchor": "right", "rotate": 0.0,
+                "color": _color(rng), "font": rng.choice(_FONTS),
+                "label": ["PropertyName", rng.choice(_FIELDS)],
+                "size": rng.randrange(8, 20), "Z": z}
+    raise ValueError("Unsupported symbolizer kind: '%s'" % kind)
+
+
+def _kinds(symbolizers):
+    symbolizers = symbolizers or DEFAULT_SYMBOLIZERS
+    if not isinstance(symbolizers, dict):
+        symbolizers = {kind: 1 for kind in symbolizers}
+    return list(symbolizers.keys()), list(symbolizers.values())
+
+
+def geostylerStyle(nrules, seed=0, symbolizers=None, symbolizersPerRule=2,
+                   expressionDepth=2, orLength=2, scaleRatio=0.3, elseRule=True,
+                   proportionalRatio=0.0):
+    """
+    Returns a geostyler style with nrules rules.
+
+    symbolizers is a dict with the relative weight of each kind of symbolizer
+    (or just a list of kinds), and symbolizersPerRule the number of
+    symbolizers in each rule. expressionDepth and orLength define the shape
+    of the filters (see the module documentation). scaleRatio is the
+    proportion of rules with a scale range. If elseRule is True, the last
+    rule has an ELSE filter. proportionalRatio is the proportion of marks
+    with a size computed from an attribute, placed on the centroid of the
+    geometry (not supported by the Mapbox GL converter).
+    """
+    rng = random.Random(seed)
+    kinds, weights = _kinds(symbolizers)
+    rules = []
+    for i in range(nrules):
+        rule = {"name": "rule%i" % i,
+                "symbolizers": [symbolizer(rng, kind, z, proportionalRatio)
+                                for z, kind in enumerate(rng.choices(kinds, weights,
+                                                                     k=symbolizersPerRule))]}
+        if elseRule and i == nrules - 1:
+            rule["filter"] = "ELSE"
+        elif expressionDepth > 0:
+            rule["filter"] = expression(rng, expressionDepth, orLength)
+        if rng.random() < scaleRatio:
+            minScale = rng.choice([0, 1000, 5000, 25000])
+            rule["scaleDenominator"] = {"min": minScale,
+                                        "max": minScale * 10 + rng.choice([10000, 100000, 1000000])}
+        rules.append(rule)
+    return {"name": "synthetic%i" % seed, "rules": rules}
+
+
+# factor used by the QGIS converter for sizes in millimeters
+_MM2PIXEL = 3.571428571428571
+
+
+def categorizedStyle(nrules, seed=0, field="TYPE", dataDefinedRatio=1.0):
+    """
+    Returns a geostyler style like the ones converted from QGIS categorized
+    renderers, with a rule for each value of a field. Each rule has a fill
+    and a line, and a proportion of them (dataDefinedRatio) have their width
+    given by an attribute in millimeters, so all of them use the same
+    expression.
+    """
+    rng = random.Random(seed)
+    width = ["Mul", _MM2PIXEL, ["PropertyName", "WIDTH"]]
+    rules = []
+    for i in range(nrules):
+        dataDefined = rng.random() < dataDefinedRatio
+        fill = symbolizer(rng, "Fill", 0)
+        line = symbolizer(rng, "Line", 1)
+        if dataDefined:
+            fill["outlineWidth"] = width
+            line["width"] = width
+        rules.append({"name": "value%i" % i,
+                      "filter": ["PropertyIsEqualTo", ["PropertyName", field], "value%i" % i],
+                      "symbolizers": [fill, line]})
+    return {"name": "categorized%i" % seed, "rules": rules}
+
+
+def attributeColumns(nfeatures, seed=0, nvalues=1000):
+    """
+    Returns a dict with an array of random values for each field used by
+    the filters of the styles above, for nfeatures features. Text fields
+    take nvalues values ("value0", "value1"...). Needs NumPy.
+    """
+    import numpy
+    rng = numpy.random.default_rng(seed)
+    values = numpy.array(["value%i" % i for i in range(nvalues)])
+    columns = {field: values[rng.integers(0, nvalues, nfeatures)] for field in _FIELDS}
+    for field in _NUMERIC_FIELDS:
+        columns[field] = rng.integers(0, 10000000, nfeatures)
+    return columns
+
+
+def _cimColor(rng):
+    return {"type": "CIMRGBColor",
+            "values": [rng.randrange(256), rng.randrange(256), rng.randrange(256), 100]}
+
+
+def _cimStroke(rng):
+    stroke = {"type": "CIMSolidStroke", "enable": True, "capStyle": "Round",
+              "joinStyle": "Round", "width": round(rng.uniform(0.1, 5), 4),
+              "color": _cimColor(rng)}
+    if rng.random() < 0.3:
+        stroke["effects"] = [{"type": "CIMGeometricEffectDashes",
+                              "dashTemplate": [rng.randrange(1, 10), rng.randrange(1, 10)]}]
+    return stroke
+
+
+def _cimSymbol(rng, kind):
+    if kind == "Fill":
+        return {"type": "CIMPolygonSymbol",
+                "symbolLayers": [_cimStroke(rng),
+                                 {"type": "CIMSolidFill", "enable": True,
+                                  "color": _cimColor(rng)}]}
+    if kind == "Line":
+        return {"type": "CIMLineSymbol", "symbolLayers": [_cimStroke(rng)]}
+    if kind == "Mark":
+        return {"type": "CIMPointSymbol",
+                "symbolLayers": [{"type": "CIMCharacterMarker", "enable": True,
+                                  "size": rng.randrange(4, 30),
+                                  "characterIndex": rng.randrange(33, 127),
+                                  "fontFamilyName": "ESRI Default Marker",
+                                  "symbol": {"type": "CIMPolygonSymbol",
+                                             "symbolLayers": [{"type": "CIMSolidFill",
+                                                               "enable": True,
+                                                               "color": _cimColor(rng)}]}}]}
+    raise ValueError("Unsupported symbol kind for lyrx documents: '%s'" % kind)
+
+
+def lyrxDocument(nrules, seed=0, symbols=("Fill", "Line", "Mark"), nfields=1, orLength=2):
+    """
+    Returns an ArcGIS Pro layer document (as a dict) with a unique value
+    renderer with nrules classes.
+
+    Each class has orLength values (which become an In expression, or Or'ed
+    conditions if there are several fields) and the renderer uses nfields
+    fields (which become And'ed conditions for each value). symbols is the list of kinds of symbols
+    used for classes: 'Fill', 'Line' or 'Mark'.
+    """
+    rng = random.Random(seed)
+    fields = ["FIELD%i" % i for i in range(nfields)]
+    classes = []
+    for i in range(nrules):
+        values = [{"type": "CIMUniqueValue",
+                   "fieldValues": [str(rng.randrange(100000)) for field in fields]}
+                  for j in range(orLength)]
+        classes.append({"type": "CIMUniqueValueClass",
+                        "label": "class%i" % i,
+                        "symbol": {"type": "CIMSymbolReference",
+                                   "symbol": _cimSymbol(rng, rng.choice(list(symbols)))},
+                        "values": values,
+                        "visible": True})
+    layer = {"type": "CIMFeatureLayer",
+             "name": "synthetic%i" % seed,
+             "renderer": {"type": "CIMUniqueValueRenderer",
+                          "fields": fields,
+                          "groups": [{"type": "CIMUniqueValueGroup", "classes": classes}]}}
+    return {"type": "CIMLayerDocument", "version": "2.5.0",
+            "layers": ["CIMPATH=layers/synthetic.xml"],
+            "layerDefinitions": [layer]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Creates a synthetic style for benchmarks")
+    parser.add_argument("output", help="Output file (.geostyler or .lyrx)")
+    parser.add_argument("--rules", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--symbolizers", type=int, default=2,
+                        help="Number of symbolizers per rule (geostyler only)")
+    parser.add_argument("--depth", type=int, default=2,
+                        help="Depth of filter expressions (geostyler) or number of fields (lyrx)")
+    parser.add_argument("--or-length", type=int, default=2,
+                        help="Length of the Or chains in filters")
+    args = parser.parse_args()
+    if args.output.endswith(".lyrx"):
+        style = lyrxDocument(args.rules, args.seed, nfields=args.depth, orLength=args.or_length)
+    else:
+        style = geostylerStyle(args.rules, args.seed, symbolizersPerRule=args.symbolizers,
+                               expressionDepth=args.depth, orLength=args.or_length)
+    with open(args.output, "w") as f:
+        json.dump(style, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
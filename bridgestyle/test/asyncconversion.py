@@ -0,0 +1,132 @@
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+import context
+
+from bridgestyle import aio
+from bridgestyle import style2style
+from bridgestyle import synthetic
+
+
+class _CountingConverter(aio.AsyncConverter):
+    # keeps the maximum number of conversions running at once, and blocks
+    # them until released
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.running = 0
+        self.maxRunning = 0
+        self.release = threading.Event()
+
+    async def _cpu(self, function, *args):
+        self.running += 1
+        self.maxRunning = max(self.maxRunning, self.running)
+        try:
+            await self._run(None, self.release.wait)
+            return await super()._cpu(function, *args)
+        finally:
+            self.running -= 1
+
+
+class AsyncConversionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.inputFolder = tempfile.mkdtemp()
+        cls.sample = os.path.join(cls.inputFolder, "sample.geostyler")
+        with open(cls.sample, "w") as f:
+            json.dump(synthetic.geostylerStyle(20), f)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.inputFolder)
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _expected(self, ext):
+        filename = os.path.join(self.folder, "expected." + ext)
+        warnings = style2style.convertFile(self.sample, filename)
+        with open(filename) as f:
+            return f.read(), warnings
+
+    def _read(self, filename):
+        with open(filename) as f:
+            return f.read()
+
+    def test_convert_file(self):
+        output = os.path.join(self.folder, "sample.sld")
+        warnings = asyncio.run(aio.convertFile(self.sample, output))
+        self.assertEqual((self._read(output), warnings), self._expected("sld"))
+
+    def test_process_executor(self):
+        async def convert():
+            with ProcessPoolExecutor(2) as executor:
+                async with aio.AsyncConverter(executor) as converter:
+                    outputs = [os.path.join(self.folder, "%i.mapbox" % i) for i in range(4)]
+                    return await asyncio.gather(*[converter.convertFile(self.sample, output)
+                                                  for output in outputs])
+
+        results = asyncio.run(convert())
+        expected, warnings = self._expected("mapbox")
+        for i, result in enumerate(results):
+            self.assertEqual(result, warnings)
+            self.assertEqual(self._read(os.path.join(self.folder, "%i.mapbox" % i)), expected)
+
+    def test_convert_to_formats(self):
+        base = os.path.join(self.folder, "sample")
+        warnings = asyncio.run(aio.convertFileToFormats(self.sample, base, ["sld", "mapbox"]))
+        self.assertEqual(self._read(base + ".sld"), self._expected("sld")[0])
+        self.assertEqual(self._read(base + ".mapbox"), self._expected("mapbox")[0])
+        self.assertEqual(warnings, style2style.convertFileToFormats(self.sample, base,
+                                                                    ["sld", "mapbox"]))
+
+    def test_max_concurrency(self):
+        converter = _CountingConverter(maxConcurrency=2)
+
+        async def convert():
+            tasks = [asyncio.ensure_future(converter.convertFile(
+                self.sample, os.path.join(self.folder, "%i.sld" % i))) for i in range(6)]
+            await asyncio.sleep(0.2)
+            running = converter.running
+            converter.release.set()
+            await asyncio.gather(*tasks)
+            return running
+
+        self.assertEqual(asyncio.run(convert()), 2)
+        self.assertEqual(converter.maxRunning, 2)
+        converter.close()
+
+    def test_cancel(self):
+        converter = _CountingConverter(maxConcurrency=1)
+        outputs = [os.path.join(self.folder, "%i.sld" % i) for i in range(2)]
+
+        async def convert():
+            first = asyncio.ensure_future(converter.convertFile(self.sample, outputs[0]))
+            second = asyncio.ensure_future(converter.convertFile(self.sample, outputs[1]))
+            await asyncio.sleep(0.1)
+            second.cancel()
+            converter.release.set()
+            await first
+            with self.assertRaises(asyncio.CancelledError):
+                await second
+
+        asyncio.run(convert())
+        converter.close()
+        self.assertEqual(sorted(os.listdir(self.folder)), ["0.sld"])
+
+    def test_unsupported_format(self):
+        with self.assertRaises(style2style.UnsupportedFormatException):
+            asyncio.run(aio.convertFile(self.sample, os.path.join(self.folder, "sample.xyz")))
+        self.assertEqual(os.listdir(self.folder), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
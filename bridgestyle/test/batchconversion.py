@@ -0,0 +1,84 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import context
+
+from bridgestyle import batch, style2style
+
+
+def _style(name):
+    return {"name": name, "rules": [
+        {"name": "rule", "filter": ["PropertyIsEqualTo", ["PropertyName", "type"], name],
+         "symbolizers": [{"kind": "Line", "color": "#ff0000", "width": 1, "opacity": 1.0,
+                          "Z": 0}]}]}
+
+
+class BatchConversionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.inputs = os.path.join(self.folder, "styles")
+        self.output = os.path.join(self.folder, "output")
+        for name in ("roads", "parks", os.path.join("water", "rivers")):
+            path = os.path.join(self.inputs, name + ".geostyler")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(_style(os.path.basename(name)), f)
+        with open(os.path.join(self.inputs, "broken.geostyler"), "w") as f:
+            f.write("{not json")
+        with open(os.path.join(self.inputs, "notes.txt"), "w") as f:
+            f.write("not a style")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _run(self, *args):
+        out = io.StringIO()
+        argv = sys.argv
+        sys.argv = ["style2style"] + list(args)
+        try:
+            with contextlib.redirect_stdout(out):
+                code = style2style.main()
+        finally:
+            sys.argv = argv
+        return code, out.getvalue()
+
+    def test_parallel(self):
+        results = list(batch.convertBatch([self.inputs], self.output, "sld", jobs=2))
+        self.assertEqual(sorted(os.path.relpath(r.input, self.inputs) for r in results),
+                         ["broken.geostyler", "parks.geostyler", "roads.geostyler",
+                          os.path.join("water", "rivers.geostyler")])
+        failed = [r for r in results if r.error is not None]
+        self.assertEqual([os.path.basename(r.input) for r in failed], ["broken.geostyler"])
+        # the layout of the inputs is kept
+        for name in ("roads", "parks", os.path.join("water", "rivers")):
+            with open(os.path.join(self.output, name + ".sld")) as f:
+                self.assertIn("<ogc:Literal>%s</ogc:Literal>" % os.path.basename(name), f.read())
+        self.assertFalse(os.path.exists(os.path.join(self.output, "broken.sld")))
+
+    def test_formats(self):
+        results = list(batch.convertBatch([os.path.join(self.inputs, "*.geostyler")],
+                                          self.output, ["sld", "mapbox"], jobs=1))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(sorted(os.listdir(self.output)),
+                         ["parks.mapbox", "parks.sld", "roads.mapbox", "roads.sld"])
+
+    def test_summary(self):
+        code, out = self._run("--to", "sld", "--jobs", "2", self.inputs, self.output)
+        self.assertEqual(code, 1)
+        self.assertIn("3 files converted, 1 failed", out)
+        self.assertIn("FAILED %s" % os.path.join(self.inputs, "broken.geostyler"), out)
+        self.assertIn("Failures:\n  %s: " % os.path.join(self.inputs, "broken.geostyler"), out)
+        os.remove(os.path.join(self.inputs, "broken.geostyler"))
+        code, out = self._run("--to", "mapbox", self.inputs, self.output)
+        self.assertEqual(code, 0)
+        self.assertIn("3 files converted, 0 failed", out)
+
+
+if __name__ == '__main__':
+    unittest.main()
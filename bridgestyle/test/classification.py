@@ -0,0 +1,132 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import context
+
+from bridgestyle import sld, mapserver
+from bridgestyle.geostyler import evaluator
+from bridgestyle.sql import fromgeostyler
+
+if evaluator.numpy is not None:
+    from bridgestyle.sql import classification
+
+_DATA = os.path.join(os.path.dirname(__file__), "data", "qgis")
+
+
+def _prop(name):
+    return ["PropertyName", name]
+
+
+def _rule(name, ruleFilter):
+    return {"name": name, "filter": ruleFilter,
+            "symbolizers": [{"kind": "Mark", "wellKnownName": "circle", "color": "#ff0000",
+                             "Z": 0}]}
+
+
+def _style():
+    # the points layer has the Ids 1 to 13
+    return {"name": "points", "rules": [
+        _rule("low", ["PropertyIsLessThan", _prop("Id"), 5]),
+        _rule("odd", ["PropertyIsEqualTo",
+                      ["Sub", _prop("Id"), ["Mul", ["floor", ["Div", _prop("Id"), 2]], 2]], 1]),
+        _rule("none", ["PropertyIsEqualTo", _prop("Id"), 99]),
+        _rule("area", ["PropertyIsGreaterThan", ["area", _prop("geom")], 10]),
+        _rule("all", None),
+        _rule("other", "ELSE")]}
+
+
+@unittest.skipIf(evaluator.numpy is None, "NumPy is not installed")
+class ClassificationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.points = os.path.join(self.folder, "points.gpkg")
+        shutil.copy(os.path.join(_DATA, "points", "testlayer.gpkg"), self.points)
+        self.db = sqlite3.connect(self.points)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.folder)
+
+    def _ids(self, where, params=(), table="points"):
+        sql = 'SELECT "Id" FROM "%s"' % table
+        if where is not None:
+            sql += " WHERE " + where
+        return sorted(row[0] for row in self.db.execute(sql, params))
+
+    def test_classify(self):
+        style = _style()
+        classified, warnings = classification.classify(style, self.db, "points")
+        self.assertEqual(len(warnings), 1)
+        # classes are numbered in the order of the features: 1 is low and
+        # odd, 2 is low and 3 is odd
+        self.assertEqual([rule["filter"] for rule in classified["rules"]], [
+            ["In", _prop("style_class"), 1, 2],
+            ["In", _prop("style_class"), 1, 3],
+            style["rules"][3]["filter"],
+            None,
+            "ELSE"])
+        self.assertEqual(self.db.execute(
+            'SELECT "style_class", rules FROM "points_style_class_classes"').fetchall(),
+            [(0, "[]"), (1, "[0, 1]"), (2, "[0]"), (3, "[1]")])
+        # the classified rules select the same features
+        for before, after in zip(fromgeostyler.convert(style)[0][:2],
+                                 fromgeostyler.convert(classified)[0][:2]):
+            self.assertEqual(self._ids(before["where"], before["params"]),
+                             self._ids(after["where"], after["params"]))
+        # the rule that no feature has is removed
+        self.assertNotIn("none", [rule["name"] for rule in classified["rules"]])
+        sldstring = sld.fromgeostyler.convert(classified)[0]
+        self.assertIn("<ogc:PropertyName>style_class</ogc:PropertyName>", sldstring)
+        self.assertNotIn("<ogc:Literal>False</ogc:Literal>", sldstring)
+        mapfile = mapserver.fromgeostyler.convert(classified)[0]
+        self.assertIn('EXPRESSION ("[style_class]" IN "1,2")', mapfile)
+        self.assertNotIn("False", mapfile)
+
+    def test_resume(self):
+        db = sqlite3.connect(":memory:")
+        db.execute('CREATE TABLE roads ("type" TEXT, "lanes" INTEGER)')
+        db.executemany("INSERT INTO roads VALUES (?, ?)",
+                       [(["a", "b", None][i % 3], i % 5) for i in range(100)])
+        style = {"name": "roads", "rules": [
+            _rule("a", ["PropertyIsEqualTo", _prop("type"), "a"]),
+            _rule("wide", ["PropertyIsGreaterThan", _prop("lanes"), 2])]}
+        expected = classification.classify(style, db, "roads", sideTable="classes",
+                                           batchSize=7)[0]
+        classes = db.execute("SELECT * FROM classes").fetchall()
+        self.assertEqual(len(classes), 100)
+        # features after the last one written are classified, the rest are not
+        db.execute("DELETE FROM classes WHERE fid > 50")
+        db.execute("UPDATE classes SET style_class = -1 WHERE fid = 1")
+        db.executemany("INSERT INTO roads VALUES (?, ?)", [("a", 4), ("c", 3)])
+        result = classification.classify(style, db, "roads", sideTable="classes")[0]
+        self.assertEqual(result, expected)
+        self.assertEqual(db.execute("SELECT * FROM classes").fetchall(),
+                         [(1, -1)] + classes[1:] + [(101, classes[3][1]), (102, classes[4][1])])
+        style["rules"][1]["filter"][2] = 3
+        with self.assertRaises(ValueError):
+            classification.classify(style, db, "roads", sideTable="classes")
+        classification.classify(style, db, "roads", sideTable="classes", restart=True)
+        self.assertEqual(db.execute("SELECT count(*) FROM classes WHERE style_class = -1")
+                         .fetchone(), (0,))
+
+    def test_file(self):
+        styleFile = os.path.join(self.folder, "style.json")
+        output = os.path.join(self.folder, "classified.json")
+        with open(styleFile, "w") as f:
+            f.write('{"name": "points", "rules": [{"name": "low", "filter": '
+                    '["PropertyIsLessThan", ["PropertyName", "Id"], 5], "symbolizers": []}]}')
+        self.db.close()
+        warnings = classification.classifyFile(styleFile, self.points, "points", output,
+                                               column="cls")
+        self.assertEqual(warnings, [])
+        self.db = sqlite3.connect(self.points)
+        self.assertEqual(self._ids('"cls" = 1'), [1, 2, 3, 4])
+        with self.assertRaises(ValueError):
+            classification.classify({}, os.path.join(self.folder, "none.gpkg"), "points")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import context
+
+from bridgestyle import sld
+from bridgestyle import cache as cachemodule
+from bridgestyle.cache import ConversionCache
+
+sample_file = os.path.join(os.path.dirname(__file__), "data", "qgis", "points", "simplemarker.geostyler")
+
+
+class ConversionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        with open(sample_file) as f:
+            self.geostyler = json.load(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_hit_returns_same_result(self):
+        cache = ConversionCache(self.folder)
+        expected = sld.fromgeostyler.convert(self.geostyler)
+        self.assertEqual(cache.convert("sld", self.geostyler), expected)
+        self.assertEqual(cache.convert("sld", self.geostyler), expected)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_key_is_canonical(self):
+        cache = ConversionCache(self.folder)
+        reordered = json.loads(json.dumps(self.geostyler, sort_keys=True))
+        self.assertEqual(cache.key("sld", self.geostyler), cache.key("sld", reordered))
+        self.assertNotEqual(cache.key("sld", self.geostyler), cache.key("mapbox", self.geostyler))
+
+    def test_key_changes_with_the_code(self):
+        cache = ConversionCache(self.folder)
+        key = cache.key("sld", self.geostyler)
+        digest = cachemodule.codeDigest()
+        self.assertEqual(len(digest), 64)
+        try:
+            cachemodule._codeDigest = "0" * 64
+            self.assertNotEqual(cache.key("sld", self.geostyler), key)
+        finally:
+            cachemodule._codeDigest = digest
+        self.assertEqual(cache.key("sld", self.geostyler), key)
+
+    def test_lru_eviction(self):
+        cache = ConversionCache(self.folder, maxSize=10000)
+        keys = []
+        for i in range(30):
+            self.geostyler["name"] = "style%i" % i
+            keys.append(cache.key("sld", self.geostyler))
+            cache.convert("sld", self.geostyler)
+            # keep the first entry in use
+            cache.get(keys[0])
+        cache.evict()
+        self.assertLessEqual(cache.size(), 10000)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
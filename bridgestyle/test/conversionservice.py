@@ -0,0 +1,146 @@
+import http.client
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import context
+
+from bridgestyle import service
+
+
+def _style(name):
+    return {"name": name, "rules": [
+        {"name": "rule", "symbolizers": [{"kind": "Line", "color": "#ff0000", "width": 1,
+                                          "opacity": 1.0, "Z": 0}]}]}
+
+
+class _UnixConnection(http.client.HTTPConnection):
+
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+class _SlowService(service.ConversionService):
+    # holds conversions until released, counting them
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def _convert(self, fromFormat, toFormat, style):
+        self.calls += 1
+        self.release.wait(10)
+        return super()._convert(fromFormat, toFormat, style)
+
+
+class ConversionServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.socketPath = os.path.join(self.folder, "service.sock")
+        self.servers = []
+
+    def tearDown(self):
+        for server, thread in self.servers:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        shutil.rmtree(self.folder)
+
+    def _start(self, conversionService, **kwargs):
+        server = service.createServer(conversionService, **kwargs)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.servers.append((server, thread))
+        return server
+
+    def _connection(self):
+        return _UnixConnection(self.socketPath)
+
+    def _request(self, method, path, body=None, connection=None):
+        connection = connection or self._connection()
+        try:
+            connection.request(method, path, None if body is None else json.dumps(body))
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def test_convert(self):
+        self._start(service.ConversionService(), socketPath=self.socketPath)
+        status, response = self._request("POST", "/convert", {
+            "from": "geostyler", "to": "sld", "style": _style("roads")})
+        self.assertEqual(status, 200)
+        self.assertIn("<Name>roads</Name>", response["style"])
+        self.assertEqual(response["warnings"], [])
+        status, response = self._request("POST", "/convert", {
+            "from": "geostyler", "to": "xyz", "style": _style("roads")})
+        self.assertEqual(status, 400)
+        self.assertIn("error", response)
+        status, response = self._request("POST", "/convert", {"from": "geostyler"})
+        self.assertEqual((status, response), (400, {"error": "KeyError: 'to'"}))
+        self.assertEqual(self._request("GET", "/other")[0], 404)
+        stats = self._request("GET", "/stats")[1]
+        self.assertEqual((stats["requests"], stats["conversions"], stats["errors"]), (3, 1, 2))
+
+    def test_port(self):
+        server = self._start(service.ConversionService(), port=0)
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        self.assertEqual(self._request("GET", "/health", connection=connection),
+                         (200, {"status": "ok"}))
+
+    def test_coalescing(self):
+        slow = _SlowService()
+        self._start(slow, socketPath=self.socketPath)
+        request = {"from": "geostyler", "to": "mapbox", "style": _style("roads")}
+        responses = []
+
+        def send():
+            responses.append(self._request("POST", "/convert", request))
+
+        threads = [threading.Thread(target=send) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        deadline = time.time() + 10
+        while slow.stats.coalesced < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        slow.release.set()
+        for thread in threads:
+            thread.join()
+        # a single conversion answers the three requests
+        self.assertEqual(slow.calls, 1)
+        self.assertEqual(len(responses), 3)
+        self.assertTrue(all(r == responses[0] for r in responses))
+        self.assertEqual(responses[0][0], 200)
+        stats = self._request("GET", "/stats")[1]
+        self.assertEqual((stats["requests"], stats["conversions"], stats["coalesced"]), (3, 1, 2))
+        self.assertIsNotNone(stats["latency"]["p50"])
+
+    def test_socket_path(self):
+        # a leftover socket is replaced, but other files are not removed
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socketPath)
+        stale.close()
+        self._start(service.ConversionService(), socketPath=self.socketPath)
+        self.assertEqual(self._request("GET", "/health")[0], 200)
+        path = os.path.join(self.folder, "style.sld")
+        with open(path, "w") as f:
+            f.write("<StyledLayerDescriptor/>")
+        with self.assertRaises(ValueError):
+            service.createServer(service.ConversionService(), socketPath=path)
+        with open(path) as f:
+            self.assertEqual(f.read(), "<StyledLayerDescriptor/>")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import context
+
+from bridgestyle import synthetic
+from bridgestyle.geostyler import cost, model
+
+
+def _prop(name):
+    return ["PropertyName", name]
+
+
+def _style():
+    return {"name": "landuse", "rules": [
+        {"name": "roads", "filter": ["PropertyIsEqualTo", _prop("type"), "road"],
+         "symbolizers": [{"kind": "Line", "color": "#ff0000", "width": _prop("width"),
+                          "Z": 0}]},
+        {"name": "labels", "scaleDenominator": {"max": 10000},
+         "symbolizers": [{"kind": "Text", "label": ["strToUpper", _prop("name")],
+                          "size": ["Mul", _prop("lanes"), 2], "Z": 1}]},
+        {"name": "parks", "scaleDenominator": {"min": 5000},
+         "filter": ["PropertyIsEqualTo", _prop("type"), "park"],
+         "symbolizers": [
+             {"kind": "Fill", "Z": 0, "graphicFill": [
+                 {"kind": "Mark", "wellKnownName": "circle", "size": _prop("size")}]},
+             {"kind": "Line", "color": "#00ff00", "width": 1, "Z": 0}]}]}
+
+
+class CostTest(unittest.TestCase):
+
+    def test_analyze(self):
+        report = cost.analyze(_style())
+        # between 1:5000 and 1:10000 all the rules are active: two passes, a
+        # Rule element for each of the four symbolizers, with three filter
+        # nodes each except the labels, and a feature draws the label and
+        # the graphic fill of the parks
+        self.assertEqual(report["scale"], {"min": 5000, "max": 10000})
+        self.assertEqual({key: report[key] for key in (
+            "rules", "passes", "ruleEvaluations", "filterNodes", "properties",
+            "propertyNodes", "labels", "graphics")}, {
+            "rules": 3, "passes": 2, "ruleEvaluations": 4, "filterNodes": 9,
+            "properties": 3, "propertyNodes": 6, "labels": 1, "graphics": 1})
+        self.assertEqual(report["cost"], 2 * 10 + 4 + 9 + 6 + 25 + 5)
+        self.assertEqual([rule["name"] for rule in report["expensiveRules"]],
+                         ["labels", "parks", "roads"])
+        # weights can be changed
+        self.assertEqual(cost.analyze(_style(), weights={"label": 0})["cost"], 69 - 25)
+        self.assertEqual(cost.expressionNodes(["Add", _prop("a"), ["Mul", _prop("b"), 2]]), 5)
+
+    def test_model(self):
+        # compact styles, with shared expressions, cost the same
+        style = synthetic.geostylerStyle(200, seed=3, expressionDepth=4)
+        compact = model.loads(json.dumps(style))
+        self.assertEqual(cost.analyze(compact), cost.analyze(style))
+        self.assertEqual(cost.analyze({"name": "empty", "rules": []})["cost"], 0)
+
+    def test_main(self):
+        folder = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(folder, "small.geostyler"), "w") as f:
+                json.dump({"name": "small", "rules": _style()["rules"][:1]}, f)
+            with open(os.path.join(folder, "landuse.geostyler"), "w") as f:
+                json.dump(_style(), f)
+            with open(os.path.join(folder, "notes.txt"), "w") as f:
+                f.write("not a style")
+            reports, errors = cost.analyzeFiles([folder])
+            self.assertEqual(errors, [])
+            self.assertEqual([report["name"] for report in reports], ["landuse", "small"])
+            self.assertIn("landuse.geostyler (1:5000-1:10000) *",
+                          cost.formatReports(reports, threshold=50))
+            for args, code in [(["--threshold", "50"], 1), (["--threshold", "100"], 0),
+                               ([], 0)]:
+                out = io.StringIO()
+                argv, stdout = sys.argv, sys.stdout
+                sys.argv = ["cost", "--json", folder] + args
+                sys.stdout = out
+                try:
+                    self.assertEqual(cost.main(), code)
+                finally:
+                    sys.argv, sys.stdout = argv, stdout
+                self.assertEqual(json.loads(out.getvalue())["styles"], reports)
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import copy
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+import context
+
+from bridgestyle.sql import fromgeostyler, pruning
+
+_DATA = os.path.join(os.path.dirname(__file__), "data", "qgis")
+
+
+def _prop(name):
+    return ["PropertyName", name]
+
+
+def _rule(name, ruleFilter):
+    return {"name": name, "filter": ruleFilter,
+            "symbolizers": [{"kind": "Mark", "color": "#ff0000", "Z": 0}]}
+
+
+class DataPruningTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        # SQLite writes the WAL files of the layer next to it, even to read it
+        self.points = os.path.join(self.folder, "points.gpkg")
+        shutil.copy(os.path.join(_DATA, "points", "testlayer.gpkg"), self.points)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_prune(self):
+        # the points layer has the Ids 1 to 13
+        style = {"name": "points", "rules": [
+            _rule("set", ["In", _prop("Id"), 1, 2, 99, 100]),
+            _rule("missing", ["PropertyIsEqualTo", _prop("Id"), 50]),
+            _rule("unknown", ["PropertyIsEqualTo", _prop("nope"), 50]),
+            _rule("not", ["Not", ["In", _prop("Id"), 77, 3]]),
+            _rule("other", "ELSE")]}
+        original = copy.deepcopy(style)
+        pruned, report, warnings = pruning.prune(style, self.points)
+        self.assertEqual(style, original)
+        self.assertEqual([rule["filter"] for rule in pruned["rules"]], [
+            ["In", _prop("Id"), 1, 2],
+            ["PropertyIsEqualTo", _prop("nope"), 50],
+            ["Not", ["In", _prop("Id"), 3]],
+            "ELSE"])
+        self.assertEqual((report["table"], report["features"], report["unmatched"]),
+                         ("points", 13, 0))
+        # rules with unknown columns are not counted, nor the ELSE rules then
+        self.assertEqual([rule["features"] for rule in report["rules"]], [2, 0, None, 12, None])
+        self.assertEqual([(v["value"], v["features"]) for v in report["values"]],
+                         [(1, 1), (2, 1), (99, 0), (100, 0), (77, 0), (3, 1)])
+        self.assertEqual(warnings, [
+            "Features of rule 'unknown' not counted: the table has no nope",
+            "Removed values from rule 'set': Id=99, Id=100",
+            "Removed rule 'missing': no feature matches its filter",
+            "Removed values from rule 'not': Id=77"])
+        with self.assertRaises(ValueError):
+            pruning.coverage(style, self.points, "roads")
+
+    def test_else(self):
+        style = {"name": "points", "rules": [
+            _rule("low", ["PropertyIsLessThan", _prop("Id"), 5]),
+            _rule("high", ["PropertyIsGreaterThan", _prop("Id"), 10])]}
+        report = pruning.coverage(style, self.points)[0]
+        self.assertEqual(report["unmatched"], 6)
+        report = pruning.coverage(style, self.points, sample=5)[0]
+        self.assertEqual((report["features"], report["sample"], report["unmatched"]),
+                         (5, True, 1))
+        self.assertEqual([rule["features"] for rule in report["rules"]], [4, 0])
+        style["rules"].append(_rule("other", "ELSE"))
+        report = pruning.coverage(style, self.points)[0]
+        self.assertEqual((report["unmatched"], report["rules"][2]["features"]), (0, 6))
+        style["rules"].insert(0, _rule("all", None))
+        pruned, report, warnings = pruning.prune(style, self.points)
+        self.assertEqual(report["rules"][-1]["features"], 0)
+        self.assertEqual(len(pruned["rules"]), 3)
+
+    def test_counts(self):
+        # counts are the number of rows each WHERE clause selects
+        rnd = random.Random(1)
+        db = sqlite3.connect(":memory:")
+        db.execute('CREATE TABLE roads ("type" TEXT, "lanes" INTEGER, "speed" REAL)')
+        db.executemany("INSERT INTO roads VALUES (?, ?, ?)", [
+            (rnd.choice(["a", "b", "c", "A", None]), rnd.randrange(6),
+             rnd.choice([None, rnd.random() * 100])) for i in range(2000)])
+        style = {"name": "roads", "rules": [
+            _rule("type", ["In", _prop("type"), "a", "b", "x"]),
+            _rule("lanes", ["PropertyIsGreaterThanOrEqualTo", _prop("lanes"), 4]),
+            _rule("fast", ["And", ["PropertyIsGreaterThan", _prop("speed"), 50],
+                           ["PropertyIsLike", _prop("type"), "a%"]]),
+            _rule("text", ["PropertyIsEqualTo", _prop("lanes"), "3"]),
+            _rule("none", ["PropertyIsEqualTo", _prop("lanes"), 9])]}
+        report = pruning.coverage(style, db, "roads")[0]
+        rules = fromgeostyler.convert(style)[0]
+        expected = [db.execute('SELECT count(*) FROM "roads" WHERE ' + rule["where"],
+                               rule["params"]).fetchone()[0] for rule in rules]
+        self.assertEqual([rule["features"] for rule in report["rules"]], expected)
+        self.assertEqual(expected[-1], 0)
+        where = " OR ".join("COALESCE(%s, 0)" % rule["where"] for rule in rules)
+        params = [param for rule in rules for param in rule["params"]]
+        self.assertEqual(report["unmatched"], db.execute(
+            'SELECT count(*) FROM "roads" WHERE NOT (%s)' % where, params).fetchone()[0])
+        # the temporary table is removed
+        self.assertEqual(db.execute("SELECT count(*) FROM sqlite_temp_master").fetchone(), (0,))
+
+    def test_deep(self):
+        depth = sys.getrecursionlimit() * 3
+        exp = ["In", _prop("Id"), 1, 1000]
+        for i in range(depth):
+            exp = ["Or", exp, ["PropertyIsEqualTo", _prop("Id"), -i]]
+        pruned, report, warnings = pruning.prune({"name": "points", "rules": [
+            _rule("deep", exp)]}, self.points, "points")
+        # the filter is too deep for SQLite, but not its values
+        self.assertEqual(report["rules"][0]["features"], None)
+        self.assertIn("Features not counted for rule 'deep'", " ".join(warnings))
+        exp = pruned["rules"][0]["filter"]
+        while exp[0] == "Or":
+            exp = exp[1]
+        self.assertEqual(exp, ["In", _prop("Id"), 1])
+
+    def test_file(self):
+        styleFile = os.path.join(self.folder, "style.json")
+        with open(styleFile, "w") as f:
+            json.dump({"name": "points", "rules": [
+                _rule("one", ["PropertyIsEqualTo", _prop("Id"), 1]),
+                _rule("none", ["PropertyIsEqualTo", _prop("Id"), 0])]}, f)
+        output = os.path.join(self.folder, "pruned.json")
+        reportFile = os.path.join(self.folder, "report.json")
+        warnings = pruning.pruneFile(styleFile, self.points, output, reportFile=reportFile)
+        self.assertEqual(len(warnings), 1)
+        with open(output) as f:
+            self.assertEqual([rule["name"] for rule in json.load(f)["rules"]], ["one"])
+        with open(reportFile) as f:
+            self.assertEqual([rule["removed"] for rule in json.load(f)["rules"]],
+                             [False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
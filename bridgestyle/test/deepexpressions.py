@@ -0,0 +1,130 @@
+import json
+import sys
+import unittest
+import context
+
+from bridgestyle import sld, mapboxgl, mapserver
+from bridgestyle.conversioncontext import conversionContext
+from bridgestyle.geostyler.expressions import ExpressionMemo
+
+
+def _equal(value):
+    return ["PropertyIsEqualTo", ["PropertyName", "a"], value]
+
+
+def _chain(ops, n):
+    # n comparisons in a chain nested to the left, cycling through ops
+    exp = _equal(0)
+    for i in range(1, n):
+        exp = [ops[i % len(ops)], exp, _equal(i)]
+    return exp
+
+
+_TRANSLATORS = {
+    "sld": sld.fromgeostyler.convertExpression,
+    "mapbox": mapboxgl.fromgeostyler.convertExpression,
+    "mapserver": mapserver.fromgeostyler.convertExpression,
+}
+
+
+def _translate(fmt, exp):
+    with conversionContext() as ctx:
+        return _TRANSLATORS[fmt](exp), ctx.warnings
+
+
+class DeepExpressionsTest(unittest.TestCase):
+
+    def test_deep(self):
+        depth = sys.getrecursionlimit() * 3
+        expressions = [_chain(["Or"], depth), _chain(["And", "Or"], depth),
+                       ["Or"] + [_equal(i) for i in range(depth)]]
+        exp = _equal(0)
+        for i in range(depth):
+            exp = ["Not", exp]
+        expressions.append(exp)
+        for fmt in _TRANSLATORS:
+            for exp in expressions:
+                self.assertIsNotNone(_translate(fmt, exp)[0])
+
+    def test_same_result(self):
+        # a chain with the same operator is written as the flat expression
+        chain = _chain(["Or"], 50)
+        flat = ["Or"] + [_equal(i) for i in range(50)]
+        self.assertEqual(_translate("mapserver", chain), _translate("mapserver", flat))
+        self.assertEqual(_translate("mapserver", _chain(["And", "Or"], 3)),
+                         ('((("[a]" = 0) OR ("[a]" = 1)) AND ("[a]" = 2))', []))
+        element = _translate("sld", _chain(["And", "Or"], 3))[0]
+        self.assertEqual(element.tag, "ogc:And")
+        self.assertEqual([child.tag for child in element], ["ogc:Or", "ogc:PropertyIsEqualTo"])
+        self.assertEqual(_translate("mapbox", ["Not", ["Mul", ["PropertyName", "w"], 2]])[0],
+                         ["!", ["*", ["get", "w"], 2]])
+
+    def test_warnings(self):
+        # warnings of unsupported operators are repeated when a translation is reused
+        exp = ["Add", ["Unsupported", 1], ["Unsupported", 1]]
+        for fmt in ["mapbox", "mapserver"]:
+            self.assertEqual(len(_translate(fmt, exp)[1]), 2)
+
+    def test_memo(self):
+        warnings = []
+        memo = ExpressionMemo(warnings)
+        calls = []
+
+        def prepare(exp, variant):
+            calls.append(exp)
+            if exp[0] == "unsupported":
+                warnings.append("Unsupported")
+            return exp[0], [(arg, variant) for arg in exp[1:] if isinstance(arg, list)]
+
+        def combine(name, variant, translations):
+            return [name.upper()] + list(translations)
+
+        exp = ["add", ["unsupported"], ["get", "a"], ["get", "a"]]
+        results = [memo.translateTree("test", exp, prepare, combine) for i in range(3)]
+        self.assertEqual(results[0], ["ADD", ["UNSUPPORTED"], ["GET"], ["GET"]])
+        self.assertIs(results[1], results[2])
+        # ["get", "a"] is kept the second time it is found, in the first
+        # translation, and the other expressions in the second one
+        self.assertEqual(len(calls), 4 + 2)
+        self.assertEqual(warnings, ["Unsupported"] * 3)
+        stats = memo.stats["test"]
+        self.assertEqual((stats.translated, stats.reused), (6, 3))
+
+    def test_convert(self):
+        depth = sys.getrecursionlimit() * 3
+        style = {"name": "deep", "rules": [
+            {"name": "rule", "filter": _chain(["Or"], depth),
+             "symbolizers": [{"kind": "Line", "color": "#ff0000", "width": 1, "Z": 0}]}]}
+        sldstring = sld.fromgeostyler.convert(style)[0]
+        self.assertEqual(sldstring.count("<ogc:Or>"), 1)
+        layers = json.loads(mapboxgl.fromgeostyler.convert(style)[0])["layers"]
+        self.assertEqual(len(layers[0]["filter"]), depth + 1)
+        self.assertIn("EXPRESSION ((", mapserver.fromgeostyler.convert(style)[0])
+
+    def test_convert_mixed(self):
+        # the optimizer and the writers run by convert() do not recurse either
+        depth = sys.getrecursionlimit() * 3
+        negated = _equal(0)
+        width = ["PropertyName", "w"]
+        for i in range(depth):
+            negated = ["Not", negated]
+            width = ["Add", width, 1]
+        filters = [_chain(["And", "Or"], depth), negated,
+                   ["PropertyIsGreaterThan", width, 3]]
+        for ruleFilter in filters:
+            style = {"name": "deep", "rules": [
+                {"name": "rule", "filter": ruleFilter,
+                 "symbolizers": [{"kind": "Line", "color": "#ff0000", "width": width,
+                                  "Z": 0}]}]}
+            # the width is in every style, and in the filter of the last one
+            sldstring = sld.fromgeostyler.convert(style)[0]
+            self.assertIn(sldstring.count("<ogc:Add>"), (depth, 2 * depth))
+            # too deep for json.loads
+            mapboxstring = mapboxgl.fromgeostyler.convert(style)[0]
+            self.assertIn(mapboxstring.count('"+"'), (depth, 2 * depth))
+            self.assertTrue('"filter": [\n' in mapboxstring)
+            mapfile = mapserver.fromgeostyler.convert(style)[0]
+            self.assertTrue("EXPRESSION " in mapfile and "WIDTH (((" in mapfile)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import unittest
+import context
+
+from bridgestyle import synthetic
+from bridgestyle.geostyler import model
+from bridgestyle.geostyler.dependencies import Dependencies, expressionProperties
+from bridgestyle.geostyler.rules import zoomToScale
+
+
+def _prop(name):
+    return ["PropertyName", name]
+
+
+def _style():
+    return {"name": "roads", "rules": [
+        {"name": "primary", "filter": ["PropertyIsEqualTo", _prop("type"), "primary"],
+         "symbolizers": [{"kind": "Line", "color": "#ff0000", "width": _prop("width"),
+                          "Z": 0}]},
+        {"name": "labels", "scaleDenominator": {"max": 10000},
+         "symbolizers": [{"kind": "Text", "label": ["strToUpper", _prop("name")],
+                          "size": ["Mul", _prop("lanes"), 2], "Z": 1}]},
+        {"name": "centroids", "scaleDenominator": {"min": 5000, "max": 50000},
+         "filter": ["PropertyIsGreaterThan", _prop("lanes"), 2],
+         "symbolizers": [{"kind": "Mark", "wellKnownName": "circle", "Z": 2,
+                          "Geometry": ["centroid", _prop("geom")]}]},
+        {"name": "other", "filter": "ELSE", "scaleDenominator": {"min": 20000},
+         "symbolizers": [{"kind": "Line", "color": "#cccccc", "width": 1, "Z": 0}]}]}
+
+
+class DependenciesTest(unittest.TestCase):
+
+    def test_rules(self):
+        dependencies = Dependencies(_style())
+        self.assertEqual(dependencies.rules, [
+            {"type", "width"}, {"name", "lanes"}, {"lanes", "geom"},
+            # ELSE rules need the filters of the other rules active with them
+            {"type", "lanes"}])
+        self.assertEqual(dependencies.all, {"type", "width", "name", "lanes", "geom"})
+        self.assertEqual(expressionProperties(["Add", _prop("a"), ["Mul", _prop("b"), 2]]),
+                         {"a", "b"})
+
+    def test_scales(self):
+        dependencies = Dependencies(_style())
+        self.assertEqual(dependencies.at(1000), {"type", "width", "name", "lanes"})
+        self.assertEqual(dependencies.at(100000), {"type", "width", "lanes"})
+        self.assertEqual(dependencies.between(10000, 20000),
+                         {"type", "width", "lanes", "geom"})
+        self.assertEqual([(minScale, maxScale) for minScale, maxScale, p in dependencies.bands()],
+                         [(None, 5000), (5000, 10000), (10000, 20000), (20000, 50000),
+                          (50000, None)])
+        for minScale, maxScale, properties in dependencies.bands():
+            self.assertEqual(properties, dependencies.at(minScale or 0))
+        self.assertEqual(dependencies.includeList(), ["geom", "lanes", "name", "type", "width"])
+        self.assertEqual(dependencies.includeList(0, 2), ["lanes", "type", "width"])
+        zooms = dependencies.byZoom([0, 10, 16, 24])
+        self.assertEqual(zooms[0], (0, 10, dependencies.between(zoomToScale(10))))
+        self.assertEqual(zooms[-1][2], {"type", "width", "name", "lanes"})
+
+    def test_processing(self):
+        dependencies = Dependencies(_style())
+        self.assertEqual(dependencies.processing(),
+                         'PROCESSING "ITEMS=geom,lanes,name,type,width"')
+        self.assertEqual(dependencies.processing(dependencies.at(100000)),
+                         'PROCESSING "ITEMS=lanes,type,width"')
+        with self.assertRaises(ValueError):
+            dependencies.processing({"a,b"})
+
+    def test_model(self):
+        # compact styles, with shared expressions, have the same dependencies
+        style = synthetic.geostylerStyle(200, seed=3, expressionDepth=4)
+        compact = model.loads(json.dumps(style))
+        self.assertEqual(Dependencies(compact).rules, Dependencies(style).rules)
+        self.assertTrue(Dependencies(style).all)
+
+
+if __name__ == '__main__':
+    unittest.main()
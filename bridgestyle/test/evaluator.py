@@ -0,0 +1,113 @@
+import json
+import unittest
+import context
+
+from bridgestyle import synthetic
+from bridgestyle.geostyler import model
+from bridgestyle.geostyler import evaluator
+from bridgestyle.geostyler.evaluator import (RuleEvaluator, UnsupportedExpressionException,
+                                             compileExpression)
+
+numpy = evaluator.numpy
+
+
+def _prop(name):
+    return ["PropertyName", name]
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class EvaluatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.columns = {"TYPE": numpy.array(["road", "street", "path", "road", "Lane"]),
+                        "WIDTH": numpy.array([10, 5, 1, 12, 3]),
+                        "CODE": numpy.array(["1", "2", "3", "4", "5"])}
+
+    def _evaluate(self, exp):
+        return compileExpression(exp).evaluate(self.columns).tolist()
+
+    def test_operators(self):
+        self.assertEqual(self._evaluate(["PropertyIsGreaterThan", _prop("WIDTH"), 4]),
+                         [True, True, False, True, False])
+        self.assertEqual(self._evaluate(["And", ["PropertyIsEqualTo", _prop("TYPE"), "road"],
+                                         ["Not", ["PropertyIsLessThan",
+                                                  ["Mul", _prop("WIDTH"), 2], 21]]]),
+                         [False, False, False, True, False])
+        self.assertEqual(self._evaluate(["In", _prop("TYPE"), "road", "path"]),
+                         [True, False, True, True, False])
+        self.assertEqual(self._evaluate(["PropertyIsLike", _prop("TYPE"), "%e_t"]),
+                         [False, True, False, False, False])
+        # numbers and texts are compared as numbers if possible
+        self.assertEqual(self._evaluate(["PropertyIsEqualTo", _prop("WIDTH"), "5"]),
+                         [False, True, False, False, False])
+        self.assertEqual(self._evaluate(["PropertyIsLessThan", _prop("CODE"), 3]),
+                         [True, True, False, False, False])
+        self.assertEqual(self._evaluate(True), [True] * 5)
+
+    def test_functions(self):
+        self.assertEqual(self._evaluate(["strToUpper", _prop("TYPE")]),
+                         ["ROAD", "STREET", "PATH", "ROAD", "LANE"])
+        self.assertEqual(self._evaluate(["Concatenate", _prop("TYPE"), "-", _prop("WIDTH")]),
+                         ["road-10", "street-5", "path-1", "road-12", "Lane-3"])
+        self.assertEqual(self._evaluate(["strSubstr", _prop("TYPE"), 2, 3]),
+                         ["oad", "tre", "ath", "oad", "ane"])
+        self.assertEqual(self._evaluate(["strReplace", _prop("TYPE"), "a", "4"]),
+                         ["ro4d", "street", "p4th", "ro4d", "L4ne"])
+        self.assertEqual(self._evaluate(["if_then_else",
+                                         ["PropertyIsGreaterThan", _prop("WIDTH"), 4], 1, 0]),
+                         [1, 1, 0, 1, 0])
+        self.assertEqual(self._evaluate(["max", ["floor", ["Div", _prop("WIDTH"), 4]], 1]),
+                         [2, 1, 1, 3, 1])
+        with self.assertRaises(UnsupportedExpressionException):
+            compileExpression(["buffer", _prop("geom"), 10])
+        with self.assertRaises(KeyError):
+            self._evaluate(_prop("NAME"))
+
+    def test_rules(self):
+        style = {"rules": [
+            {"name": "wide", "filter": ["PropertyIsGreaterThan", _prop("WIDTH"), 8],
+             "symbolizers": []},
+            {"name": "roads", "filter": ["In", _prop("TYPE"), "road", "street"],
+             "symbolizers": [], "scaleDenominator": {"max": 10000}},
+            {"name": "never", "filter": ["PropertyIsLessThan", 2, 1], "symbolizers": []},
+            {"name": "other", "filter": "ELSE", "symbolizers": []}]}
+        rules = RuleEvaluator(style)
+        self.assertEqual(rules.ruleIndex(self.columns).tolist(), [0, 1, 3, 0, 3])
+        self.assertEqual(rules.matches(self.columns).astype(int).tolist(),
+                         [[1, 0, 0, 1, 0], [1, 1, 0, 1, 0], [0, 0, 0, 0, 0], [0, 0, 1, 0, 1]])
+        # the roads rule is not active at that scale
+        self.assertEqual(rules.ruleIndex(self.columns, scale=25000).tolist(), [0, 3, 3, 0, 3])
+        batches = [{name: values[i:i + 2] for name, values in self.columns.items()}
+                   for i in range(0, 5, 2)]
+        self.assertEqual([r.tolist() for r in rules.ruleIndexBatches(batches)],
+                         [[0, 1], [3, 0], [3]])
+        compact = model.loads(json.dumps(style))
+        self.assertEqual(RuleEvaluator(compact).ruleIndex(self.columns).tolist(),
+                         [0, 1, 3, 0, 3])
+
+    def test_synthetic(self):
+        # the first rule of each feature, evaluated in different ways
+        columns = synthetic.attributeColumns(2000, seed=1, nvalues=50)
+        for style in [synthetic.categorizedStyle(60, seed=1),
+                      synthetic.geostylerStyle(60, seed=1, expressionDepth=3, orLength=3)]:
+            rules = RuleEvaluator(style)
+            self.assertTrue(rules.factorized)
+            matches = rules.matches(columns)
+            expected = numpy.where(matches.any(axis=0), matches.argmax(axis=0), -1)
+            self.assertEqual(rules.ruleIndex(columns).tolist(), expected.tolist())
+            rules.factorized = set()
+            self.assertEqual(rules.matches(columns).tolist(), matches.tolist())
+            self.assertEqual(rules.ruleIndex(columns).tolist(), expected.tolist())
+        values = numpy.array(["value%i" % i for i in range(60)])
+        self.assertEqual(RuleEvaluator(synthetic.categorizedStyle(60)).ruleIndex(
+            {"TYPE": values}).tolist(), list(range(60)))
+
+    def test_deep(self):
+        exp = ["PropertyIsEqualTo", _prop("TYPE"), "road"]
+        for i in range(5000):
+            exp = ["Not", exp]
+        self.assertEqual(self._evaluate(exp), [True, False, False, True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import unittest
+import context
+
+from bridgestyle import sld, mapboxgl, mapserver
+from bridgestyle import profiling
+from bridgestyle import synthetic
+from bridgestyle.geostyler import model
+from bridgestyle.geostyler.expressions import ExpressionMemo
+
+
+class ExpressionMemoTest(unittest.TestCase):
+
+    def _memo(self):
+        # translates expressions by turning their operators to uppercase,
+        # translating arguments through the memo, as converters do
+        calls = []
+        warnings = []
+        memo = ExpressionMemo(warnings)
+
+        def translate(exp, variant=None):
+            calls.append(exp)
+            if exp[0] == "unsupported":
+                warnings.append("Unsupported")
+            return [exp[0].upper()] + [memo.translate("test", translate, arg)
+                                       if isinstance(arg, list) else arg
+                                       for arg in exp[1:]]
+
+        return memo, translate, calls, warnings
+
+    def test_reuse(self):
+        memo, translate, calls, warnings = self._memo()
+        results = [memo.translate("test", translate, ["mul", 2, ["get", "width"]])
+                   for i in range(3)]
+        # translations are kept from the second one
+        self.assertEqual(results[0], results[1])
+        self.assertIs(results[1], results[2])
+        self.assertEqual(len(calls), 4)
+        memo.translate("test", translate, ["mul", 2.0, ["get", "width"]])
+        memo.translate("test", translate, ["mul", 2, ["get", "width"]], True)
+        self.assertEqual(len(calls), 6)
+        stats = memo.stats["test"]
+        self.assertEqual((stats.translated, stats.reused), (6, 3))
+        self.assertAlmostEqual(stats.hitRate, 1 / 3)
+
+    def test_model_nodes(self):
+        memo, translate, calls, warnings = self._memo()
+        style = model.styleFromDict({"rules": [
+            {"filter": ["eq", ["get", "type"], i], "symbolizers": []} for i in range(3)]})
+        for rule in style.rules:
+            memo.translate("test", translate, rule.filter)
+        # the ["get", "type"] node is reused the third time
+        self.assertEqual(len(calls), 5)
+
+    def test_warnings(self):
+        memo, translate, calls, warnings = self._memo()
+        for i in range(3):
+            memo.translate("test", translate, ["add", ["unsupported"], i])
+        self.assertEqual(warnings, ["Unsupported"] * 3)
+        self.assertEqual(len(calls), 5)
+
+    def test_converter_warnings(self):
+        symbolizer = {"kind": "Line", "color": "#ff0000", "width": ["unsupported", 1], "Z": 0}
+        style = {"name": "test", "rules": [{"name": "rule%i" % i, "symbolizers": [symbolizer]}
+                                           for i in range(3)]}
+        for module in [mapboxgl, mapserver]:
+            warnings = module.fromgeostyler.convert(style)[-1]
+            self.assertEqual(len(warnings), 3)
+
+    def test_shared_translations(self):
+        style = synthetic.categorizedStyle(50)
+        width = ("<ogc:Mul>\n<ogc:Literal>%r</ogc:Literal>\n<ogc:PropertyName>WIDTH</ogc:PropertyName>\n</ogc:Mul>"
+                 % synthetic._MM2PIXEL)
+        sldstring = sld.fromgeostyler.convert(style)[0]
+        lines = "\n".join(line.strip() for line in sldstring.splitlines())
+        self.assertEqual(lines.count(width), 100)
+        compact = model.loads(json.dumps(style))
+        for module in [sld, mapboxgl, mapserver]:
+            self.assertEqual(module.fromgeostyler.convert(compact),
+                             module.fromgeostyler.convert(style))
+
+    def test_profile_stats(self):
+        style = synthetic.categorizedStyle(10)
+        with profiling.profile(trace=False) as p:
+            mapserver.fromgeostyler.convert(style)
+        stats = p.expressionStats()["mapserver"]
+        # a filter for each value, and twice the width expression and the
+        # property names. The width is used twice in each rule
+        self.assertEqual(stats["translated"], 10 + 2 + 2 + 2)
+        self.assertEqual(stats["reused"], 8 + 18)
+
+
+if __name__ == '__main__':
+    unittest.main()
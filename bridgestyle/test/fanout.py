@@ -0,0 +1,60 @@
+import unittest
+import context
+
+from bridgestyle import sld, mapboxgl, mapserver
+from bridgestyle import fanout
+
+
+def _style():
+    return {
+        "name": "fanout",
+        "rules": [
+            {
+                "name": "a",
+                "filter": ["PropertyIsEqualTo", ["PropertyName", "type"], "road"],
+                "scaleDenominator": {"min": 1000, "max": 50000},
+                "symbolizers": [
+                    {"kind": "Line", "color": "#ff0000", "width": 2, "opacity": 1.0, "Z": 1},
+                    {"kind": "Icon", "image": "a.png", "size": 10, "opacity": 1.0, "rotate": 0, "Z": 0},
+                ],
+            },
+            {
+                "name": "b",
+                "filter": ["PropertyIsEqualTo", ["strToLower", ["PropertyName", "a"]], "x"],
+                "symbolizers": [
+                    {"kind": "Fill", "color": "#00ff00", "opacity": 0.5, "Z": 0},
+                ],
+            },
+            {
+                "name": "c",
+                "filter": "ELSE",
+                "symbolizers": [
+                    {"kind": "Line", "color": "#000000", "width": 1, "opacity": 1.0, "Z": 0},
+                ],
+            },
+        ],
+    }
+
+
+class FanoutTest(unittest.TestCase):
+
+    def test_same_as_single_conversions(self):
+        style = _style()
+        results = fanout.convert(style)
+        self.assertEqual(list(results.keys()), ["sld", "mapbox", "mapserver"])
+        self.assertEqual(results["sld"], sld.fromgeostyler.convert(style))
+        self.assertEqual(results["mapbox"], mapboxgl.fromgeostyler.convert(style))
+        self.assertEqual(results["mapserver"], mapserver.fromgeostyler.convert(style))
+
+    def test_warnings_are_kept_per_target(self):
+        results = fanout.convert(_style(), ["mapbox", "mapserver"])
+        self.assertEqual(len(results["mapbox"][-1]), 0)
+        self.assertEqual(len(results["mapserver"][-1]), 1)
+
+    def test_unsupported_target(self):
+        with self.assertRaises(ValueError):
+            fanout.convert(_style(), ["sld", "unknown"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+import tempfile
+import unittest
+import context
+
+from bridgestyle import registry, style2style
+
+_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_style = ('{"name": "s", "rules": [{"name": "r", "symbolizers": [{"kind": "Line", '
+          '"color": "#000000", "width": 1, "opacity": 1.0, "Z": 0}]}]}')
+
+_script = """
+import json
+import sys
+from bridgestyle import style2style
+style = '%s'
+style2style.convertStyle(style, "geostyler", "sld")
+print(json.dumps(sorted(sys.modules)))
+""" % _style
+
+
+class FormatRegistryTest(unittest.TestCase):
+
+    def test_builtin_formats(self):
+        for ext in ["geostyler", "sld", "mapbox", "mapserver"]:
+            self.assertTrue(registry.isSupported(ext))
+        self.assertFalse(registry.isSupported("unknownformat"))
+        self.assertTrue(registry.isReadable("sld"))
+        self.assertFalse(registry.isReadable("mapserver"))
+
+    def test_mapserver(self):
+        mapfile, warnings = style2style.convertStyle(_style, "geostyler", "mapserver")
+        self.assertIn("CLASS", mapfile)
+        with self.assertRaises(style2style.UnsupportedFormatException):
+            style2style.convertStyle(mapfile, "mapserver", "sld")
+        # batch conversions write the mapfile and its symbols
+        folder = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(folder, "s.geostyler"), "w") as f:
+                f.write(_style)
+            output = os.path.join(folder, "output")
+            subprocess.check_output([sys.executable, "-m", "bridgestyle.style2style",
+                                     "--to", "mapserver", "--jobs", "1", folder, output],
+                                    cwd=_root)
+            self.assertEqual(sorted(os.listdir(output)), ["s.map", "s_symbols.map"])
+        finally:
+            shutil.rmtree(folder)
+
+    def test_sld_conversion_only_loads_sld(self):
+        output = subprocess.check_output([sys.executable, "-c", _script], cwd=_root)
+        modules = json.loads(output)
+        self.assertIn("bridgestyle.sld.fromgeostyler", modules)
+        for name in ["xml.dom.minidom", "qgis", "PyQt5", "bridgestyle.mapboxgl.fromgeostyler",
+                     "bridgestyle.mapserver.fromgeostyler", "bridgestyle.arcgis.togeostyler",
+                     "bridgestyle.qgis"]:
+            self.assertNotIn(name, modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
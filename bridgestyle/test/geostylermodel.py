@@ -0,0 +1,101 @@
+import gc
+import json
+import tracemalloc
+import unittest
+import context
+
+from bridgestyle import sld, mapboxgl, mapserver
+from bridgestyle import synthetic
+from bridgestyle.geostyler import model, toGeostyler
+
+
+class GeostylerModelTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.text = json.dumps(synthetic.geostylerStyle(50))
+
+    def test_roundtrip(self):
+        style = model.loads(self.text)
+        self.assertEqual(style, json.loads(self.text))
+        self.assertEqual(model.dumps(style), self.text)
+        self.assertEqual(json.dumps(model.toDict(style)), self.text)
+        self.assertEqual(toGeostyler(self.text, compact=True), style)
+
+    def test_types(self):
+        style = model.loads(self.text)
+        self.assertIsInstance(style, model.Style)
+        rule = style.rules[0]
+        self.assertIsInstance(rule, model.Rule)
+        for symbolizer in rule.symbolizers:
+            self.assertIsInstance(symbolizer, model.SYMBOLIZERS[symbolizer.kind])
+        self.assertIs(style.name, style["name"])
+        with self.assertRaises(AttributeError):
+            rule.missing
+
+    def test_shared_values(self):
+        text = json.dumps({"name": "style", "rules": [
+            {"name": "a", "filter": ["==", ["get", "type"], 1], "symbolizers": []},
+            {"name": "b", "filter": ["==", ["get", "type"], 1.0], "symbolizers": []},
+            {"name": "c", "filter": ["==", ["get", "type"], 1], "symbolizers": []},
+        ]})
+        a, b, c = [rule.filter for rule in model.loads(text).rules]
+        self.assertIs(a, c)
+        self.assertIsInstance(a, model.Expression)
+        self.assertEqual(a.operator, "==")
+        # 1 and 1.0 are equal, but they are written differently
+        self.assertIsNot(a, b)
+        self.assertIs(type(b[2]), float)
+        self.assertIs(a[1], b[1])
+
+    def test_decoding(self):
+        # values are interned while parsing, giving the same model as styleFromDict
+        text = json.dumps({"name": "style", "rules": [
+            {"name": "a", "filter": ["In", ["PropertyName", "v"], 1, 1.0, True, None, []],
+             "symbolizers": [{"kind": "Fill", "graphicFill": [
+                 {"kind": "Mark", "size": [{"a": [1]}, ["Add", 1, 2]]}, "x"]}],
+             "scaleDenominator": {"min": 1, "max": 2.5}},
+            {"name": "b", "filter": ["In", ["PropertyName", "v"], 1, 1.0, True, None, []],
+             "symbolizers": [{"kind": "Other", "size": ["Add", 1, 2]}]},
+        ]})
+        style, expected = model.loads(text), model.styleFromDict(json.loads(text))
+
+        def types(obj):
+            if isinstance(obj, dict):
+                return type(obj), {k: types(v) for k, v in obj.items()}
+            if isinstance(obj, list):
+                return type(obj), [types(item) for item in obj]
+            return type(obj)
+
+        self.assertEqual(style, expected)
+        self.assertEqual(types(style), types(expected))
+        a, b = style.rules
+        self.assertIs(a.filter, b.filter)
+        self.assertIs(a.symbolizers[0].graphicFill[0].size[1], b.symbolizers[0].size)
+        self.assertIs(type(a.symbolizers[0].graphicFill[0]), model.MarkSymbolizer)
+        self.assertIs(type(b.symbolizers[0]), model.Symbolizer)
+        self.assertEqual(model.loads('{"name": "style", "rules": []}').rules, [])
+
+    def test_conversions(self):
+        style = model.loads(self.text)
+        for convert in [sld.fromgeostyler.convert, mapboxgl.fromgeostyler.convert,
+                        mapserver.fromgeostyler.convert]:
+            self.assertEqual(convert(style), convert(json.loads(self.text)))
+
+    def test_memory(self):
+        text = json.dumps(synthetic.geostylerStyle(2000))
+
+        def retained(loads):
+            gc.collect()
+            tracemalloc.start()
+            try:
+                style = loads(text)
+                return tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+
+        self.assertLess(retained(model.loads), retained(json.loads) * 0.7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import context
+
+from bridgestyle import profiling
+from bridgestyle import synthetic
+from bridgestyle import sld, mapboxgl, mapserver
+
+# tracing allocations makes conversions slow, so the style is small, but
+# large enough for the memory per rule to be the same as for larger styles
+RULES = 300
+
+# peak memory allocated by a conversion, in bytes per rule of a synthetic
+# style with two symbolizers per rule. About 1.5 times the current figures
+BUDGETS = {
+    "sld.fromgeostyler": 16000,
+    "mapboxgl.fromgeostyler": 26000,
+    "mapserver.fromgeostyler": 4500,
+}
+
+
+class MemoryBudgetTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.style = synthetic.geostylerStyle(RULES, seed=1)
+
+    def _assertWithinBudget(self, module):
+        name = module.__name__.replace("bridgestyle.", "", 1)
+        with profiling.profile(trace=False, memory=True) as p:
+            module.convert(self.style)
+        perRule = p.functionStats()[name + ".convert"]["peakMemory"] / RULES
+        self.assertLessEqual(perRule, BUDGETS[name],
+                             "%s uses %i bytes per rule" % (name, perRule))
+
+    def test_sld(self):
+        self._assertWithinBudget(sld.fromgeostyler)
+
+    def test_mapbox(self):
+        self._assertWithinBudget(mapboxgl.fromgeostyler)
+
+    def test_mapserver(self):
+        self._assertWithinBudget(mapserver.fromgeostyler)
+
+
+if __name__ == '__main__':
+    unittest.main()
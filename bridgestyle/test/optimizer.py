@@ -0,0 +1,153 @@
+import copy
+import json
+import sys
+import unittest
+import context
+
+from bridgestyle import sld, mapboxgl, mapserver
+from bridgestyle import profiling
+from bridgestyle import synthetic
+from bridgestyle.geostyler import model
+from bridgestyle.geostyler.optimizer import optimize, optimizeExpression
+
+
+def _equal(name, value):
+    return ["PropertyIsEqualTo", ["PropertyName", name], value]
+
+
+def _style(ruleFilter, width=1):
+    return {"name": "style", "rules": [
+        {"name": "rule", "filter": ruleFilter,
+         "symbolizers": [{"kind": "Line", "color": "#ff0000", "width": width,
+                          "opacity": 1.0, "Z": 0}]}]}
+
+
+class OptimizerTest(unittest.TestCase):
+
+    def test_folding(self):
+        self.assertEqual(optimizeExpression(["Mul", 3.5, ["Add", 1, 2]]), 10.5)
+        self.assertEqual(optimizeExpression(["Sub", 0, 5]), -5)
+        self.assertIs(type(optimizeExpression(["Add", 1, 2])), int)
+        exp = ["Mul", ["Div", 10, 4], ["PropertyName", "width"]]
+        self.assertEqual(optimizeExpression(exp), ["Mul", 2.5, ["PropertyName", "width"]])
+        # not folded
+        for exp in (["Div", 1, 0], ["Add", True, 1], ["Add", "1", 2]):
+            self.assertIs(optimizeExpression(exp), exp)
+
+    def test_identities(self):
+        width = ["PropertyName", "width"]
+        for exp in (["Mul", width, 1], ["Mul", 1.0, width], ["Div", width, 1],
+                    ["Add", 0, width], ["Sub", width, 0], ["Mul", ["Add", width, 0], 1]):
+            self.assertEqual(optimizeExpression(exp), width)
+        for exp in (["Sub", 0, width], ["Div", 1, width], ["Mul", "5", 1]):
+            self.assertIs(optimizeExpression(exp), exp)
+
+    def test_logical(self):
+        a, b, c = _equal("a", 1), _equal("b", "x"), _equal("c", 2.5)
+        self.assertEqual(optimizeExpression(["Or", ["Or", ["Or", a, b], c], a]),
+                         ["Or", a, b, c])
+        self.assertEqual(optimizeExpression(["And", a, ["And", b, ["Or", c, a]]]),
+                         ["And", a, b, ["Or", c, a]])
+        self.assertEqual(optimizeExpression(["And", a, copy.deepcopy(a)]), a)
+        # constant comparisons
+        self.assertIs(optimizeExpression(["And", a, ["PropertyIsLessThan", 2, 1]]), False)
+        self.assertEqual(optimizeExpression(["And", a, ["Not", ["PropertyIsEqualTo", "x", "y"]]]), a)
+        self.assertIs(optimizeExpression(["Or", ["PropertyIsEqualTo", 1, 1.0], b]), True)
+        exp = ["PropertyIsLessThan", "a", "b"]
+        self.assertIs(optimizeExpression(exp), exp)
+
+    def test_ranges(self):
+        values = (4, 1, 2, 3, 9, 11, 10, 6, 7)
+        exp = ["Or"] + [_equal("type", v) for v in values] + [_equal("name", 5)]
+        self.assertIs(optimizeExpression(exp), exp)
+
+        def between(low, high):
+            return ["And", ["PropertyIsGreaterThanOrEqualTo", ["PropertyName", "type"], low],
+                    ["PropertyIsLessThanOrEqualTo", ["PropertyName", "type"], high]]
+
+        self.assertEqual(optimizeExpression(exp, integerProperties=["type"]), [
+            "Or", between(1, 4), between(9, 11), _equal("type", 6), _equal("type", 7),
+            _equal("name", 5)])
+
+    def test_deep(self):
+        # expressions are simplified without recursion, at any depth
+        depth = sys.getrecursionlimit() * 3
+        width = ["PropertyName", "w"]
+        negated = True
+        mixed = _equal("a", 0)
+        for i in range(depth):
+            width = ["Add", ["Mul", width, 1], 0]
+            negated = ["Not", negated]
+            mixed = [("And", "Or")[i % 2], mixed, _equal("a", i + 1)]
+        self.assertEqual(optimizeExpression(width), ["PropertyName", "w"])
+        self.assertIs(optimizeExpression(negated), depth % 2 == 0)
+        self.assertIs(optimizeExpression(mixed), mixed)
+        # large operands are not compared to remove repeated ones
+        self.assertEqual(optimizeExpression(["Or", ["Not", mixed], ["Not", mixed]]),
+                         ["Or", ["Not", mixed], ["Not", mixed]])
+
+    def test_unchanged(self):
+        style = synthetic.categorizedStyle(10)
+        original = copy.deepcopy(style)
+        optimized, stats = optimize(style)
+        self.assertIs(optimized, style)
+        self.assertEqual(stats.expressions, 0)
+        style = _style(["Or", ["Or", _equal("a", 1), _equal("a", 2)], _equal("a", 1)],
+                       ["Mul", ["PropertyName", "w"], ["Div", 2, 2]])
+        original = copy.deepcopy(style)
+        optimized, stats = optimize(style)
+        self.assertEqual(style, original)
+        self.assertEqual(optimized["rules"][0]["filter"], ["Or", _equal("a", 1), _equal("a", 2)])
+        self.assertEqual(optimized["rules"][0]["symbolizers"][0]["width"], ["PropertyName", "w"])
+
+    def test_stats(self):
+        style = _style(["Or", ["Or", _equal("a", 1), _equal("a", 2)], _equal("a", 1)],
+                       ["Mul", 2, ["Sub", 3, 1]])
+        stats = optimize(style)[1]
+        self.assertEqual(stats.asDict(), {
+            "expressions": 2, "nodesBefore": 11 + 5, "nodesAfter": 7 + 1,
+            "folded": 2, "identities": 0, "flattened": 1, "duplicates": 1, "ranges": 0,
+            "saved": 8})
+        with profiling.profile(trace=False) as p:
+            sld.fromgeostyler.convert(style)
+            mapserver.fromgeostyler.convert(style)
+        self.assertEqual(p.optimizationStats()["saved"], 16)
+
+    def test_conversions(self):
+        nested = ["And", ["And", _equal("a", 1), _equal("b", 2)], _equal("c", 3)]
+        style = _style(nested, ["Mul", ["PropertyName", "w"], 1])
+        self.assertEqual(json.loads(mapboxgl.fromgeostyler.convert(style)[0])["layers"][0]["filter"],
+                         ["all", ["==", ["get", "a"], 1], ["==", ["get", "b"], 2],
+                          ["==", ["get", "c"], 3]])
+        mapfile = mapserver.fromgeostyler.convert(style)[0]
+        self.assertIn('EXPRESSION (("[a]" = 1) AND ("[b]" = 2) AND ("[c]" = 3))', mapfile)
+        self.assertIn('WIDTH "[w]"', mapfile)
+        sldstring = sld.fromgeostyler.convert(style)[0]
+        self.assertEqual(sldstring.count("<ogc:And>"), 1)
+        self.assertNotIn("<ogc:Mul>", sldstring)
+        # model styles are optimized the same way
+        compact = model.loads(json.dumps(style))
+        for module in [sld, mapboxgl, mapserver]:
+            self.assertEqual(module.fromgeostyler.convert(compact),
+                             module.fromgeostyler.convert(style))
+
+    def test_false_filter(self):
+        # no format has a filter for false, so the filter is written as it is
+        falseFilter = ["And", _equal("a", 1), ["PropertyIsLessThan", 2, 1]]
+        for ruleFilter in [["PropertyIsLessThan", 2, 1], falseFilter]:
+            style = _style(ruleFilter)
+            self.assertIs(optimize(style)[0], style)
+        sldstring = sld.fromgeostyler.convert(_style(["PropertyIsLessThan", 2, 1]))[0]
+        self.assertIn("<ogc:PropertyIsLessThan>", sldstring)
+        self.assertNotIn("False", sldstring)
+        mapfile = mapserver.fromgeostyler.convert(_style(falseFilter))[0]
+        self.assertIn('EXPRESSION (("[a]" = 1) AND (2 < 1))', mapfile)
+        self.assertNotIn("False", mapfile)
+        # the rule is removed when pruning
+        sldstring, warnings = sld.fromgeostyler.convert(_style(falseFilter), prune=True)
+        self.assertNotIn("<Rule>", sldstring)
+        self.assertEqual(warnings, ["Removed rule 'rule': its filter is always false"])
+
+
+if __name__ == '__main__':
+    unittest.main()
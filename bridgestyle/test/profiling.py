@@ -0,0 +1,61 @@
+import unittest
+import context
+
+from bridgestyle import profiling
+from bridgestyle import synthetic
+from bridgestyle import sld
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def test_counts_calls(self):
+        style = synthetic.geostylerStyle(20, symbolizersPerRule=2)
+        with profiling.profile() as p:
+            sld.fromgeostyler.convert(style)
+        stats = p.functionStats()
+        self.assertEqual(stats["sld.fromgeostyler.convert"]["calls"], 1)
+        self.assertEqual(stats["sld.fromgeostyler.processRuleInfo"]["calls"], 20)
+        self.assertEqual(stats["sld.fromgeostyler._createSymbolizer"]["calls"], 40)
+        convert = stats["sld.fromgeostyler.convert"]
+        self.assertLessEqual(convert["ownTime"], convert["totalTime"])
+
+    def test_functions_are_restored(self):
+        original = sld.fromgeostyler.convertExpression
+        with profiling.profile():
+            self.assertIsNot(sld.fromgeostyler.convertExpression, original)
+            self.assertTrue(profiling.isActive())
+        self.assertIs(sld.fromgeostyler.convertExpression, original)
+        self.assertFalse(profiling.isActive())
+
+    def test_chrome_trace(self):
+        with profiling.profile() as p:
+            sld.fromgeostyler.convert(synthetic.geostylerStyle(5))
+        events = p.chromeTrace()["traceEvents"]
+        self.assertTrue(events)
+        for event in events:
+            self.assertEqual(event["ph"], "X")
+            self.assertGreaterEqual(event["dur"], 0)
+        self.assertIn("sld.fromgeostyler.convert", [e["name"] for e in events])
+
+    def test_memory(self):
+        style = synthetic.geostylerStyle(50)
+        with profiling.profile(memory=True) as p:
+            sld.fromgeostyler.convert(style)
+        stats = p.functionStats()
+        convert = stats["sld.fromgeostyler.convert"]
+        finish = stats["sld.fromgeostyler.finish"]
+        self.assertGreater(convert["peakMemory"], 0)
+        self.assertGreaterEqual(convert["peakMemory"], finish["peakMemory"])
+        self.assertGreaterEqual(convert["peakMemory"], convert["retainedMemory"])
+        self.assertNotIn("peakMemory", stats["sld.fromgeostyler.processRuleInfo"])
+        self.assertIn("sld.fromgeostyler", p.formatMemory())
+
+    def test_only_one_active_profile(self):
+        with profiling.profile():
+            with self.assertRaises(RuntimeError):
+                with profiling.profile():
+                    pass
+
+
+if __name__ == '__main__':
+    unittest.main()
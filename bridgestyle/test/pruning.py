@@ -0,0 +1,112 @@
+import json
+import unittest
+import context
+
+from bridgestyle import sld, mapboxgl, mapserver
+from bridgestyle import fanout
+from bridgestyle.geostyler.pruning import prune
+
+
+def _line(**kwargs):
+    sl = {"kind": "Line", "color": "#ff0000", "width": 1, "opacity": 1.0, "Z": 0}
+    sl.update(kwargs)
+    return sl
+
+
+def _rule(name, symbolizers, **kwargs):
+    rule = {"name": name, "symbolizers": symbolizers}
+    rule.update(kwargs)
+    return rule
+
+
+class PruningTest(unittest.TestCase):
+
+    def test_rules(self):
+        style = {"name": "style", "rules": [
+            _rule("visible", [_line()]),
+            _rule("inverted", [_line()], scaleDenominator={"min": 50000, "max": 1000}),
+            _rule("false", [_line()], filter=False),
+            _rule("transparent", [_line(opacity=0)]),
+            _rule("empty", []),
+        ]}
+        pruned, warnings = prune(style)
+        self.assertEqual([rule["name"] for rule in pruned["rules"]], ["visible"])
+        self.assertEqual(len(style["rules"]), 5)
+        self.assertEqual(warnings, [
+            "Removed rule 'inverted': its scale range is empty (min 50000 >= max 1000)",
+            "Removed rule 'false': its filter is always false",
+            "Removed Line symbolizer from rule 'transparent': its opacity is 0",
+            "Removed rule 'transparent': it draws nothing",
+            "Removed rule 'empty': it draws nothing"])
+        unchanged = {"name": "style", "rules": [_rule("visible", [_line()])]}
+        self.assertEqual(prune(unchanged), (unchanged, []))
+
+    def test_else(self):
+        # rules that draw nothing still keep features from the ELSE rule, so
+        # they keep their symbolizers, since SLD and Mapbox GL write a Rule
+        # or layer for each one
+        style = {"name": "style", "rules": [
+            _rule("empty", [{"kind": "Fill", "opacity": 1.0}],
+                  filter=["PropertyIsEqualTo", ["PropertyName", "a"], 1]),
+            _rule("other", [_line()], filter="ELSE"),
+        ]}
+        self.assertEqual(prune(style), (style, []))
+        style["rules"].append(_rule("false", [_line()], filter=False))
+        pruned, warnings = prune(style)
+        self.assertEqual(pruned["rules"], style["rules"][:2])
+        self.assertEqual(warnings, ["Removed rule 'false': its filter is always false"])
+
+    def test_else_conversions(self):
+        hidden = ["PropertyIsEqualTo", ["PropertyName", "a"], 1]
+        style = {"name": "style", "rules": [
+            _rule("hidden", [{"kind": "Fill", "color": "#ff0000", "opacity": 0, "Z": 0}],
+                  filter=hidden),
+            _rule("other", [_line()], filter="ELSE"),
+        ]}
+        sldstring = sld.fromgeostyler.convert(style, prune=True)[0]
+        self.assertIn("<Name>hidden, Z=0</Name>", sldstring)
+        self.assertIn("<ogc:PropertyName>a</ogc:PropertyName>", sldstring)
+        layers = json.loads(mapboxgl.fromgeostyler.convert(style, prune=True)[0])["layers"]
+        self.assertEqual(["hidden" in layer["id"] for layer in layers], [True, False])
+        self.assertEqual(layers[0]["filter"], ["==", ["get", "a"], 1])
+
+    def test_symbolizers(self):
+        fill = {"kind": "Fill", "color": "#00ff00", "fillOpacity": 1.0, "opacity": 1.0}
+        marks = [{"kind": "Mark", "color": "#000000", "fillOpacity": 0, "strokeOpacity": 0},
+                 {"kind": "Mark", "wellKnownName": "circle", "fillOpacity": 1.0}]
+        symbolizers = [fill, dict(fill), _line(opacity=0.5), _line(opacity=0.5),
+                       {"kind": "Fill", "color": "#00ff00", "fillOpacity": 0},
+                       {"kind": "Text", "color": "#000000"}, {"kind": "Icon"},
+                       _line(color=None, opacity=["PropertyName", "o"])] + marks
+        pruned, warnings = prune({"name": "style", "rules": [_rule("rule", symbolizers)]})
+        self.assertEqual(pruned["rules"][0]["symbolizers"],
+                         [fill, _line(opacity=0.5), _line(opacity=0.5),
+                          _line(color=None, opacity=["PropertyName", "o"]), marks[1]])
+        self.assertEqual(len(warnings), 5)
+        self.assertIn("Removed Fill symbolizer from rule 'rule': it is repeated", warnings)
+
+    def test_conversions(self):
+        style = {"name": "style", "rules": [
+            _rule("visible", [_line()]),
+            _rule("inverted", [_line()], scaleDenominator={"min": 5000, "max": 1000}),
+            _rule("false", [_line()],
+                  filter=["And", ["PropertyIsEqualTo", ["PropertyName", "a"], 1],
+                          ["PropertyIsGreaterThan", 1, 2]]),
+        ]}
+        for module in [sld, mapboxgl, mapserver]:
+            result = module.fromgeostyler.convert(style, prune=True)
+            self.assertEqual(len(result[-1]), 2)
+            self.assertNotIn("inverted", result[0])
+            self.assertNotIn("false", result[0])
+            # styles are only pruned when asked to
+            result = module.fromgeostyler.convert(style)
+            self.assertEqual(result[-1], [])
+            self.assertIn("inverted", result[0])
+        results = fanout.convert(style, ["sld", "mapbox", "mapserver"], prune=True)
+        for target, module in [("sld", sld), ("mapbox", mapboxgl), ("mapserver", mapserver)]:
+            self.assertEqual(results[target], module.fromgeostyler.convert(style, prune=True))
+        self.assertEqual(fanout.convert(style, ["sld"])["sld"], sld.fromgeostyler.convert(style))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import unittest
+import context
+
+from bridgestyle import sld, mapboxgl
+from bridgestyle import synthetic
+from bridgestyle.geostyler import model
+from bridgestyle.geostyler.rules import scaleToZoom, zoomToScale
+from bridgestyle.geostyler.scaleindex import ScaleIndex
+
+
+def _rule(name, minScale=None, maxScale=None):
+    rule = {"name": name,
+            "symbolizers": [{"kind": "Line", "color": "#ff0000", "width": 1, "Z": 0}]}
+    scale = {}
+    if minScale is not None:
+        scale["min"] = minScale
+    if maxScale is not None:
+        scale["max"] = maxScale
+    if scale:
+        rule["scaleDenominator"] = scale
+    return rule
+
+
+def _active(rule, scale):
+    scale_ = rule.get("scaleDenominator", {})
+    return scale_.get("min", 0) <= scale < scale_.get("max", float("inf"))
+
+
+class ScaleIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.style = {"name": "style", "rules": [
+            _rule("all"), _rule("large", 10000), _rule("small", maxScale=10000),
+            _rule("middle", 5000, 50000), _rule("empty", 5000, 5000),
+            _rule("inverted", 50000, 5000), _rule("other", 1000, 20000)]}
+        self.index = ScaleIndex(self.style)
+
+    def test_at(self):
+        self.assertEqual(self.index.breakpoints, [1000, 5000, 10000, 20000, 50000])
+        names = lambda scale: [r["name"] for r in self.index.rulesAt(scale)]
+        self.assertEqual(names(500), ["all", "small"])
+        self.assertEqual(names(5000), ["all", "small", "middle", "other"])
+        self.assertEqual(names(10000), ["all", "large", "middle", "other"])
+        self.assertEqual(names(50000), ["all", "large"])
+
+    def test_between(self):
+        names = lambda a, b: [self.style["rules"][i]["name"]
+                              for i in self.index.indicesBetween(a, b)]
+        self.assertEqual(names(None, 1000), ["all", "small"])
+        self.assertEqual(names(20000, 60000), ["all", "large", "middle"])
+        self.assertEqual(names(100, 1001), ["all", "small", "other"])
+        self.assertEqual(names(None, None), ["all", "large", "small", "middle", "other"])
+        self.assertEqual(names(2000, 2000), [])
+
+    def test_synthetic(self):
+        style = synthetic.geostylerStyle(500, seed=1)
+        index = ScaleIndex(style)
+        for scale in [0, 999, 1000, 5000, 20000, 60000, 10 ** 7]:
+            self.assertEqual(index.rulesAt(scale),
+                             [r for r in style["rules"] if _active(r, scale)])
+
+    def test_split(self):
+        styles = self.index.split()
+        self.assertEqual([(a, b) for a, b, s in styles],
+                         [(None, 1000), (1000, 5000), (5000, 10000), (10000, 20000),
+                          (20000, 50000), (50000, None)])
+        self.assertEqual([r["name"] for r in styles[1][2]["rules"]], ["all", "small", "other"])
+        self.assertEqual(styles[1][2]["name"], "style")
+        # the style is not modified
+        self.assertEqual(len(self.style["rules"]), 7)
+
+    def test_zoom(self):
+        self.assertAlmostEqual(scaleToZoom(zoomToScale(12.5)), 12.5)
+        styles = self.index.splitByZoom([0, 14, 16, 24])
+        self.assertEqual([(a, b) for a, b, s in styles], [(0, 14), (14, 16), (16, 24)])
+        self.assertEqual([[r["name"] for r in s["rules"]] for a, b, s in styles],
+                         [["all", "large", "middle", "other"],
+                          ["all", "large", "small", "middle", "other"],
+                          ["all", "small", "other"]])
+        # each style can be converted
+        for a, b, style in styles:
+            self.assertEqual(len(json.loads(mapboxgl.fromgeostyler.convert(style)[0])["layers"]),
+                             len(style["rules"]))
+            sld.fromgeostyler.convert(style)
+
+    def test_model(self):
+        compact = model.loads(json.dumps(self.style))
+        index = ScaleIndex(compact)
+        self.assertEqual(index.indicesAt(5000), self.index.indicesAt(5000))
+        self.assertIsInstance(index.subStyle(1000, 2000), model.Style)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import unittest
+import context
+
+from bridgestyle import sld, mapboxgl, mapserver
+from bridgestyle import synthetic
+from bridgestyle.arcgis import togeostyler
+from bridgestyle.geostyler.legacy import lower, lowerExpression
+
+
+def _equal(name, value):
+    return ["PropertyIsEqualTo", ["PropertyName", name], value]
+
+
+def _style(ruleFilter):
+    return {"name": "style", "rules": [
+        {"name": "rule", "filter": ruleFilter,
+         "symbolizers": [{"kind": "Line", "color": "#ff0000", "width": 1,
+                          "opacity": 1.0, "Z": 0}]}]}
+
+
+class SetMembershipTest(unittest.TestCase):
+
+    def test_arcgis(self):
+        document = synthetic.lyrxDocument(5, nfields=1, orLength=3)
+        geostyler = togeostyler.convert(document)[0]
+        ruleFilter = geostyler["rules"][0]["filter"]
+        self.assertEqual(ruleFilter[0], "In")
+        self.assertEqual(len(ruleFilter), 2 + 3)
+        legacy = togeostyler.convert(document, legacy=True)[0]
+        self.assertEqual(legacy, lower(geostyler))
+        self.assertEqual(legacy["rules"][0]["filter"],
+                         ["Or", ["Or", _equal(ruleFilter[1][1], ruleFilter[2]),
+                                 _equal(ruleFilter[1][1], ruleFilter[3])],
+                          _equal(ruleFilter[1][1], ruleFilter[4])])
+        # several fields
+        document = synthetic.lyrxDocument(5, nfields=2, orLength=3)
+        ruleFilter = togeostyler.convert(document)[0]["rules"][0]["filter"]
+        self.assertEqual(ruleFilter[0], "Or")
+        self.assertEqual(len(ruleFilter), 1 + 3)
+        self.assertEqual([op[0] for op in ruleFilter[1:]], ["And"] * 3)
+
+    def test_lowering(self):
+        a, b, c = _equal("a", 1), _equal("b", 2), _equal("c", 3)
+        self.assertEqual(lowerExpression(["And", a, b, c]), ["And", ["And", a, b], c])
+        self.assertEqual(lowerExpression(["Not", ["In", ["PropertyName", "a"], 1, 2]]),
+                         ["Not", ["Or", _equal("a", 1), _equal("a", 2)]])
+        self.assertEqual(lowerExpression(["In", ["PropertyName", "a"], 1]), a)
+        style = _style(["Or", a, b, c])
+        style["rules"][0]["symbolizers"][0]["width"] = ["Add", ["PropertyName", "w"], 1]
+        self.assertEqual(lower(style)["rules"][0]["symbolizers"],
+                         style["rules"][0]["symbolizers"])
+        self.assertEqual(style["rules"][0]["filter"], ["Or", a, b, c])
+
+    def test_conversions(self):
+        style = _style(["Not", ["In", ["PropertyName", "type"], "a", "b", "c"]])
+        mapbox = json.loads(mapboxgl.fromgeostyler.convert(style)[0])
+        self.assertEqual(mapbox["layers"][0]["filter"],
+                         ["!", ["match", ["get", "type"], ["a", "b", "c"], True, False]])
+        mapfile = mapserver.fromgeostyler.convert(style)[0]
+        self.assertIn('EXPRESSION !(("[type]" IN "a,b,c"))', mapfile)
+        sldstring = sld.fromgeostyler.convert(style)[0]
+        self.assertEqual(sldstring.count("<ogc:PropertyIsEqualTo>"), 3)
+        self.assertEqual(sldstring.count("<ogc:Or>"), 1)
+        # values that can not be written as a list in a mapfile
+        style = _style(["In", ["PropertyName", "type"], "a,b", 2.5])
+        mapfile = mapserver.fromgeostyler.convert(style)[0]
+        self.assertIn('EXPRESSION (("[type]" = "a,b") OR ("[type]" = 2.5))', mapfile)
+        mapbox = json.loads(mapboxgl.fromgeostyler.convert(style)[0])
+        self.assertEqual(mapbox["layers"][0]["filter"][0], "any")
+        # Mapbox GL only takes integer numbers as match labels
+        style = _style(["In", ["PropertyName", "v"], 1.5, 2.5, 3])
+        mapbox = json.loads(mapboxgl.fromgeostyler.convert(style)[0])
+        self.assertEqual(mapbox["layers"][0]["filter"],
+                         ["any"] + [["==", ["get", "v"], v] for v in (1.5, 2.5, 3)])
+        style = _style(["In", ["PropertyName", "v"], 1, 2.0, 3])
+        mapbox = json.loads(mapboxgl.fromgeostyler.convert(style)[0])
+        self.assertEqual(mapbox["layers"][0]["filter"][0], "match")
+        # the legacy form converts to the same SLD
+        style = _style(["In", ["PropertyName", "type"]] + ["v%i" % i for i in range(100)])
+        self.assertEqual(sld.fromgeostyler.convert(style),
+                         sld.fromgeostyler.convert(lower(style)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import context
+
+from bridgestyle import synthetic
+from bridgestyle.geostyler import evaluator
+from bridgestyle.sql import fromgeostyler
+
+_DATA = os.path.join(os.path.dirname(__file__), "data", "qgis")
+
+
+def _prop(name):
+    return ["PropertyName", name]
+
+
+def _rule(name, ruleFilter):
+    return {"name": name, "filter": ruleFilter,
+            "symbolizers": [{"kind": "Mark", "color": "#ff0000", "Z": 0}]}
+
+
+class SqlFiltersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        # views are created in a copy of the test layers
+        for name in ["points", "line"]:
+            shutil.copy(os.path.join(_DATA, name, "testlayer.gpkg"),
+                        os.path.join(self.folder, name + ".gpkg"))
+        self.points = sqlite3.connect(os.path.join(self.folder, "points.gpkg"))
+        self.line = sqlite3.connect(os.path.join(self.folder, "line.gpkg"))
+
+    def tearDown(self):
+        self.points.close()
+        self.line.close()
+        shutil.rmtree(self.folder)
+
+    def _ids(self, where, params=()):
+        sql = 'SELECT "Id" FROM "points"'
+        if where is not None:
+            sql += " WHERE " + where
+        return sorted(row[0] for row in self.points.execute(sql, params))
+
+    def test_expressions(self):
+        exp = ["And", ["PropertyIsGreaterThan", _prop("Id"), 2],
+               ["In", _prop("TYPE"), "a", "b"], ["Not", ["PropertyIsLike", _prop("name"), "R%"]]]
+        self.assertEqual(fromgeostyler.convertExpression(exp), (
+            '(("Id" > ?) AND ("TYPE" IN (?, ?)) AND (NOT ("name" GLOB ?)))',
+            (2, "a", "b", "R*")))
+        self.assertEqual(fromgeostyler.convertExpression(exp, "postgresql"), (
+            '(("Id" > %s) AND ("TYPE" IN (%s, %s)) AND (NOT ("name" LIKE %s)))',
+            (2, "a", "b", "R%")))
+        self.assertEqual(fromgeostyler.convertExpression(
+            ["PropertyIsEqualTo", _prop('a"b'), "it's"], inline=True),
+            ('("a""b" = \'it\'\'s\')', ()))
+        self.assertEqual(fromgeostyler.convertExpression(
+            ["max", ["Div", _prop("a"), 2], ["strCapitalize", _prop("b")]], "postgresql"),
+            ('GREATEST((CAST("a" AS DOUBLE PRECISION) / %s), initcap("b"))', (2,)))
+        with self.assertRaises(ValueError):
+            fromgeostyler.convertExpression(exp, "oracle")
+
+    def test_rules(self):
+        style = {"name": "points", "rules": [
+            _rule("low", ["PropertyIsLessThan", _prop("Id"), 4]),
+            _rule("set", ["In", _prop("Id"), 5, 7, 9]),
+            _rule("half", ["PropertyIsGreaterThan", ["Div", _prop("Id"), 2], 5.5]),
+            _rule("other", "ELSE")]}
+        rules, warnings = fromgeostyler.convert(style)
+        self.assertEqual(warnings, [])
+        self.assertEqual([self._ids(rule["where"], rule["params"]) for rule in rules],
+                         [[1, 2, 3], [5, 7, 9], [12, 13], [4, 6, 8, 10, 11]])
+        statements, warnings = fromgeostyler.createViews(style, "points")
+        for statement in statements:
+            self.points.execute(statement)
+        self.assertEqual(self.points.execute('SELECT count(*) FROM "points_3"').fetchone(), (5,))
+
+    def test_strings(self):
+        label = _prop("text")  # "labeltext"
+        expressions = [
+            ["PropertyIsLike", label, "label%"],
+            ["PropertyIsLike", label, "L_bel%"],
+            ["PropertyIsEqualTo", ["strToUpper", label], "LABELTEXT"],
+            ["PropertyIsEqualTo", ["strSubstr", label, 2, 4], "abel"],
+            ["PropertyIsEqualTo", ["strReplace", label, "text", "s"], "labels"],
+            ["PropertyIsEqualTo", ["Concatenate", label, "-", 1], "labeltext-1"]]
+        found = []
+        for exp in expressions:
+            where, params = fromgeostyler.convertExpression(exp)
+            found.append(self.line.execute('SELECT count(*) FROM "testlayer" WHERE ' + where,
+                                           params).fetchone()[0])
+        # LIKE is case sensitive
+        self.assertEqual(found, [1, 0, 1, 1, 1, 1])
+
+    def test_unsupported(self):
+        style = {"name": "points", "rules": [
+            _rule("area", ["PropertyIsGreaterThan", ["area", _prop("geom")], 10]),
+            _rule("other", "ELSE")]}
+        rules, warnings = fromgeostyler.convert(style)
+        self.assertEqual([(rule["where"], rule["exact"]) for rule in rules],
+                         [(None, False), (None, False)])
+        self.assertEqual(len(warnings), 2)
+        self.assertEqual(fromgeostyler.createViews(style, "points")[0], [])
+
+    @unittest.skipIf(evaluator.numpy is None, "NumPy is not installed")
+    def test_evaluator(self):
+        # the rows selected for each rule are the ones the evaluator finds
+        columns = synthetic.attributeColumns(300, seed=2)
+        names = list(columns)
+        db = sqlite3.connect(":memory:")
+        db.execute("CREATE TABLE features (fid INTEGER, %s)" % ", ".join(
+            '"%s" %s' % (name, "INTEGER" if columns[name].dtype.kind == "i" else "TEXT")
+            for name in names))
+        db.executemany("INSERT INTO features VALUES (%s)" % ", ".join(["?"] * (len(names) + 1)),
+                       [[i] + [columns[name][i].item() for name in names] for i in range(300)])
+        style = synthetic.geostylerStyle(40, seed=2, expressionDepth=3)
+        matches = evaluator.RuleEvaluator(style).matches(columns)
+        rules, warnings = fromgeostyler.convert(style)
+        for rule in rules:
+            sql = "SELECT fid FROM features"
+            if rule["where"] is not None:
+                sql += " WHERE " + rule["where"]
+            selected = sorted(row[0] for row in db.execute(sql, rule["params"]))
+            self.assertEqual(selected, matches[rule["index"]].nonzero()[0].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
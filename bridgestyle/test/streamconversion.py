@@ -0,0 +1,65 @@
+import io
+import json
+import unittest
+import context
+
+from bridgestyle import stream
+
+
+def _style(name):
+    return {"name": name, "rules": [
+        {"name": "rule", "symbolizers": [{"kind": "Line", "color": "#ff0000", "width": 1,
+                                          "opacity": 1.0, "Z": 0}]}]}
+
+
+def _run(lines, **kwargs):
+    out = io.StringIO()
+    stream.convertStream(io.StringIO("".join(lines)), out, **kwargs)
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+class StreamConversionTest(unittest.TestCase):
+
+    def test_records(self):
+        lines = [json.dumps({"id": "roads", "from": "geostyler", "to": "sld",
+                             "style": json.dumps(_style("roads"))}) + "\n",
+                 "\n",
+                 json.dumps({"id": "parks", "from": "geostyler", "to": "mapbox",
+                             "style": _style("parks")}) + "\n",
+                 json.dumps({"id": "water", "from": "geostyler", "to": "sld",
+                             "style": _style("water")})]
+        results = _run(lines)
+        # one result for each record, in the same order, skipping empty lines
+        self.assertEqual([r["id"] for r in results], ["roads", "parks", "water"])
+        self.assertIn("<Name>roads</Name>", results[0]["style"])
+        self.assertEqual(json.loads(results[1]["style"])["name"], "parks")
+        self.assertTrue(all(r["warnings"] == [] for r in results))
+
+    def test_errors(self):
+        lines = ['{"id": "broken", \n',
+                 json.dumps({"id": "missing", "from": "geostyler", "to": "sld"}) + "\n",
+                 json.dumps({"id": "unknown", "from": "geostyler", "to": "xyz",
+                             "style": _style("unknown")}) + "\n",
+                 "[1, 2]\n",
+                 json.dumps({"id": "roads", "from": "geostyler", "to": "sld",
+                             "style": _style("roads")}) + "\n"]
+        results = _run(lines)
+        self.assertEqual([r["id"] for r in results], [None, "missing", "unknown", None, "roads"])
+        self.assertTrue(results[0]["error"].startswith("Line 1 is not valid JSON"))
+        self.assertIn("Missing 'style' key", results[1]["error"])
+        self.assertIn("error", results[2])
+        self.assertIn("not a JSON object", results[3]["error"])
+        # the stream goes on after the errors
+        self.assertNotIn("error", results[4])
+
+    def test_long_records(self):
+        record = json.dumps({"id": "roads", "from": "geostyler", "to": "sld",
+                             "style": _style("roads")}) + "\n"
+        results = _run(["x" * 2 * len(record) + "\n", record], maxRecordSize=len(record))
+        self.assertEqual(results[0], {"id": None,
+                                      "error": "Line 1 is longer than the maximum record size"})
+        self.assertEqual(results[1]["id"], "roads")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+import context
+
+from bridgestyle import synthetic
+from bridgestyle import sld, mapboxgl, mapserver
+from bridgestyle.arcgis import togeostyler
+
+
+class SyntheticStyleTest(unittest.TestCase):
+
+    def test_same_seed_same_style(self):
+        self.assertEqual(synthetic.geostylerStyle(50, seed=3), synthetic.geostylerStyle(50, seed=3))
+        self.assertNotEqual(synthetic.geostylerStyle(50, seed=3), synthetic.geostylerStyle(50, seed=4))
+        self.assertEqual(synthetic.lyrxDocument(50, seed=3), synthetic.lyrxDocument(50, seed=3))
+
+    def test_shape(self):
+        style = synthetic.geostylerStyle(20, symbolizersPerRule=3, expressionDepth=1, orLength=4)
+        self.assertEqual(len(style["rules"]), 20)
+        rule = style["rules"][0]
+        self.assertEqual(len(rule["symbolizers"]), 3)
+        self.assertEqual(rule["filter"][0], "Or")
+        self.assertEqual(rule["filter"][1][1][0], "Or")
+        self.assertEqual(style["rules"][-1]["filter"], "ELSE")
+
+    def test_styles_can_be_converted(self):
+        style = synthetic.geostylerStyle(100, expressionDepth=3, orLength=3)
+        for module in [sld.fromgeostyler, mapboxgl.fromgeostyler, mapserver.fromgeostyler]:
+            self.assertEqual(module.convert(style)[-1], [])
+        geostyler, icons, warnings = togeostyler.convert(synthetic.lyrxDocument(100, nfields=2))
+        self.assertEqual(len(geostyler["rules"]), 100)
+        self.assertEqual(warnings, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
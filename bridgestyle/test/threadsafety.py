@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import context
+
+from bridgestyle import sld, mapboxgl, mapserver
+from bridgestyle.arcgis import togeostyler
+
+arcgis_folder = os.path.join(os.path.dirname(__file__), "data", "arcgis")
+
+THREADS = 32
+
+
+def _style(i):
+    # each style produces a different number of warnings and symbols, so
+    # state leaking between conversions shows up in the results
+    rules = []
+    for j in range(i % 5 + 1):
+        rules.append({
+            "name": "rule%i_%i" % (i, j),
+            "filter": ["PropertyIsEqualTo", ["unsupported%i" % j, ["PropertyName", "a"]], j],
+            "symbolizers": [
+                {"kind": "Icon", "image": "icon%i_%i.png" % (i, j), "size": 10,
+                 "opacity": 1.0, "rotate": 0, "Z": j},
+                {"kind": "Line", "color": "#000000", "width": j + 1, "opacity": 1.0, "Z": 0},
+            ],
+        })
+    return {"name": "style%i" % i, "rules": rules}
+
+
+def _convert(task):
+    converter, obj = task
+    try:
+        return converter.convert(obj)
+    except Exception as e:
+        return repr(e)
+
+
+class ThreadSafetyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.switchInterval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switchInterval)
+
+    def _assertSameAsSerial(self, tasks):
+        expected = [_convert(task) for task in tasks]
+        with ThreadPoolExecutor(THREADS) as executor:
+            for i in range(5):
+                results = list(executor.map(_convert, tasks))
+                self.assertEqual(results, expected)
+
+    def test_fromgeostyler(self):
+        converters = [sld.fromgeostyler, mapboxgl.fromgeostyler, mapserver.fromgeostyler]
+        tasks = [(converter, _style(i)) for i in range(THREADS) for converter in converters]
+        self._assertSameAsSerial(tasks)
+
+    def test_arcgis_togeostyler(self):
+        tasks = []
+        for filename in sorted(os.listdir(arcgis_folder)):
+            with open(os.path.join(arcgis_folder, filename)) as f:
+                arcgis = json.load(f)
+            # embedded icons are written to a new temp folder each time
+            if "base64" not in json.dumps(arcgis):
+                tasks.append((togeostyler, arcgis))
+        self._assertSameAsSerial(tasks * 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
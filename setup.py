@@ -11,5 +11,14 @@ setup(
     keywords="GeoCat",
     url="",
     packages=["bridgestyle"],
-    entry_points={"console_scripts": ["style2style=bridgestyle.style2style:main"]},
+    extras_require={
+        # filter evaluation (geostyler.evaluator, sql.classification)
+        "numpy": ["numpy"],
+    },
+    entry_points={
+        "console_scripts": [
+            "style2style=bridgestyle.style2style:main",
+            "bridgestyle-service=bridgestyle.service:main",
+        ]
+    },
 )